@@ -0,0 +1,62 @@
+"""Hash blacklisted tokens and store their expiry
+
+Revision ID: b41e9a07c5d2
+Revises: 7d2f4c1a9b3e
+Create Date: 2026-10-18 14:32:47.102934
+
+"""
+import datetime
+import hashlib
+from typing import Sequence, Union
+
+import jwt
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41e9a07c5d2'
+down_revision: Union[str, None] = '7d2f4c1a9b3e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('blacklisted_tokens', sa.Column('token_hash', sa.String(length=64), nullable=True))
+    op.add_column('blacklisted_tokens', sa.Column('expires_at', sa.DateTime(), nullable=True))
+
+    # Replace raw tokens with their SHA-256 digest and unverified `exp` claim
+    connection = op.get_bind()
+    rows = connection.execute(sa.text('SELECT id, token FROM blacklisted_tokens')).all()
+    seen = set()
+    for row_id, token in rows:
+        digest = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        if digest in seen:
+            connection.execute(sa.text('DELETE FROM blacklisted_tokens WHERE id = :id'), {'id': row_id})
+            continue
+        seen.add(digest)
+        try:
+            exp = jwt.decode(token, options={'verify_signature': False}).get('exp')
+        except jwt.InvalidTokenError:
+            exp = None
+        expires_at = datetime.datetime.fromtimestamp(exp or 0, datetime.UTC).replace(tzinfo=None)
+        connection.execute(
+            sa.text('UPDATE blacklisted_tokens SET token_hash = :digest, expires_at = :expires_at WHERE id = :id'),
+            {'digest': digest, 'expires_at': expires_at, 'id': row_id},
+        )
+
+    op.alter_column('blacklisted_tokens', 'token_hash', nullable=False)
+    op.alter_column('blacklisted_tokens', 'expires_at', nullable=False)
+    op.create_index(op.f('ix_blacklisted_tokens_token_hash'), 'blacklisted_tokens', ['token_hash'], unique=True)
+    op.create_index(op.f('ix_blacklisted_tokens_expires_at'), 'blacklisted_tokens', ['expires_at'], unique=False)
+    op.drop_column('blacklisted_tokens', 'token')
+
+
+def downgrade() -> None:
+    # Raw tokens can't be recovered from their digest, so the blacklist is emptied
+    op.execute('DELETE FROM blacklisted_tokens')
+    op.add_column('blacklisted_tokens', sa.Column('token', sa.String(length=256), nullable=False))
+    op.drop_index(op.f('ix_blacklisted_tokens_expires_at'), table_name='blacklisted_tokens')
+    op.drop_index(op.f('ix_blacklisted_tokens_token_hash'), table_name='blacklisted_tokens')
+    op.drop_column('blacklisted_tokens', 'expires_at')
+    op.drop_column('blacklisted_tokens', 'token_hash')
@@ -0,0 +1,138 @@
+import datetime
+import hashlib
+import threading
+import time
+from typing import Optional
+
+import jwt
+from sqlalchemy import select
+
+from api.models.backlisted_token import BlackListedToken
+from cache import BloomFilter, TTLCache
+from config import (
+    BLACKLIST_BLOOM_CAPACITY,
+    BLACKLIST_BLOOM_ERROR_RATE,
+    BLACKLIST_CACHE_SIZE,
+    BLACKLIST_SYNC_INTERVAL,
+    BLACKLIST_SYNC_OVERLAP,
+)
+from engine import AsyncSessionLocal
+from utils import utcnow
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def token_expiry(token: str, default: float = 3600.0) -> datetime.datetime:
+    # Naive UTC, like the rest of the DateTime columns. A token that can't be read expires right away
+    try:
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.InvalidTokenError:
+        exp = time.time()
+    if exp is None:
+        exp = time.time() + default
+    return datetime.datetime.fromtimestamp(exp, datetime.UTC).replace(tzinfo=None)
+
+
+def seconds_until(moment: datetime.datetime) -> float:
+    return (moment - datetime.datetime.now(datetime.UTC).replace(tzinfo=None)).total_seconds()
+
+
+class BlacklistCache:
+    """
+    In-process front for the `blacklisted_tokens` table.
+
+    A Bloom filter holds the digest of every blacklisted token, so the common case (a token that was never
+    blacklisted) is answered without touching the database. Possible hits are confirmed against
+    the database and positive answers are kept in a TTL-bound LRU until the token expires.
+    Rows written by other processes are picked up incrementally every `sync_interval` seconds, each sync re-reading
+    the `sync_overlap` seconds before the previous one. Ids and timestamps are assigned before the row commits,
+    so a sync can't simply continue after the last one it saw.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, cache_size: int, sync_interval: float, sync_overlap: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.sync_overlap = datetime.timedelta(seconds=sync_overlap)
+        self.hits = TTLCache(maxsize=cache_size, ttl=3600)
+        self._bloom: Optional[BloomFilter] = None
+        self._synced_from: Optional[datetime.datetime] = None
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+
+    async def load(self):
+        started = utcnow()
+        async with AsyncSessionLocal() as db:
+            digests = (await db.execute(select(BlackListedToken.token_hash))).scalars().all()
+        with self._lock:
+            bloom = BloomFilter(max(self.capacity, len(digests) * 2), self.error_rate)
+            for digest in digests:
+                bloom.add(digest)
+            self._bloom = bloom
+            self._synced_from = started
+            self._last_sync = time.monotonic()
+
+    async def _sync(self):
+        # Claim this sync window up front so concurrent requests don't all query at once
+        self._last_sync = time.monotonic()
+        started = utcnow()
+        async with AsyncSessionLocal() as db:
+            query = select(BlackListedToken.token_hash).filter(
+                BlackListedToken.blacklisted_on >= self._synced_from - self.sync_overlap
+            )
+            digests = (await db.execute(query)).scalars().all()
+        with self._lock:
+            # Rows from the overlap are usually already in the filter, adding them again changes nothing
+            for digest in digests:
+                self._bloom.add(digest)
+            self._synced_from = started
+            self._last_sync = time.monotonic()
+        if self._bloom.is_saturated:
+            # Swept rows drop out of the filter on rebuild
+            await self.load()
+
+    def add(self, digest: str, expires_at: datetime.datetime):
+        # Before the first load the row is picked up from the database anyway
+        if self._bloom is not None:
+            with self._lock:
+                self._bloom.add(digest)
+        self.remember(digest, expires_at)
+
+    async def lookup(self, digest: str) -> Optional[bool]:
+        """Answer from memory when possible, None means only the database can tell."""
+        if self._bloom is None:
+            await self.load()
+        elif time.monotonic() - self._last_sync > self.sync_interval:
+            await self._sync()
+        if not self._bloom.might_contain(digest):
+            return False
+        if self.hits.get(digest):
+            return True
+        return None
+
+    def remember(self, digest: str, expires_at: datetime.datetime):
+        self.hits.set(digest, True, ttl=seconds_until(expires_at))
+
+    async def is_blacklisted(self, token: str) -> bool:
+        digest = token_digest(token)
+        cached = await self.lookup(digest)
+        if cached is not None:
+            return cached
+        async with AsyncSessionLocal() as db:
+            query = select(BlackListedToken.expires_at).filter_by(token_hash=digest)
+            expires_at = (await db.execute(query)).scalar()
+        if expires_at is None:
+            return False
+        self.remember(digest, expires_at)
+        return True
+
+
+blacklist_cache = BlacklistCache(
+    capacity=BLACKLIST_BLOOM_CAPACITY,
+    error_rate=BLACKLIST_BLOOM_ERROR_RATE,
+    cache_size=BLACKLIST_CACHE_SIZE,
+    sync_interval=BLACKLIST_SYNC_INTERVAL,
+    sync_overlap=BLACKLIST_SYNC_OVERLAP,
+)
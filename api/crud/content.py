@@ -0,0 +1,114 @@
+from typing import Iterable, Optional
+
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.models import Image, ImageContent, ImageVariant
+from storage import StoredFile
+
+
+def upsert_insert(db: AsyncSession):
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise NotImplementedError(f"Content upserts are not supported on {dialect}")
+
+
+async def get_content_by_hash(sha256: str, db: AsyncSession) -> Optional[ImageContent]:
+    # Unreferenced content is on its way out, its file may already be gone
+    query = select(ImageContent).filter(ImageContent.sha256 == sha256, ImageContent.ref_count > 0)
+    result = await db.execute(query)
+    return result.scalars().first()
+
+
+async def acquire_content(
+    sha256: str, stored_file: Optional[StoredFile], size: int, db: AsyncSession, count: int = 1
+) -> Optional[ImageContent]:
+    """
+    Add `count` references to the content with this hash, creating it from `stored_file` when it's new.
+    Without `stored_file` only an existing, still referenced row is referenced, None means it is gone.
+    Doesn't commit, so the references land in the same transaction as the images that hold them.
+
+    The row stays locked until the caller commits. When `stored_file` is content that was already stored,
+    the caller checks afterwards that the file is still there: a concurrent delete_released_contents() may have
+    deleted it before this got the lock.
+    """
+    if stored_file is None:
+        query = (
+            update(ImageContent)
+            .filter(ImageContent.sha256 == sha256, ImageContent.ref_count > 0)
+            .values(ref_count=ImageContent.ref_count + count)
+            .returning(ImageContent)
+        )
+    else:
+        insert = upsert_insert(db)(ImageContent).values(
+            sha256=sha256, storage_key=stored_file.key, url=stored_file.url, size=size, ref_count=count
+        )
+        query = insert.on_conflict_do_update(
+            index_elements=[ImageContent.sha256],
+            set_={"ref_count": ImageContent.ref_count + count},
+        ).returning(ImageContent)
+    result = await db.scalars(query, execution_options={"populate_existing": True})
+    return result.first()
+
+
+async def release_contents(counts: dict[int, int], db: AsyncSession) -> list[int]:
+    """
+    Drop `counts[content_id]` references from each content in one statement. Returns the ids of the contents
+    nothing references anymore, for the caller to pass to delete_released_contents() after committing.
+    Doesn't commit.
+    """
+    if not counts:
+        return []
+    query = (
+        update(ImageContent)
+        .filter(ImageContent.id.in_(counts))
+        .values(ref_count=ImageContent.ref_count - case(counts, value=ImageContent.id, else_=0))
+        .returning(ImageContent.id, ImageContent.ref_count)
+    )
+    return [row.id for row in (await db.execute(query)).all() if row.ref_count <= 0]
+
+
+async def unreferenced_storage_keys(keys: Iterable[str], db: AsyncSession) -> list[str]:
+    """
+    The keys among `keys`, once each, that no content, variant or image row points to. Files are content-addressed,
+    so rows that don't share a reference count can still share a file, e.g. identical variants of two contents.
+    """
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return []
+    referenced = set()
+    for column in (ImageContent.storage_key, ImageVariant.storage_key, Image.storage_key):
+        referenced.update((await db.scalars(select(column).filter(column.in_(keys)))).all())
+    return [key for key in keys if key not in referenced]
+
+
+async def delete_released_contents(content_ids: list[int], db: AsyncSession) -> list[str]:
+    """
+    Delete the contents among `content_ids` that are still unreferenced, along with their variants, and return
+    the storage keys of their files that nothing else uses. The caller deletes the files before committing,
+    while the rows are locked: an upload of the same content that found the file meanwhile waits for the lock
+    in acquire_content(), and then finds the file gone rather than referencing it after it is deleted.
+    Doesn't commit.
+    """
+    if not content_ids:
+        return []
+    query = (
+        select(ImageContent.id, ImageContent.storage_key)
+        .filter(ImageContent.id.in_(content_ids), ImageContent.ref_count <= 0)
+        .with_for_update()
+    )
+    released = (await db.execute(query)).all()
+    if not released:
+        return []
+    content_ids = [row.id for row in released]
+    variant_keys = (
+        await db.scalars(select(ImageVariant.storage_key).filter(ImageVariant.content_id.in_(content_ids)))
+    ).all()
+    # The foreign key cascades on Postgres, deleted explicitly for databases that don't enforce it
+    await db.execute(delete(ImageVariant).filter(ImageVariant.content_id.in_(content_ids)))
+    await db.execute(delete(ImageContent).filter(ImageContent.id.in_(content_ids)))
+    return await unreferenced_storage_keys([row.storage_key for row in released] + list(variant_keys), db)
@@ -0,0 +1,60 @@
+import datetime
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.models import DirectUpload, User
+from api.models.image import FILENAME_MAX_LENGTH
+from utils import truncate_filename, utcnow
+
+
+async def create_direct_upload(
+    filename: str,
+    length: int,
+    sha256: str,
+    storage_key: Optional[str],
+    user: Optional[User],
+    ttl: float,
+    db: AsyncSession,
+) -> DirectUpload:
+    direct_upload = DirectUpload(
+        filename=truncate_filename(filename, FILENAME_MAX_LENGTH),
+        length=length,
+        sha256=sha256,
+        storage_key=storage_key,
+        user_id=user.id if user else None,
+        expires_at=utcnow() + datetime.timedelta(seconds=ttl),
+    )
+    db.add(direct_upload)
+    await db.commit()
+    await db.refresh(direct_upload)
+    return direct_upload
+
+
+async def get_direct_upload(upload_uuid: str, db: AsyncSession) -> Optional[DirectUpload]:
+    query = select(DirectUpload).filter(DirectUpload.uuid == UUID(upload_uuid))
+    result = await db.execute(query)
+    return result.scalars().first()
+
+
+async def delete_direct_upload(direct_upload_id: int, db: AsyncSession) -> bool:
+    """Doesn't commit. False when the upload was already gone, e.g. confirmed by a concurrent request."""
+    result = await db.execute(delete(DirectUpload).filter(DirectUpload.id == direct_upload_id))
+    return result.rowcount == 1
+
+
+async def delete_expired_direct_uploads(db: AsyncSession, batch_size: int = 100) -> list[tuple[str, str]]:
+    """Delete one batch of unconfirmed uploads, returns their (sha256, storage_key) so stray files can be removed."""
+    query = (
+        select(DirectUpload.id, DirectUpload.sha256, DirectUpload.storage_key)
+        .filter(DirectUpload.expires_at < utcnow())
+        .limit(batch_size)
+    )
+    rows = (await db.execute(query)).all()
+    if not rows:
+        return []
+    await db.execute(delete(DirectUpload).filter(DirectUpload.id.in_([row.id for row in rows])))
+    await db.commit()
+    return [(row.sha256, row.storage_key) for row in rows]
@@ -1,31 +1,242 @@
-from typing import Optional
+import datetime
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
 from uuid import UUID
 
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import Boolean, Row, delete, func, insert, literal, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
 
+from api.crud.content import release_contents, unreferenced_storage_keys
+from api.crud.usage import add_usage, mb_to_bytes
 from api.models import Image, User
+from api.models.image import FILENAME_MAX_LENGTH
+from metrics import stage_timer
+from utils import truncate_filename
 
 
-def get_image_by_uuid(image_uuid: str, db: Session) -> Optional[Image]:
+async def get_image_by_uuid(image_uuid: str, db: AsyncSession) -> Optional[Image]:
     query = select(Image).filter(Image.uuid == UUID(image_uuid))
-    result = db.execute(query)
+    result = await db.execute(query)
     image = result.scalars().first()
     return image
 
 
-def get_images_by_user_id(user_id: int, db: Session) -> list[Image]:
-    query = select(Image).filter(Image.user_id == user_id)
-    result = db.execute(query)
-    images = result.scalars().all()
-    return list(images)
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 
-def create_image(file_name: str, file_size, image_url: str, user: User, db: Session) -> Image:
-    image = Image(filename=file_name, file_size=file_size, url=image_url)
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    """The smallest string after every string starting with `prefix`, None when there is none."""
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10FFFF:
+            # Surrogates can't be encoded, skip past them
+            return prefix[:-1] + chr(0xE000 if 0xD800 <= last + 1 < 0xE000 else last + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+class prefix_match(FunctionElement):
+    """
+    `expr` starts with `prefix`. A LIKE, which Postgres serves from a text_pattern_ops index, and a range on
+    SQLite, whose LIKE optimization only applies to plain columns and so never uses an expression index.
+    """
+
+    type = Boolean()
+    inherit_cache = True
+    # A predicate already, without it dialects lacking a boolean type compare the result to 1
+    _is_implicitly_boolean = True
+
+    def __init__(self, expr, prefix: str):
+        # Statements are cached by structure, so a missing upper bound is left out rather than bound as NULL
+        upper = prefix_upper_bound(prefix)
+        bounds = (literal(prefix),) if upper is None else (literal(prefix), literal(upper))
+        super().__init__(expr, literal(f"{escape_like(prefix)}%"), *bounds)
+
+
+@compiles(prefix_match)
+def _compile_prefix_match(element, compiler, **kw):
+    expr, pattern, *_ = element.clauses
+    return f"{compiler.process(expr, **kw)} LIKE {compiler.process(pattern, **kw)} ESCAPE '\\'"
+
+
+@compiles(prefix_match, "sqlite")
+def _compile_prefix_match_sqlite(element, compiler, **kw):
+    expr, _, lower, *upper = element.clauses
+    expr = compiler.process(expr, **kw)
+    if not upper:
+        return f"{expr} >= {compiler.process(lower, **kw)}"
+    return f"({expr} >= {compiler.process(lower, **kw)} AND {expr} < {compiler.process(upper[0], **kw)})"
+
+
+@dataclass
+class ImageFilters:
+    """
+    Predicates for listing a user's images. Filename matches are case-insensitive, `search` anywhere in the name
+    (ix_images_filename_trgm on Postgres) and `prefix` at its start (ix_images_user_id_filename_lower).
+    Sizes are in MB like `Image.file_size`, dates are naive UTC and the ranges include both ends.
+    """
+
+    search: Optional[str] = None
+    prefix: Optional[str] = None
+    uploaded_after: Optional[datetime.datetime] = None
+    uploaded_before: Optional[datetime.datetime] = None
+    min_size: Optional[float] = None
+    max_size: Optional[float] = None
+
+    def criteria(self) -> list:
+        criteria = []
+        filename = func.lower(Image.filename)
+        if self.search:
+            criteria.append(filename.like(f"%{escape_like(self.search.lower())}%", escape="\\"))
+        if self.prefix:
+            criteria.append(prefix_match(filename, self.prefix.lower()))
+        if self.uploaded_after is not None:
+            criteria.append(Image.upload_time >= self.uploaded_after)
+        if self.uploaded_before is not None:
+            criteria.append(Image.upload_time <= self.uploaded_before)
+        if self.min_size is not None:
+            criteria.append(Image.file_size >= self.min_size)
+        if self.max_size is not None:
+            criteria.append(Image.file_size <= self.max_size)
+        return criteria
+
+
+# Everything a listing returns, selected as plain rows rather than loaded as `Image` entities
+LISTING_COLUMNS = (
+    Image.id,
+    Image.uuid,
+    Image.filename,
+    Image.file_size,
+    Image.upload_time,
+    Image.url,
+    Image.width,
+    Image.height,
+    Image.mime_type,
+    Image.content_id,
+)
+
+
+def _images_by_user_query(
+    user_id: int, after: Optional[tuple[datetime.datetime, int]] = None, filters: Optional[ImageFilters] = None
+):
+    # Newest first. Keyset on (upload_time, id) is served by ix_images_user_id_upload_time_id
+    query = (
+        select(*LISTING_COLUMNS).filter(Image.user_id == user_id).order_by(Image.upload_time.desc(), Image.id.desc())
+    )
+    if after is not None:
+        query = query.filter(tuple_(Image.upload_time, Image.id) < after)
+    if filters is not None:
+        query = query.filter(*filters.criteria())
+    return query
+
+
+async def get_images_page(
+    user_id: int,
+    db: AsyncSession,
+    limit: int,
+    after: Optional[tuple[datetime.datetime, int]] = None,
+    filters: Optional[ImageFilters] = None,
+) -> list[Row]:
+    query = _images_by_user_query(user_id, after, filters).limit(limit)
+    result = await db.execute(query)
+    return list(result.all())
+
+
+async def iter_images_by_user_id(
+    user_id: int,
+    db: AsyncSession,
+    after: Optional[tuple[datetime.datetime, int]] = None,
+    batch_size: int = 1000,
+    filters: Optional[ImageFilters] = None,
+) -> AsyncIterator[Row]:
+    # Server-side cursor: rows are fetched `batch_size` at a time instead of all at once
+    query = _images_by_user_query(user_id, after, filters).execution_options(yield_per=batch_size)
+    result = await db.stream(query)
+    async for row in result:
+        yield row
+
+
+async def create_image(
+    file_name: str,
+    file_size,
+    image_url: str,
+    user: User,
+    db: AsyncSession,
+    storage_key: Optional[str] = None,
+    content_id: Optional[int] = None,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    mime_type: Optional[str] = None,
+) -> Image:
+    image = Image(
+        filename=truncate_filename(file_name, FILENAME_MAX_LENGTH),
+        file_size=file_size,
+        url=image_url,
+        storage_key=storage_key,
+        content_id=content_id,
+        width=width,
+        height=height,
+        mime_type=mime_type,
+    )
     if user:
         image.user_id = user.id
+        await add_usage(user.id, 1, mb_to_bytes(file_size), db)
     db.add(image)
-    db.commit()
-    db.refresh(image)
+    with stage_timer("db_commit"):
+        await db.commit()
+    await db.refresh(image)
     return image
+
+
+async def create_images(images_data: list[dict], user: Optional[User], db: AsyncSession) -> list[Image]:
+    """
+    Insert many images in a single INSERT ... RETURNING and one transaction.
+    Each item holds `filename`, `file_size`, `url`, `storage_key`, `content_id`, `width`, `height` and `mime_type`,
+    the result keeps their order.
+    """
+    if not images_data:
+        return []
+    user_id = user.id if user else None
+    rows = [
+        {**image_data, "filename": truncate_filename(image_data["filename"], FILENAME_MAX_LENGTH), "user_id": user_id}
+        for image_data in images_data
+    ]
+    result = await db.scalars(insert(Image).returning(Image, sort_by_parameter_order=True), rows)
+    images = list(result.all())
+    if user_id is not None:
+        await add_usage(user_id, len(rows), sum(mb_to_bytes(row["file_size"]) for row in rows), db)
+    with stage_timer("db_commit"):
+        await db.commit()
+    return images
+
+
+async def delete_images(db: AsyncSession, *criteria) -> tuple[list[UUID], list[str], list[int]]:
+    """
+    Delete the images matching `criteria` in a single DELETE ... RETURNING, then release their content and
+    take them off their owners' usage, a few statements however many images there are.
+    Returns the deleted images' UUIDs, the storage keys of files they owned outright, which the caller deletes
+    after committing, and the ids of contents nothing references anymore (see delete_released_contents).
+    Doesn't commit.
+    """
+    query = (
+        delete(Image)
+        .filter(*criteria)
+        .returning(Image.uuid, Image.user_id, Image.file_size, Image.content_id, Image.storage_key)
+    )
+    rows = (await db.execute(query)).all()
+    # Images stored before content deduplication own their file outright
+    storage_keys = [row.storage_key for row in rows if row.content_id is None and row.storage_key]
+    storage_keys = await unreferenced_storage_keys(storage_keys, db)
+    content_ids = await release_contents(Counter(row.content_id for row in rows if row.content_id is not None), db)
+    usage: defaultdict[int, list[int]] = defaultdict(lambda: [0, 0])
+    for row in rows:
+        if row.user_id is not None:
+            usage[row.user_id][0] += 1
+            usage[row.user_id][1] += mb_to_bytes(row.file_size)
+    for user_id, (image_count, total_bytes) in usage.items():
+        await add_usage(user_id, -image_count, -total_bytes, db)
+    return [row.uuid for row in rows], storage_keys, content_ids
@@ -0,0 +1,87 @@
+import datetime
+import random
+from typing import Optional
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.models import Job
+from config import JOB_MAX_ATTEMPTS, JOB_RETRY_BACKOFF, JOB_RETRY_BACKOFF_MAX
+from utils import utcnow
+
+
+def enqueue_job(kind: str, payload: dict, db: AsyncSession, delay: float = 0) -> Job:
+    """
+    Add a job to the session without committing, so it's queued atomically with the rows it refers to.
+    """
+    job = Job(
+        kind=kind,
+        payload=payload,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        run_at=utcnow() + datetime.timedelta(seconds=delay),
+    )
+    db.add(job)
+    return job
+
+
+async def claim_jobs(db: AsyncSession, limit: int, visibility_timeout: float) -> list[Job]:
+    """
+    Lock up to `limit` due jobs for this worker until `visibility_timeout` seconds from now.
+    SKIP LOCKED lets any number of workers poll the table at once without handing out the same job twice.
+    """
+    now = utcnow()
+    abandoned = and_(Job.status == "running", Job.locked_until < now)
+    # Jobs whose last attempt never reported back aren't retried again
+    await db.execute(
+        update(Job)
+        .filter(abandoned, Job.attempts >= Job.max_attempts)
+        .values(status="failed", last_error=func.coalesce(Job.last_error, "Visibility timeout expired"))
+        .execution_options(synchronize_session=False)
+    )
+    due = (
+        select(Job.id)
+        .filter(or_(Job.status == "queued", abandoned), Job.run_at <= now, Job.attempts < Job.max_attempts)
+        .order_by(Job.run_at, Job.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    query = (
+        update(Job)
+        .filter(Job.id.in_(due.scalar_subquery()))
+        .values(
+            status="running",
+            attempts=Job.attempts + 1,
+            locked_until=now + datetime.timedelta(seconds=visibility_timeout),
+        )
+        .returning(Job)
+    )
+    jobs = list((await db.scalars(query, execution_options={"populate_existing": True})).all())
+    await db.commit()
+    return jobs
+
+
+async def complete_job(job_id: int, db: AsyncSession):
+    # Finished jobs are removed right away, the table only holds pending and failed work
+    await db.execute(delete(Job).filter(Job.id == job_id))
+    await db.commit()
+
+
+def retry_delay(attempts: int) -> float:
+    # Exponential backoff with jitter, so jobs failing together don't all come back together
+    delay = min(JOB_RETRY_BACKOFF * 2 ** (attempts - 1), JOB_RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def fail_job(job_id: int, error: str, db: AsyncSession, retry: bool = True) -> Optional[Job]:
+    job = await db.get(Job, job_id)
+    if job is None:
+        return None
+    job.last_error = error[:2000]
+    job.locked_until = None
+    if retry and job.attempts < job.max_attempts:
+        job.status = "queued"
+        job.run_at = utcnow() + datetime.timedelta(seconds=retry_delay(job.attempts))
+    else:
+        job.status = "failed"
+    await db.commit()
+    return job
@@ -1,7 +1,45 @@
+import datetime
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.blacklist import blacklist_cache, token_digest, token_expiry
 from api.models import BlackListedToken
+from engine import AsyncSessionLocal
 
 
-def add_token_to_blacklisted(token, db):
-    blacklisted_token = BlackListedToken(token=token)
+async def add_token_to_blacklisted(token: str, db: AsyncSession):
+    digest = token_digest(token)
+    expires_at = token_expiry(token)
+    blacklisted_token = BlackListedToken(token_hash=digest, expires_at=expires_at)
     db.add(blacklisted_token)
-    db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Already blacklisted by a concurrent request
+        await db.rollback()
+    blacklist_cache.add(digest, expires_at)
+
+
+async def delete_expired_tokens(db: AsyncSession, batch_size: int = 1000) -> int:
+    """
+    Remove blacklist entries for tokens that have expired and can no longer validate anyway.
+    Deletes in primary-key batches so the sweep never holds long locks on the table.
+    """
+    now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    deleted = 0
+    while True:
+        expired_ids = select(BlackListedToken.id).filter(BlackListedToken.expires_at < now).limit(batch_size)
+        result = await db.execute(
+            delete(BlackListedToken).filter(BlackListedToken.id.in_(expired_ids.scalar_subquery()))
+        )
+        await db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
+async def sweep_expired_tokens() -> int:
+    async with AsyncSessionLocal() as db:
+        return await delete_expired_tokens(db)
@@ -0,0 +1,80 @@
+import datetime
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.models import UploadChunk, UploadSession, User
+from api.models.image import FILENAME_MAX_LENGTH
+from utils import truncate_filename, utcnow
+
+
+async def create_upload_session(
+    filename: str, content_type: str, length: int, user: Optional[User], ttl: float, db: AsyncSession
+) -> UploadSession:
+    upload_session = UploadSession(
+        filename=truncate_filename(filename, FILENAME_MAX_LENGTH),
+        content_type=content_type,
+        length=length,
+        user_id=user.id if user else None,
+        expires_at=utcnow() + datetime.timedelta(seconds=ttl),
+    )
+    db.add(upload_session)
+    await db.commit()
+    await db.refresh(upload_session)
+    return upload_session
+
+
+async def get_upload_session(session_uuid: str, db: AsyncSession) -> Optional[UploadSession]:
+    query = select(UploadSession).filter(UploadSession.uuid == UUID(session_uuid))
+    result = await db.execute(query)
+    return result.scalars().first()
+
+
+async def add_upload_chunk(
+    upload_session: UploadSession, offset: int, size: int, name: str, ttl: float, db: AsyncSession
+) -> bool:
+    """
+    Record a staged chunk and move the session's offset past it. Only succeeds if the offset is still
+    where the chunk started, so of two concurrent PATCHes for the same offset exactly one is kept.
+    """
+    query = (
+        update(UploadSession)
+        .filter(UploadSession.id == upload_session.id, UploadSession.offset == offset)
+        .values(offset=offset + size, expires_at=utcnow() + datetime.timedelta(seconds=ttl))
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(query)
+    if result.rowcount != 1:
+        await db.rollback()
+        return False
+    db.add(UploadChunk(session_id=upload_session.id, offset=offset, size=size, name=name))
+    await db.commit()
+    return True
+
+
+async def get_upload_chunk_names(session_id: int, db: AsyncSession) -> list[str]:
+    query = select(UploadChunk.name).filter(UploadChunk.session_id == session_id).order_by(UploadChunk.offset)
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+
+async def delete_upload_session(session_id: int, db: AsyncSession) -> bool:
+    """Doesn't commit. False when the session was already gone, e.g. completed by a concurrent request."""
+    await db.execute(delete(UploadChunk).filter(UploadChunk.session_id == session_id))
+    result = await db.execute(delete(UploadSession).filter(UploadSession.id == session_id))
+    return result.rowcount == 1
+
+
+async def delete_expired_upload_sessions(db: AsyncSession, batch_size: int = 100) -> list[UUID]:
+    """Delete one batch of abandoned sessions, returns their UUIDs so their staged chunks can be removed."""
+    query = select(UploadSession.id, UploadSession.uuid).filter(UploadSession.expires_at < utcnow()).limit(batch_size)
+    rows = (await db.execute(query)).all()
+    if not rows:
+        return []
+    session_ids = [session_id for session_id, _ in rows]
+    await db.execute(delete(UploadChunk).filter(UploadChunk.session_id.in_(session_ids)))
+    await db.execute(delete(UploadSession).filter(UploadSession.id.in_(session_ids)))
+    await db.commit()
+    return [session_uuid for _, session_uuid in rows]
@@ -0,0 +1,91 @@
+from typing import Optional
+
+from sqlalchemy import BigInteger, cast, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.crud.content import upsert_insert
+from api.models import Image, User, UserUsage
+from engine import AsyncSessionLocal
+from utils import utcnow
+
+
+def mb_to_bytes(file_size: float) -> int:
+    # Image.file_size is in MB (1000^2 bytes), see utils.convert_bytes_to_mb
+    return round(file_size * 1000**2)
+
+
+async def get_usage(user_id: int, db: AsyncSession) -> Optional[UserUsage]:
+    return await db.get(UserUsage, user_id)
+
+
+async def add_usage(user_id: int, image_count: int, total_bytes: int, db: AsyncSession):
+    """
+    Adjust a user's counters by the given amounts (negative on deletion) with a single upsert.
+    Doesn't commit, so the counters change in the same transaction as the images.
+    """
+    insert = upsert_insert(db)(UserUsage).values(
+        user_id=user_id, image_count=max(image_count, 0), total_bytes=max(total_bytes, 0), updated_at=utcnow()
+    )
+    await db.execute(
+        insert.on_conflict_do_update(
+            index_elements=[UserUsage.user_id],
+            set_={
+                "image_count": UserUsage.image_count + image_count,
+                "total_bytes": UserUsage.total_bytes + total_bytes,
+                "updated_at": utcnow(),
+            },
+        )
+    )
+
+
+async def reconcile_usage(db: AsyncSession, batch_size: int = 500) -> int:
+    """
+    Recount every user's images and overwrite the counters, repairing any drift.
+    Works through users in id order one batch per transaction, so locks are only held briefly.
+    The counters are locked before the images are counted: add_usage() calls in flight commit first and are
+    counted, later ones wait and apply on top of the recount rather than being overwritten by it.
+    """
+    last_id = 0
+    reconciled = 0
+    while True:
+        user_ids = (
+            (await db.execute(select(User.id).filter(User.id > last_id).order_by(User.id).limit(batch_size)))
+            .scalars()
+            .all()
+        )
+        if not user_ids:
+            return reconciled
+        # Every user gets a row to lock, an add_usage() can't insert one in between
+        missing = upsert_insert(db)(UserUsage).values(
+            [{"user_id": user_id, "updated_at": utcnow()} for user_id in user_ids]
+        )
+        await db.execute(missing.on_conflict_do_nothing(index_elements=[UserUsage.user_id]))
+        await db.execute(select(UserUsage.user_id).filter(UserUsage.user_id.in_(user_ids)).with_for_update())
+        totals_query = (
+            select(
+                Image.user_id,
+                func.count(Image.id),
+                func.coalesce(func.sum(cast(func.round(Image.file_size * 1000**2), BigInteger)), 0),
+            )
+            .filter(Image.user_id.in_(user_ids))
+            .group_by(Image.user_id)
+        )
+        totals = {user_id: (count, size) for user_id, count, size in (await db.execute(totals_query)).all()}
+        rows = [
+            {
+                "user_id": user_id,
+                "image_count": totals.get(user_id, (0, 0))[0],
+                "total_bytes": totals.get(user_id, (0, 0))[1],
+                "updated_at": utcnow(),
+            }
+            for user_id in user_ids
+        ]
+        await db.execute(update(UserUsage), rows)
+        await db.commit()
+        reconciled += len(user_ids)
+        last_id = user_ids[-1]
+
+
+async def reconcile_all_usage() -> int:
+    async with AsyncSessionLocal() as db:
+        return await reconcile_usage(db)
@@ -1,49 +1,60 @@
 from typing import Optional
 from uuid import UUID
 
-import jwt
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.models import User
+from api.models import BlackListedToken, User
 from api.schemas.user import UserRegister
-from api.utils import decode_jwt
-from exceptions import UserAlreadyExistsError, ValidationError
+from exceptions import UserAlreadyExistsError
+from passwords import password_hasher
 
 
-def create_user(user_data: UserRegister, db: Session) -> User:
+async def create_user(user_data: UserRegister, db: AsyncSession) -> User:
     query = select(User).filter(User.email == user_data.email)
-    result = db.execute(query)
+    result = await db.execute(query)
     existing_user = result.scalars().first()
     if existing_user:
         raise UserAlreadyExistsError("User with this email already exists.")
 
     user = User(email=str(user_data.email))
-    user.set_password(user_data.password)
+    user.hashed_password = await password_hasher.hash(user_data.password)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
-def get_user_by_token(token: str, db: Session) -> Optional[User]:
-    if not token:
-        return None
-    try:
-        user_uuid = decode_jwt(token)
-        user_uuid = UUID(user_uuid)
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError) as exc:
-        raise ValidationError(str(exc))
-    except ValueError:
-        return None
-    query = select(User).filter(User.uuid == user_uuid)
-    result = db.execute(query)
+async def get_user_with_blacklist_status(
+    user_uuid: UUID, db: AsyncSession, token_hash: Optional[str] = None
+) -> tuple[Optional[User], Optional[bool]]:
+    """
+    Load the user and, when `token_hash` is given, whether that token is blacklisted, in a single round trip.
+    The blacklist status is None when it wasn't asked for or the user doesn't exist.
+    """
+    if token_hash is None:
+        result = await db.execute(select(User).filter(User.uuid == user_uuid))
+        return result.scalars().first(), None
+    blacklisted = exists().where(BlackListedToken.token_hash == token_hash).label("blacklisted")
+    query = select(User, blacklisted).filter(User.uuid == user_uuid)
+    row = (await db.execute(query)).first()
+    if row is None:
+        return None, None
+    return row.User, row.blacklisted
+
+
+async def get_user_by_email(email: str, db: AsyncSession) -> Optional[User]:
+    query = select(User).filter(User.email == email)
+    result = await db.execute(query)
     user = result.scalars().first()
     return user
 
 
-def get_user_by_email(email: str, db: Session) -> Optional[User]:
-    query = select(User).filter(User.email == email)
-    result = db.execute(query)
-    user = result.scalars().first()
-    return user
+async def verify_user_password(user: User, password: str, db: AsyncSession) -> bool:
+    if not await password_hasher.verify(password, user.hashed_password):
+        return False
+    if password_hasher.needs_rehash(user.hashed_password):
+        # The configured cost changed since this hash was made, the plain password is only available now
+        user.hashed_password = await password_hasher.hash(password)
+        await db.commit()
+    return True
@@ -0,0 +1,24 @@
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.crud.content import upsert_insert
+from api.models import ImageVariant
+
+
+async def get_variant(content_id: int, name: str, db: AsyncSession) -> Optional[ImageVariant]:
+    query = select(ImageVariant).filter(ImageVariant.content_id == content_id, ImageVariant.name == name)
+    result = await db.execute(query)
+    return result.scalars().first()
+
+
+async def create_variant(variant_data: dict, db: AsyncSession) -> ImageVariant:
+    """
+    Insert a variant unless another worker rendered it first, either way the stored row is returned.
+    `variant_data` holds the ImageVariant columns.
+    """
+    insert = upsert_insert(db)(ImageVariant).values(**variant_data)
+    await db.execute(insert.on_conflict_do_nothing(index_elements=[ImageVariant.content_id, ImageVariant.name]))
+    await db.commit()
+    return await get_variant(variant_data["content_id"], variant_data["name"], db)
@@ -0,0 +1,63 @@
+import hashlib
+import logging
+
+import anyio
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.crud.content import get_content_by_hash
+from api.crud.direct_upload import delete_expired_direct_uploads
+from config import IMAGE_HEADER_MAX_BYTES
+from engine import AsyncSessionLocal
+from exceptions import StorageError, ValidationError
+from sniffing import ImageInfo, sniff_bytes
+from storage import StorageBackend, StoredFile, get_storage, media_type_for
+
+logger = logging.getLogger(__name__)
+
+
+async def verify_stored_file(stored_file: StoredFile, length: int, sha256: str, storage: StorageBackend) -> ImageInfo:
+    """
+    Check a directly uploaded file is the one that was announced and an image. Backends that didn't verify
+    the hash when storing it have it downloaded and hashed here, the others only have their header read.
+    Raises ValidationError or InvalidImageError.
+    """
+    if stored_file.size != length:
+        raise ValidationError("Uploaded file doesn't match the announced size")
+    if stored_file.content_hash is None:
+        data = await storage.read(stored_file.key)
+        digest = await anyio.to_thread.run_sync(lambda: hashlib.sha256(data).hexdigest())
+    else:
+        # One byte more than a header may take tells sniff_bytes whether it has the whole file
+        data = await storage.read_head(stored_file.key, IMAGE_HEADER_MAX_BYTES + 1)
+        digest = stored_file.content_hash
+    if digest != sha256:
+        raise ValidationError("Uploaded file doesn't match the announced SHA-256")
+    info = sniff_bytes(data)
+    # The key, and so the type it's served as, came from the announced content type
+    media_type = media_type_for(stored_file.key)
+    if media_type != "application/octet-stream" and media_type != info.mime_type:
+        raise ValidationError(f"Uploaded file is {info.mime_type}, not the announced {media_type}")
+    return info
+
+
+async def discard_uploaded_file(sha256: str, storage_key: str, db: AsyncSession, storage: StorageBackend):
+    """Delete a directly uploaded file, unless it's stored content (keys can be content-addressed and shared)."""
+    content = await get_content_by_hash(sha256, db)
+    if content is not None and content.storage_key == storage_key:
+        return
+    try:
+        await storage.delete(storage_key)
+    except StorageError as exc:
+        logger.warning("Couldn't delete uploaded file %s: %s", storage_key, exc)
+
+
+async def sweep_direct_uploads() -> int:
+    """Drop direct uploads that were never confirmed, along with whatever was uploaded for them."""
+    storage = get_storage()
+    swept = 0
+    async with AsyncSessionLocal() as db:
+        while expired := await delete_expired_direct_uploads(db):
+            for sha256, storage_key in expired:
+                await discard_uploaded_file(sha256, storage_key, db, storage)
+            swept += len(expired)
+    return swept
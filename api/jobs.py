@@ -0,0 +1,29 @@
+from typing import Awaitable, Callable
+
+from api.crud.usage import reconcile_all_usage
+from api.variants import generate_variants
+from storage import get_storage
+
+JobHandler = Callable[..., Awaitable[None]]
+
+JOB_HANDLERS: dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str):
+    """Register the coroutine that runs jobs of `kind`, it's called with the job's payload as keyword arguments."""
+
+    def register(func: JobHandler) -> JobHandler:
+        JOB_HANDLERS[kind] = func
+        return func
+
+    return register
+
+
+@job_handler("generate-variants")
+async def generate_variants_job(content_id: int, storage_key: str):
+    await generate_variants(content_id, storage_key, get_storage())
+
+
+@job_handler("reconcile-usage")
+async def reconcile_usage_job():
+    await reconcile_all_usage()
@@ -0,0 +1,139 @@
+import datetime
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import jwt
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.crud.content import upsert_insert
+from api.models import SigningKey
+from config import (
+    JWT_KEY_ROTATION_INTERVAL,
+    JWT_KEYRING_REFRESH_INTERVAL,
+    JWT_SIGNING_KEYS,
+    JWT_TOKEN_LIFETIME,
+)
+from engine import AsyncSessionLocal
+from utils import generate_jwt_secret_key, utcnow
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class JWTKey:
+    kid: str
+    secret: str
+    active_from: datetime.datetime
+
+
+def parse_signing_keys(entries: list[str]) -> list[JWTKey]:
+    """`<kid>:<secret>` entries, newest first: the first one signs and the rest only verify."""
+    keys = []
+    for entry in entries:
+        kid, _, secret = entry.partition(":")
+        if not kid or not secret:
+            raise ValueError("JWT_SIGNING_KEYS entries must look like <kid>:<secret>")
+        keys.append(JWTKey(kid, secret, datetime.datetime.min))
+    return keys
+
+
+class JWTKeyring:
+    """
+    The keys tokens are signed and verified with, identical in every process and on every node.
+
+    With `static_keys` the ring comes from config and is rotated by redeploying with a new key in front.
+    Otherwise it lives in the `signing_keys` table: `load()` creates a key when none is due for the current
+    rotation period and drops keys whose tokens have all expired. Several processes rotating at once agree on
+    the same `kid`, so only one key is created. A new key starts signing only after every process has had
+    time to reload the ring, so no process ever sees a token signed with a key it doesn't know yet.
+    """
+
+    def __init__(
+        self,
+        static_keys: list[str],
+        token_lifetime: float,
+        rotation_interval: float,
+        refresh_interval: float,
+    ):
+        self.static_keys = parse_signing_keys(static_keys)
+        self.token_lifetime = token_lifetime
+        self.rotation_interval = rotation_interval
+        self.publish_delay = 2 * max(refresh_interval, 0)
+        # Newest first, replaced as a whole on reload so readers never see a partial ring
+        self._keys: list[JWTKey] = list(self.static_keys)
+        self._by_kid: dict[str, JWTKey] = {key.kid: key for key in self._keys}
+
+    def _current_kid(self) -> str:
+        period = int(time.time() // self.rotation_interval) if self.rotation_interval > 0 else 0
+        return f"k{period}"
+
+    def _expired(self, keys: list[JWTKey]) -> list[JWTKey]:
+        # A key retires when the next one starts signing, and is kept until the last token it signed expires
+        now = utcnow()
+        deadline = datetime.timedelta(seconds=self.token_lifetime)
+        return [key for newer, key in zip(keys, keys[1:]) if newer.active_from + deadline < now]
+
+    def _set_keys(self, keys: list[JWTKey]):
+        self._keys = keys
+        self._by_kid = {key.kid: key for key in keys}
+
+    @staticmethod
+    async def _fetch(db: AsyncSession) -> list[JWTKey]:
+        rows = (await db.execute(select(SigningKey).order_by(SigningKey.active_from.desc()))).scalars().all()
+        return [JWTKey(row.kid, row.secret, row.active_from) for row in rows]
+
+    async def load(self):
+        if self.static_keys:
+            return
+        async with AsyncSessionLocal() as db:
+            keys = await self._fetch(db)
+            kid = self._current_kid()
+            if all(key.kid != kid for key in keys):
+                now = utcnow()
+                active_from = (
+                    now if not self._signing_keys(keys) else now + datetime.timedelta(seconds=self.publish_delay)
+                )
+                insert = upsert_insert(db)(SigningKey).values(
+                    kid=kid, secret=generate_jwt_secret_key(), active_from=active_from, created_at=now
+                )
+                await db.execute(insert.on_conflict_do_nothing(index_elements=[SigningKey.kid]))
+                await db.commit()
+                logger.info("Created JWT signing key %s, signing from %s", kid, active_from.isoformat())
+                keys = await self._fetch(db)
+            expired = self._expired(keys)
+            if expired:
+                await db.execute(delete(SigningKey).filter(SigningKey.kid.in_([key.kid for key in expired])))
+                await db.commit()
+                keys = [key for key in keys if key not in expired]
+        self._set_keys(keys)
+
+    @staticmethod
+    def _signing_keys(keys: list[JWTKey]) -> list[JWTKey]:
+        now = utcnow()
+        return [key for key in keys if key.active_from <= now]
+
+    def signing_key(self) -> JWTKey:
+        keys = self._signing_keys(self._keys)
+        if not keys:
+            raise RuntimeError("The JWT keyring hasn't been loaded")
+        return keys[0]
+
+    def has_key(self, kid: Optional[str]) -> bool:
+        return kid in self._by_kid
+
+    def verification_key(self, kid: Optional[str]) -> str:
+        key = self._by_kid.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        return key.secret
+
+
+jwt_keyring = JWTKeyring(
+    static_keys=JWT_SIGNING_KEYS,
+    token_lifetime=JWT_TOKEN_LIFETIME,
+    rotation_interval=JWT_KEY_ROTATION_INTERVAL,
+    refresh_interval=JWT_KEYRING_REFRESH_INTERVAL,
+)
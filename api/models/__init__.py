@@ -1,3 +1,11 @@
 from .backlisted_token import BlackListedToken
+from .direct_upload import DirectUpload
 from .image import Image
+from .image_content import ImageContent
+from .image_variant import ImageVariant
+from .job import Job
+from .signing_key import SigningKey
+from .upload_chunk import UploadChunk
+from .upload_session import UploadSession
 from .user import User
+from .user_usage import UserUsage
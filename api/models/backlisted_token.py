@@ -1,13 +1,15 @@
-import datetime
-
 from sqlalchemy import Column, DateTime, Integer, String
 
 from engine import Base
+from utils import utcnow
 
 
 class BlackListedToken(Base):
     __tablename__ = "blacklisted_tokens"
 
     id = Column(Integer, primary_key=True, index=True, nullable=False)
-    token = Column(String(256), nullable=False)
-    blacklisted_on = Column(DateTime, default=datetime.datetime.now(datetime.UTC))
+    # SHA-256 hex digest of the JWT, the raw token is never stored
+    token_hash = Column(String(64), nullable=False, unique=True, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    # Indexed for the workers' incremental blacklist syncs
+    blacklisted_on = Column(DateTime, default=utcnow, index=True)
@@ -0,0 +1,26 @@
+import uuid
+
+from sqlalchemy import UUID, BigInteger, Column, DateTime, ForeignKey, Integer, String
+
+from engine import Base
+from utils import utcnow
+
+
+class DirectUpload(Base):
+    """
+    A file a client was given presigned parameters to send straight to storage, waiting to be confirmed.
+    `sha256` and `length` are what the client announced, checked against the stored file on confirmation.
+    """
+
+    __tablename__ = "direct_uploads"
+
+    id = Column(Integer, primary_key=True, index=True, nullable=False)
+
+    uuid = Column(UUID(as_uuid=True), default=uuid.uuid4, unique=True, nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    filename = Column(String(255), nullable=False)
+    length = Column(BigInteger, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    storage_key = Column(String(255), nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=utcnow)
@@ -1,10 +1,24 @@
-import datetime
 import uuid
 
-from sqlalchemy import UUID, Column, DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy import (
+    DDL,
+    UUID,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    event,
+    func,
+)
 from sqlalchemy.orm import relationship
 
 from engine import Base
+from utils import utcnow
+
+FILENAME_MAX_LENGTH = 64
 
 
 class Image(Base):
@@ -13,10 +27,47 @@ class Image(Base):
     id = Column(Integer, primary_key=True, index=True, nullable=False)
 
     uuid = Column(UUID(as_uuid=True), default=uuid.uuid4, unique=True, nullable=False, index=True)
-    filename = Column(String(64), nullable=False)
-    upload_time = Column(DateTime, default=lambda: datetime.datetime.now(datetime.UTC))
+    filename = Column(String(FILENAME_MAX_LENGTH), nullable=False)
+    upload_time = Column(DateTime, default=utcnow)
     file_size = Column(Float, nullable=False)
     url = Column(String, nullable=False)
+    storage_key = Column(String(255), nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    content_id = Column(Integer, ForeignKey("image_contents.id"), nullable=True, index=True)
+    # Read from the file's header on upload, unknown for images uploaded before that
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    mime_type = Column(String(64), nullable=True)
 
     user = relationship("User", back_populates="images")
+    content = relationship("ImageContent", back_populates="images")
+
+    __table_args__ = (
+        Index("ix_images_user_id_upload_time_id", "user_id", "upload_time", "id"),
+        # Serves the retention sweeper's age cutoff across all users
+        Index("ix_images_upload_time", "upload_time"),
+        # Size range filters within a user's images
+        Index("ix_images_user_id_file_size_id", "user_id", "file_size", "id"),
+        # Case-insensitive filename prefix search, text_pattern_ops lets Postgres use it for LIKE 'abc%'
+        Index(
+            "ix_images_user_id_filename_lower",
+            user_id,
+            func.lower(filename).label("filename_lower"),
+            postgresql_ops={"filename_lower": "text_pattern_ops"},
+        ),
+        # Substring search (LIKE '%abc%'), needs the pg_trgm extension. A plain expression index elsewhere
+        Index(
+            "ix_images_filename_trgm",
+            func.lower(filename).label("filename_lower"),
+            postgresql_using="gin",
+            postgresql_ops={"filename_lower": "gin_trgm_ops"},
+        ),
+    )
+
+
+# For create_all, migrations create the extension themselves
+event.listen(
+    Image.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy.orm import relationship
+
+from engine import Base
+from utils import utcnow
+
+
+class ImageContent(Base):
+    """A stored file, shared by every `Image` whose bytes hash to the same SHA-256."""
+
+    __tablename__ = "image_contents"
+
+    id = Column(Integer, primary_key=True, index=True, nullable=False)
+
+    sha256 = Column(String(64), nullable=False, unique=True, index=True)
+    storage_key = Column(String(255), nullable=False)
+    url = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=utcnow)
+
+    images = relationship("Image", back_populates="content")
+    variants = relationship("ImageVariant", back_populates="content", passive_deletes=True)
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy.orm import relationship
+
+from engine import Base
+from utils import utcnow
+
+
+class ImageVariant(Base):
+    """A resized/re-encoded rendition of an `ImageContent`, one row per configured variant name."""
+
+    __tablename__ = "image_variants"
+    __table_args__ = (UniqueConstraint("content_id", "name", name="uq_image_variants_content_id_name"),)
+
+    id = Column(Integer, primary_key=True, index=True, nullable=False)
+
+    content_id = Column(Integer, ForeignKey("image_contents.id", ondelete="CASCADE"), nullable=False)
+    name = Column(String(32), nullable=False)
+    format = Column(String(8), nullable=False)
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    size = Column(Integer, nullable=False)
+    storage_key = Column(String(255), nullable=False)
+    url = Column(String, nullable=False)
+    created_at = Column(DateTime, default=utcnow)
+
+    content = relationship("ImageContent", back_populates="variants")
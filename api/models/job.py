@@ -0,0 +1,28 @@
+from sqlalchemy import JSON, Column, DateTime, Index, Integer, String, Text
+
+from engine import Base
+from utils import utcnow
+
+
+class Job(Base):
+    """
+    A unit of background work, picked up by `worker.py`.
+    Queued jobs become due at `run_at`. A running job whose `locked_until` has passed is considered
+    abandoned (its worker died) and is handed out again.
+    """
+
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True, nullable=False)
+
+    kind = Column(String(64), nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(String(16), nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime, nullable=False, default=utcnow)
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=utcnow)
+
+    __table_args__ = (Index("ix_jobs_status_run_at", "status", "run_at"),)
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, DateTime, Integer, String
+
+from engine import Base
+from utils import utcnow
+
+
+class SigningKey(Base):
+    """
+    A JWT signing secret shared by every process, identified in tokens by the `kid` header.
+    The newest key whose `active_from` has passed signs new tokens, older ones only verify until
+    the tokens they signed have expired.
+    """
+
+    __tablename__ = "signing_keys"
+
+    id = Column(Integer, primary_key=True, index=True, nullable=False)
+
+    kid = Column(String(32), nullable=False, unique=True, index=True)
+    secret = Column(String(128), nullable=False)
+    active_from = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=utcnow)
@@ -0,0 +1,20 @@
+from sqlalchemy import BigInteger, Column, ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy.orm import relationship
+
+from engine import Base
+
+
+class UploadChunk(Base):
+    """One PATCH worth of bytes of an `UploadSession`, stored as its own file in the staging area."""
+
+    __tablename__ = "upload_chunks"
+    __table_args__ = (UniqueConstraint("session_id", "offset", name="uq_upload_chunks_session_id_offset"),)
+
+    id = Column(Integer, primary_key=True, index=True, nullable=False)
+
+    session_id = Column(Integer, ForeignKey("upload_sessions.id", ondelete="CASCADE"), nullable=False)
+    offset = Column(BigInteger, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    name = Column(String(64), nullable=False)
+
+    session = relationship("UploadSession", back_populates="chunks")
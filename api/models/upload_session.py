@@ -0,0 +1,26 @@
+import uuid
+
+from sqlalchemy import UUID, BigInteger, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy.orm import relationship
+
+from engine import Base
+from utils import utcnow
+
+
+class UploadSession(Base):
+    """A resumable upload in progress, its bytes live in the staging area until it's completed."""
+
+    __tablename__ = "upload_sessions"
+
+    id = Column(Integer, primary_key=True, index=True, nullable=False)
+
+    uuid = Column(UUID(as_uuid=True), default=uuid.uuid4, unique=True, nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(255), nullable=False)
+    length = Column(BigInteger, nullable=False)
+    offset = Column(BigInteger, nullable=False, default=0)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=utcnow)
+
+    chunks = relationship("UploadChunk", back_populates="session", order_by="UploadChunk.offset", passive_deletes=True)
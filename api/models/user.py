@@ -1,10 +1,10 @@
 import uuid
 
-import bcrypt
 from sqlalchemy import UUID, Boolean, Column, Integer, String, UniqueConstraint
 from sqlalchemy.orm import relationship
 
 from engine import Base
+from passwords import hash_password, verify_password
 
 
 class User(Base):
@@ -18,14 +18,16 @@ class User(Base):
     is_active = Column(Boolean, default=True)
 
     images = relationship("Image", back_populates="user")
+    usage = relationship("UserUsage", back_populates="user", uselist=False, passive_deletes=True)
 
     UniqueConstraint("email", name="uq_user_email")
 
     def __repr__(self):
         return "<User {email!r}>".format(email=self.email)
 
+    # Blocking helpers for scripts, request handlers go through `passwords.password_hasher`
     def set_password(self, password: str):
-        self.hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+        self.hashed_password = hash_password(password)
 
     def check_password(self, password: str) -> bool:
-        return bcrypt.checkpw(password.encode("utf-8"), self.hashed_password.encode("utf-8"))
+        return verify_password(password, self.hashed_password)
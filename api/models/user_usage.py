@@ -0,0 +1,26 @@
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Integer
+from sqlalchemy.orm import relationship
+
+from engine import Base
+from utils import utcnow
+
+
+class UserUsage(Base):
+    """
+    Running totals of a user's images, kept next to `users` so the hot auth lookup never contends with uploads.
+    `max_images` / `max_bytes` / `retention_days` override the deployment's defaults for this user.
+    """
+
+    __tablename__ = "user_usage"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, nullable=False)
+
+    image_count = Column(BigInteger, nullable=False, default=0)
+    total_bytes = Column(BigInteger, nullable=False, default=0)
+    max_images = Column(BigInteger, nullable=True)
+    max_bytes = Column(BigInteger, nullable=True)
+    # Days this user's images are kept, 0 for forever
+    retention_days = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
+
+    user = relationship("User", back_populates="usage")
@@ -0,0 +1,59 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.crud.usage import get_usage
+from api.models import User
+from config import USER_MAX_IMAGES, USER_MAX_STORAGE_MB
+from exceptions import QuotaExceededError
+
+
+@dataclass
+class Quota:
+    """What a user may still upload, None meaning unlimited."""
+
+    image_count: int = 0
+    total_bytes: int = 0
+    max_images: Optional[int] = None
+    max_bytes: Optional[int] = None
+
+    @property
+    def images_left(self) -> Optional[int]:
+        return None if self.max_images is None else max(self.max_images - self.image_count, 0)
+
+    @property
+    def bytes_left(self) -> Optional[int]:
+        return None if self.max_bytes is None else max(self.max_bytes - self.total_bytes, 0)
+
+    def check(self, images: int = 1, size: int = 0):
+        if self.images_left is not None and self.images_left < images:
+            raise QuotaExceededError(f"Image quota of {self.max_images} images exceeded")
+        if self.bytes_left is not None and (self.bytes_left == 0 or self.bytes_left < size):
+            raise QuotaExceededError(f"Storage quota of {self.max_bytes / 1000**2:g} MB exceeded")
+
+    def upload_limit(self, max_size: int, max_size_label: str) -> tuple[int, str]:
+        """The size a single upload may reach, the smaller of `max_size` and what's left of the storage quota."""
+        if self.bytes_left is not None and self.bytes_left < max_size:
+            return self.bytes_left, f"{self.bytes_left / 1000**2:g} MB remaining storage quota"
+        return max_size, max_size_label
+
+    def consume(self, size: int):
+        self.image_count += 1
+        self.total_bytes += size
+
+
+async def get_quota(user: Optional[User], db: AsyncSession) -> Quota:
+    """A user's quota from their usage row, with the deployment defaults unless overridden. Anonymous is unlimited."""
+    if user is None:
+        return Quota()
+    usage = await get_usage(user.id, db)
+    default_max_bytes = int(USER_MAX_STORAGE_MB * 1000**2) or None
+    if usage is None:
+        return Quota(max_images=USER_MAX_IMAGES or None, max_bytes=default_max_bytes)
+    return Quota(
+        image_count=usage.image_count,
+        total_bytes=usage.total_bytes,
+        max_images=usage.max_images if usage.max_images is not None else USER_MAX_IMAGES or None,
+        max_bytes=usage.max_bytes if usage.max_bytes is not None else default_max_bytes,
+    )
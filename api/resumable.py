@@ -0,0 +1,118 @@
+import base64
+import binascii
+import hashlib
+import os
+import shutil
+import uuid
+from typing import AsyncIterator, Iterable
+
+import anyio
+from starlette.requests import ClientDisconnect
+
+from api.crud.upload_session import delete_expired_upload_sessions
+from config import UPLOAD_STAGING_ROOT
+from engine import AsyncSessionLocal
+from exceptions import FileTooLargeError, ValidationError
+
+TUS_VERSION = "1.0.0"
+TUS_EXTENSIONS = "creation,termination,expiration"
+
+
+def parse_upload_metadata(value: str) -> dict[str, str]:
+    """Parse a tus `Upload-Metadata` header: comma separated "key base64(value)" pairs."""
+    metadata = {}
+    for pair in filter(None, (pair.strip() for pair in value.split(","))):
+        key, _, encoded = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(encoded, validate=True).decode("utf-8")
+        except (binascii.Error, UnicodeDecodeError):
+            raise ValidationError(f"Invalid Upload-Metadata value for {key}")
+    return metadata
+
+
+async def until_disconnect(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # A dropped connection ends the chunk early instead of failing it, the client resumes from what arrived
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except ClientDisconnect:
+        return
+
+
+class StagingArea:
+    """
+    Chunks of unfinished resumable uploads, one directory per session and one file per PATCH.
+    Has to be shared by every API instance (e.g. a mounted volume) when there is more than one.
+    """
+
+    def __init__(self, root: str, read_size: int = 64 * 1024):
+        self.root = os.path.abspath(root)
+        self.read_size = read_size
+
+    def session_dir(self, session_uuid: uuid.UUID) -> str:
+        return os.path.join(self.root, str(session_uuid))
+
+    def chunk_path(self, session_uuid: uuid.UUID, name: str) -> str:
+        return os.path.join(self.session_dir(session_uuid), name)
+
+    async def write_chunk(
+        self, session_uuid: uuid.UUID, offset: int, chunks: AsyncIterator[bytes], max_size: int
+    ) -> tuple[str, int]:
+        # Unique per PATCH, so a request racing for the same offset never touches this file
+        name = f"{offset:015d}-{uuid.uuid4().hex[:8]}"
+        path = self.chunk_path(session_uuid, name)
+        await anyio.to_thread.run_sync(lambda: os.makedirs(self.session_dir(session_uuid), exist_ok=True))
+        size = 0
+        try:
+            async with await anyio.open_file(path, "wb") as file:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FileTooLargeError("Chunk exceeds the remaining Upload-Length")
+                    await file.write(chunk)
+        except BaseException:
+            await self.remove_chunk(session_uuid, name)
+            raise
+        return name, size
+
+    async def remove_chunk(self, session_uuid: uuid.UUID, name: str):
+        try:
+            await anyio.to_thread.run_sync(os.remove, self.chunk_path(session_uuid, name))
+        except FileNotFoundError:
+            pass
+
+    async def iter_chunks(self, session_uuid: uuid.UUID, names: Iterable[str]) -> AsyncIterator[bytes]:
+        """The assembled upload, read back piece by piece rather than into memory."""
+        for name in names:
+            async with await anyio.open_file(self.chunk_path(session_uuid, name), "rb") as file:
+                while chunk := await file.read(self.read_size):
+                    yield chunk
+
+    async def hash_chunks(self, session_uuid: uuid.UUID, names: Iterable[str]) -> str:
+        paths = [self.chunk_path(session_uuid, name) for name in names]
+        return await anyio.to_thread.run_sync(_sha256_files, paths, self.read_size)
+
+    async def remove_session(self, session_uuid: uuid.UUID):
+        await anyio.to_thread.run_sync(lambda: shutil.rmtree(self.session_dir(session_uuid), ignore_errors=True))
+
+
+def _sha256_files(paths: list[str], read_size: int) -> str:
+    hasher = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as file:
+            while chunk := file.read(read_size * 16):
+                hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+staging_area = StagingArea(UPLOAD_STAGING_ROOT)
+
+
+async def sweep_upload_sessions() -> int:
+    swept = 0
+    async with AsyncSessionLocal() as db:
+        while session_uuids := await delete_expired_upload_sessions(db):
+            for session_uuid in session_uuids:
+                await staging_area.remove_session(session_uuid)
+            swept += len(session_uuids)
+    return swept
@@ -0,0 +1,114 @@
+import asyncio
+import datetime
+import logging
+from collections import defaultdict
+from uuid import UUID
+
+from sqlalchemy import or_, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.crud.content import delete_released_contents
+from api.crud.image import delete_images
+from api.models import Image, UserUsage
+from cache import MetadataCache, get_metadata_cache
+from config import (
+    IMAGE_RETENTION_BATCH_SIZE,
+    IMAGE_RETENTION_DAYS,
+    STORAGE_DELETE_CONCURRENCY,
+)
+from engine import AsyncSessionLocal
+from imaging import VARIANTS
+from storage import StorageBackend, get_storage
+from utils import utcnow
+
+logger = logging.getLogger(__name__)
+
+
+def image_cache_keys(image_uuid: UUID) -> list[str]:
+    return [f"image-preview:{image_uuid}"] + [f"image-variant:{image_uuid}:{spec.name}" for spec in VARIANTS]
+
+
+async def delete_stored_files(
+    keys: list[str], storage: StorageBackend, concurrency: int = STORAGE_DELETE_CONCURRENCY
+) -> int:
+    """
+    Delete files `concurrency` at a time. Failures are logged and the files left behind,
+    the rows pointing at them are gone already. Returns how many failed.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def delete_file(key: str):
+        async with semaphore:
+            await storage.delete(key)
+
+    results = await asyncio.gather(*(delete_file(key) for key in keys), return_exceptions=True)
+    failed = 0
+    for key, result in zip(keys, results):
+        if isinstance(result, Exception):
+            failed += 1
+            logger.warning("Couldn't delete stored file %s: %s", key, result)
+    return failed
+
+
+async def purge_images(db: AsyncSession, storage: StorageBackend, cache: MetadataCache, *criteria) -> list[UUID]:
+    """
+    Delete the images matching `criteria`: the rows in one transaction, then their cached metadata
+    and the files nothing references anymore. Returns the deleted images' UUIDs.
+    """
+    image_uuids, storage_keys, content_ids = await delete_images(db, *criteria)
+    await db.commit()
+    await asyncio.gather(*(cache.delete(key) for image_uuid in image_uuids for key in image_cache_keys(image_uuid)))
+    await delete_stored_files(storage_keys, storage)
+    if content_ids:
+        # Content files are deleted while their rows are still locked, then the rows
+        await delete_stored_files(await delete_released_contents(content_ids, db), storage)
+        await db.commit()
+    return image_uuids
+
+
+async def retention_policies(db: AsyncSession) -> list[tuple[datetime.datetime, object]]:
+    """(cutoff, criterion) pairs: images matching the criterion and uploaded before the cutoff have expired."""
+    query = select(UserUsage.user_id, UserUsage.retention_days).filter(UserUsage.retention_days.is_not(None))
+    overrides = (await db.execute(query)).all()
+    users_by_days: defaultdict[int, list[int]] = defaultdict(list)
+    for user_id, days in overrides:
+        users_by_days[days].append(user_id)
+
+    now = utcnow()
+    policies = []
+    if IMAGE_RETENTION_DAYS > 0:
+        criterion = true()
+        if overrides:
+            criterion = or_(Image.user_id.is_(None), Image.user_id.not_in([user_id for user_id, _ in overrides]))
+        policies.append((now - datetime.timedelta(days=IMAGE_RETENTION_DAYS), criterion))
+    for days, user_ids in users_by_days.items():
+        if days > 0:
+            policies.append((now - datetime.timedelta(days=days), Image.user_id.in_(user_ids)))
+    return policies
+
+
+async def sweep_expired_images(batch_size: int = IMAGE_RETENTION_BATCH_SIZE) -> int:
+    """
+    Delete images older than their owner's retention period, oldest first and `batch_size` per transaction,
+    so row locks on `images` are only ever held for one short batch.
+    """
+    storage, cache = get_storage(), get_metadata_cache()
+    deleted = 0
+    async with AsyncSessionLocal() as db:
+        for cutoff, criterion in await retention_policies(db):
+            while True:
+                query = (
+                    select(Image.id)
+                    .filter(Image.upload_time < cutoff, criterion)
+                    .order_by(Image.upload_time)
+                    .limit(batch_size)
+                )
+                image_ids = (await db.scalars(query)).all()
+                if not image_ids:
+                    break
+                deleted += len(await purge_images(db, storage, cache, Image.id.in_(image_ids)))
+                if len(image_ids) < batch_size:
+                    break
+    if deleted:
+        logger.info("Deleted %s expired images", deleted)
+    return deleted
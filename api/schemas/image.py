@@ -1,6 +1,9 @@
+from typing import Optional
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from api.variants import variant_urls
 
 
 class ImageResponseSchema(BaseModel):
@@ -9,7 +12,87 @@ class ImageResponseSchema(BaseModel):
     filename: str
     file_size: float
     upload_time: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    mime_type: Optional[str] = None
+    # Variant name -> URL redirecting to the rendition, e.g. a WebP thumbnail for gallery tiles
+    variants: dict[str, str] = {}
+
+    @classmethod
+    def from_image(cls, image) -> "ImageResponseSchema":
+        return cls(
+            image_uuid=image.uuid,
+            image_url=image.url,
+            filename=image.filename,
+            file_size=image.file_size,
+            upload_time=image.upload_time.isoformat(),
+            width=image.width,
+            height=image.height,
+            mime_type=image.mime_type,
+            variants=variant_urls(image),
+        )
+
+
+def image_listing_item(row) -> dict:
+    """
+    The fields of ImageResponseSchema for a row of `LISTING_COLUMNS`, as a plain dict for ORJSONResponse.
+    UUIDs and datetimes are left to orjson, which encodes them the same way as the schema.
+    """
+    return {
+        "image_uuid": row.uuid,
+        "image_url": row.url,
+        "filename": row.filename,
+        "file_size": row.file_size,
+        "upload_time": row.upload_time,
+        "width": row.width,
+        "height": row.height,
+        "mime_type": row.mime_type,
+        "variants": variant_urls(row),
+    }
 
 
 class ImageListResponseSchema(BaseModel):
     images: list[ImageResponseSchema]
+    next_cursor: Optional[str] = None
+
+
+class BatchUploadResultSchema(BaseModel):
+    filename: str
+    status: str
+    image: Optional[ImageResponseSchema] = None
+    error: Optional[str] = None
+
+
+class BatchUploadResponseSchema(BaseModel):
+    results: list[BatchUploadResultSchema]
+
+
+class DeleteImagesSchema(BaseModel):
+    image_uuids: list[UUID]
+
+
+class DeleteImagesResponseSchema(BaseModel):
+    deleted: list[UUID]
+    not_found: list[UUID]
+
+
+class DirectUploadSchema(BaseModel):
+    filename: str = Field(min_length=1, max_length=255)
+    size: int = Field(gt=0)
+    sha256: str = Field(pattern=r"^[0-9a-fA-F]{64}$")
+    content_type: str = "application/octet-stream"
+
+
+class PresignedUploadSchema(BaseModel):
+    url: str
+    method: str
+    # Form fields to send before the file when `method` is POST
+    fields: dict[str, str] = {}
+    headers: dict[str, str] = {}
+
+
+class DirectUploadResponseSchema(BaseModel):
+    upload_uuid: UUID
+    upload: PresignedUploadSchema
+    expires_at: str
+    confirm_url: str
@@ -1,3 +1,5 @@
+from typing import Optional
+
 import bcrypt
 from pydantic import BaseModel, EmailStr
 
@@ -15,3 +17,19 @@ class UserRegister(BaseModel):
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
+
+
+class UsageResponseSchema(BaseModel):
+    image_count: int
+    total_mb: float
+    max_images: Optional[int] = None
+    max_mb: Optional[float] = None
+
+    @classmethod
+    def from_quota(cls, quota) -> "UsageResponseSchema":
+        return cls(
+            image_count=quota.image_count,
+            total_mb=quota.total_bytes / 1000**2,
+            max_images=quota.max_images,
+            max_mb=quota.max_bytes / 1000**2 if quota.max_bytes is not None else None,
+        )
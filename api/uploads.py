@@ -0,0 +1,204 @@
+from collections import deque
+from typing import AsyncIterator, Optional
+
+from starlette.requests import Request
+
+from exceptions import FileTooLargeError, ValidationError
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:
+    import multipart
+    from multipart.multipart import parse_options_header
+
+
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+
+BATCH_UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                    "required": ["files"],
+                }
+            }
+        },
+    }
+}
+
+
+async def iter_chunks(data: bytes, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), chunk_size):
+        yield data[start : start + chunk_size]
+
+
+async def hash_chunks(chunks: AsyncIterator[bytes], hasher) -> AsyncIterator[bytes]:
+    # Pass the chunks through untouched, feeding them to `hasher` on the way
+    async for chunk in chunks:
+        hasher.update(chunk)
+        yield chunk
+
+
+class StreamedFile:
+    """A single file part of a multipart body, read chunk by chunk as it arrives from the client."""
+
+    def __init__(self, stream: "MultipartStream", field_name: str, filename: str, content_type: str):
+        self._stream = stream
+        self.field_name = field_name
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self.consumed = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while True:
+            event, payload = await self._stream.next_event()
+            if event == "data":
+                self.size += len(payload)
+                if self.size > self._stream.max_file_size:
+                    raise FileTooLargeError(f"File size exceeds {self._stream.max_file_size_label} limit")
+                yield payload
+            elif event in ("end", None):
+                self.consumed = True
+                return
+
+    async def read(self) -> bytes:
+        data = bytearray()
+        async for chunk in self:
+            data.extend(chunk)
+        return bytes(data)
+
+    async def drain(self):
+        # Skip whatever is left of this part, e.g. after it was rejected for being too large
+        if not self.consumed:
+            await self._stream.skip_part()
+            self.consumed = True
+
+
+class MultipartStream:
+    """
+    Incremental multipart/form-data reader on top of `request.stream()`.
+    Unlike `UploadFile`, nothing is spooled: the body is parsed as it is received,
+    so size limits are enforced before the rest of the upload is read.
+    """
+
+    def __init__(self, request: Request, max_file_size: int, max_file_size_label: str = ""):
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise ValidationError("Expected a multipart/form-data request")
+        charset = params.get(b"charset", b"utf-8")
+        self._charset = charset.decode("latin-1") if isinstance(charset, bytes) else charset
+        self.max_file_size = max_file_size
+        self.max_file_size_label = max_file_size_label or f"{max_file_size} bytes"
+
+        self._body = request.stream()
+        self._events: deque[tuple[str, object]] = deque()
+        self._finished = False
+        self._header_field = b""
+        self._header_value = b""
+        self._part_headers: dict[bytes, bytes] = {}
+        self._current_file: Optional[StreamedFile] = None
+        self._parser = multipart.MultipartParser(
+            params[b"boundary"],
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+            },
+        )
+
+    def _on_part_begin(self):
+        self._part_headers = {}
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        self._events.append(("data", data[start:end]))
+
+    def _on_part_end(self):
+        self._events.append(("end", None))
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._part_headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        self._events.append(("headers", self._part_headers))
+
+    def _decode(self, value: bytes) -> str:
+        try:
+            return value.decode(self._charset)
+        except (UnicodeDecodeError, LookupError):
+            return value.decode("latin-1")
+
+    async def next_event(self) -> tuple[Optional[str], object]:
+        while not self._events:
+            if self._finished:
+                return None, None
+            try:
+                chunk = await self._body.__anext__()
+            except StopAsyncIteration:
+                self._parser.finalize()
+                self._finished = True
+                continue
+            self._parser.write(chunk)
+        return self._events.popleft()
+
+    async def skip_part(self):
+        while True:
+            event, _ = await self.next_event()
+            if event in ("end", None):
+                return
+
+    async def next_file(self, field_name: Optional[str] = None) -> Optional[StreamedFile]:
+        """
+        Advance to the next file part (optionally only parts named `field_name`),
+        skipping plain form fields. The previous file must have been fully consumed.
+        """
+        if self._current_file is not None and not self._current_file.consumed:
+            raise RuntimeError("The previous file part has not been consumed")
+        while True:
+            event, headers = await self.next_event()
+            if event is None:
+                return None
+            if event != "headers":
+                continue
+            _, options = parse_options_header(headers.get(b"content-disposition", b""))
+            name = self._decode(options.get(b"name", b""))
+            if b"filename" not in options or (field_name is not None and name != field_name):
+                await self.skip_part()
+                continue
+            self._current_file = StreamedFile(
+                self,
+                field_name=name,
+                filename=self._decode(options[b"filename"]),
+                content_type=self._decode(headers.get(b"content-type", b"application/octet-stream")),
+            )
+            return self._current_file
@@ -1,38 +1,31 @@
+import base64
 import datetime
 from typing import Optional
 
 import jwt
-from fastapi.security import OAuth2PasswordBearer
-from pydantic import BaseModel
-from sqlalchemy import select
-from sqlalchemy.orm import Session
 from starlette.datastructures import Headers
 
-from api.models.backlisted_token import BlackListedToken
-from config import JWT_ENCRYPTION_ALGORITHM, JWT_SECRET_KEY
-from engine import get_db
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
-
-class TokenData(BaseModel):
-    user_uuid: Optional[str] = None
+from api.jwt_keys import jwt_keyring
+from config import JWT_ENCRYPTION_ALGORITHM, JWT_TOKEN_LIFETIME
+from exceptions import ValidationError
 
 
 def generate_jwt_token(user_uuid: str) -> str:
     payload = {
         "user_uuid": user_uuid,
-        "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1),
+        "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=JWT_TOKEN_LIFETIME),
     }
-    token = jwt.encode(payload, JWT_SECRET_KEY, algorithm="HS256")
+    key = jwt_keyring.signing_key()
+    token = jwt.encode(payload, key.secret, algorithm=JWT_ENCRYPTION_ALGORITHM, headers={"kid": key.kid})
     return token
 
 
-def decode_jwt(token: str) -> str:
+def decode_jwt_claims(token: str) -> dict:
     try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ENCRYPTION_ALGORITHM])
-        user_uuid: str = payload["user_uuid"]
-        return user_uuid
+        secret = jwt_keyring.verification_key(jwt.get_unverified_header(token).get("kid"))
+        payload = jwt.decode(token, secret, algorithms=[JWT_ENCRYPTION_ALGORITHM])
+        payload["user_uuid"]
+        return payload
     except (KeyError, ValueError):
         raise jwt.InvalidTokenError
     except jwt.ExpiredSignatureError:
@@ -41,15 +34,22 @@ def decode_jwt(token: str) -> str:
         raise jwt.InvalidTokenError("Invalid token")
 
 
-def is_blacklisted(auth_token):
-    db: Session = next(get_db())
-    query = select(BlackListedToken).filter_by(token=auth_token)
-    res = db.execute(query).scalars().first()
-    return res is not None
-
-
 def extract_jwt_token_from_request(headers: Headers) -> Optional[str]:
     auth_header = headers.get("authorization")
     if auth_header and auth_header.startswith("Bearer "):
         return auth_header.split(" ")[1]
     return None
+
+
+def encode_cursor(upload_time: datetime.datetime, image_id: int) -> str:
+    raw = f"{upload_time.isoformat()}|{image_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        upload_time, image_id = raw.split("|")
+        return datetime.datetime.fromisoformat(upload_time), int(image_id)
+    except ValueError:
+        raise ValidationError("Invalid cursor")
@@ -0,0 +1,83 @@
+import asyncio
+from typing import Optional
+
+from api.crud.content import unreferenced_storage_keys
+from api.crud.variant import create_variant, get_variant
+from api.models import ImageVariant
+from api.uploads import iter_chunks
+from engine import AsyncSessionLocal
+from exceptions import UnsupportedImageError
+from imaging import VARIANTS, VariantSpec, image_processor
+from storage import StorageBackend
+
+# Renditions are stored apart from uploads, so a variant never shares its file with an original
+VARIANTS_FOLDER = "variants"
+
+_in_flight: dict[tuple[int, str], asyncio.Task] = {}
+
+
+def variant_urls(image) -> dict[str, str]:
+    # Only deduplicated content has variants, older images keep just their original
+    if image.content_id is None:
+        return {}
+    return {spec.name: f"/image-variants/{image.uuid}/{spec.name}" for spec in VARIANTS}
+
+
+async def _render_variant(
+    content_id: int, storage_key: str, spec: VariantSpec, storage: StorageBackend, data: Optional[bytes]
+) -> ImageVariant:
+    if data is None:
+        data = await storage.read(storage_key)
+    rendered, width, height = await image_processor.render(data, spec)
+    stored_file = await storage.save(
+        iter_chunks(rendered), f"{spec.name}{spec.extension}", spec.content_type, folder=VARIANTS_FOLDER
+    )
+    async with AsyncSessionLocal() as db:
+        variant = await create_variant(
+            {
+                "content_id": content_id,
+                "name": spec.name,
+                "format": spec.format,
+                "width": width,
+                "height": height,
+                "size": len(rendered),
+                "storage_key": stored_file.key,
+                "url": stored_file.url,
+            },
+            db,
+        )
+        # Rendered by another worker at the same time. The file may still be another content's identical variant
+        if variant.storage_key != stored_file.key and await unreferenced_storage_keys([stored_file.key], db):
+            await storage.delete(stored_file.key)
+    return variant
+
+
+async def get_or_create_variant(
+    content_id: int, storage_key: str, spec: VariantSpec, storage: StorageBackend, data: Optional[bytes] = None
+) -> ImageVariant:
+    """
+    Return the stored variant, rendering it on first use. Concurrent requests for the same variant
+    in this process share a single render.
+    """
+    async with AsyncSessionLocal() as db:
+        variant = await get_variant(content_id, spec.name, db)
+    if variant is not None:
+        return variant
+    key = (content_id, spec.name)
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.create_task(_render_variant(content_id, storage_key, spec, storage, data))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def generate_variants(content_id: int, storage_key: str, storage: StorageBackend):
+    """Render every configured variant of new content ahead of the first request, reading the original once."""
+    data = await storage.read(storage_key)
+    try:
+        for spec in VARIANTS:
+            await get_or_create_variant(content_id, storage_key, spec, storage, data)
+    except UnsupportedImageError:
+        # Not an image, nothing to render
+        pass
@@ -1,32 +1,159 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import mimetypes
+import re
+from collections import Counter
+from contextlib import asynccontextmanager
+from email.utils import format_datetime
 from typing import Optional
+from uuid import UUID
 
-import cloudinary.uploader
+import orjson
 from fastapi import (
     Body,
     Depends,
     FastAPI,
-    File,
     HTTPException,
+    Query,
     Request,
     Response,
-    UploadFile,
     status,
 )
 from fastapi.openapi.models import License
+from fastapi.responses import (
+    JSONResponse,
+    ORJSONResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
 from pydantic import AnyUrl
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
 import config
-from api.crud.image import create_image, get_image_by_uuid, get_images_by_user_id
-from api.crud.token import add_token_to_blacklisted
-from api.crud.user import create_user, get_user_by_email, get_user_by_token
-from api.schemas.image import ImageListResponseSchema, ImageResponseSchema
-from api.schemas.user import UserLogin, UserRegister
-from api.utils import extract_jwt_token_from_request, generate_jwt_token
-from decorators import jwt_required
-from engine import get_db
-from exceptions import UserAlreadyExistsError, ValidationError
-from utils import convert_bytes_to_mb
+from api.blacklist import blacklist_cache
+from api.crud.content import acquire_content, get_content_by_hash, release_contents
+from api.crud.direct_upload import (
+    create_direct_upload,
+    delete_direct_upload,
+    get_direct_upload,
+)
+from api.crud.image import (
+    ImageFilters,
+    create_image,
+    create_images,
+    get_image_by_uuid,
+    get_images_page,
+    iter_images_by_user_id,
+)
+from api.crud.job import enqueue_job
+from api.crud.token import add_token_to_blacklisted, sweep_expired_tokens
+from api.crud.upload_session import (
+    add_upload_chunk,
+    create_upload_session,
+    delete_upload_session,
+    get_upload_chunk_names,
+    get_upload_session,
+)
+from api.crud.user import create_user, get_user_by_email, verify_user_password
+from api.direct_uploads import (
+    discard_uploaded_file,
+    sweep_direct_uploads,
+    verify_stored_file,
+)
+from api.jwt_keys import jwt_keyring
+from api.models import DirectUpload, Image, ImageContent, UploadSession, User
+from api.quotas import get_quota
+from api.resumable import (
+    TUS_EXTENSIONS,
+    TUS_VERSION,
+    parse_upload_metadata,
+    staging_area,
+    sweep_upload_sessions,
+    until_disconnect,
+)
+from api.retention import purge_images
+from api.schemas.image import (
+    BatchUploadResponseSchema,
+    BatchUploadResultSchema,
+    DeleteImagesResponseSchema,
+    DeleteImagesSchema,
+    DirectUploadResponseSchema,
+    DirectUploadSchema,
+    ImageListResponseSchema,
+    ImageResponseSchema,
+    PresignedUploadSchema,
+    image_listing_item,
+)
+from api.schemas.user import UsageResponseSchema, UserLogin, UserRegister
+from api.uploads import (
+    BATCH_UPLOAD_REQUEST_BODY,
+    UPLOAD_REQUEST_BODY,
+    MultipartStream,
+    hash_chunks,
+    iter_chunks,
+)
+from api.utils import decode_cursor, encode_cursor, generate_jwt_token
+from api.variants import get_or_create_variant, variant_urls
+from cache import MetadataCache, close_metadata_cache, get_metadata_cache
+from dependencies import get_current_user, get_optional_user, get_read_db, get_token
+from engine import async_engine, get_db, primary_pins, read_session, replicas
+from exceptions import (
+    FileTooLargeError,
+    ImageProcessorBusyError,
+    InvalidImageError,
+    PasswordHasherBusyError,
+    QuotaExceededError,
+    StorageError,
+    UnsupportedImageError,
+    UserAlreadyExistsError,
+    ValidationError,
+)
+from imaging import VARIANTS_BY_NAME, image_processor
+from metrics import MetricsMiddleware
+from metrics import registry as metrics_registry
+from passwords import password_hasher
+from ratelimit import RateLimitMiddleware, close_rate_limit_store, get_rate_limit_store
+from scheduler import PeriodicTasks
+from sniffing import ImageInfo, sniff_bytes, sniff_chunks
+from storage import (
+    StorageBackend,
+    StoredFile,
+    close_storage,
+    create_upload_signer,
+    file_extension,
+    get_storage,
+)
+from storage.standin import create_standin_app
+from utils import convert_bytes_to_mb, to_naive_utc, utcnow
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+NDJSON_CHUNK_SIZE = 64 * 1024
+
+periodic_tasks = PeriodicTasks()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await jwt_keyring.load()
+    await blacklist_cache.load()
+    await replicas.check()
+    periodic_tasks.add("db-replica-health-check", config.DB_REPLICA_CHECK_INTERVAL, replicas.check)
+    periodic_tasks.add("jwt-keyring-refresh", config.JWT_KEYRING_REFRESH_INTERVAL, jwt_keyring.load)
+    periodic_tasks.add("blacklist-sweeper", config.BLACKLIST_SWEEP_INTERVAL, sweep_expired_tokens)
+    periodic_tasks.add("upload-session-sweeper", config.UPLOAD_SESSION_SWEEP_INTERVAL, sweep_upload_sessions)
+    periodic_tasks.add("direct-upload-sweeper", config.UPLOAD_SESSION_SWEEP_INTERVAL, sweep_direct_uploads)
+    yield
+    await periodic_tasks.stop()
+    await close_storage()
+    await close_metadata_cache()
+    await close_rate_limit_store()
+    await replicas.dispose()
+    await async_engine.dispose()
+    password_hasher.shutdown()
+    image_processor.shutdown()
+
 
 app = FastAPI(
     title="Image Uploader API",
@@ -36,36 +163,70 @@ app = FastAPI(
         name="BSD2.0",
         url=AnyUrl("https://opensource.org/license/bsd-2-clause"),
     ),
+    lifespan=lifespan,
 )
 
-cloudinary.config(
-    cloud_name=config.CLOUDINARY_CLOUD_NAME,
-    api_key=config.CLOUDINARY_API_KEY,
-    api_secret=config.CLOUDINARY_API_SECRET,
-)
+
+if config.RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        store=get_rate_limit_store(),
+        trusted_proxies=config.RATE_LIMIT_TRUSTED_PROXIES,
+    )
+# Added last so it's outermost and also sees rate-limited requests
+if config.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+if config.DIRECT_UPLOAD_URL.startswith("/"):
+    # The stand-in upload server, for presigned uploads to the "local" and "memory" backends
+    app.mount(config.DIRECT_UPLOAD_URL, create_standin_app(get_storage, create_upload_signer()))
+
+
+@app.exception_handler(PasswordHasherBusyError)
+@app.exception_handler(ImageProcessorBusyError)
+async def busy_handler(request: Request, exc: Exception):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(QuotaExceededError)
+async def quota_exceeded_handler(request: Request, exc: QuotaExceededError):
+    return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": str(exc)})
 
 
 @app.get("/")
-def health_check():
+async def health_check():
     return {"message": "API is running!"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    if not config.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.post("/register/")
-def register(register_data: UserRegister = Body(...), db: Session = Depends(get_db)):
+async def register(register_data: UserRegister = Body(...), db: AsyncSession = Depends(get_db)):
     try:
-        create_user(register_data, db)
+        await create_user(register_data, db)
     except UserAlreadyExistsError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
     return {"message": "User created successfully"}
 
 
 @app.post("/login/")
-def login(login_data: UserLogin = Body(...), db: Session = Depends(get_db)):
-    user = get_user_by_email(str(login_data.email), db)
+async def login(login_data: UserLogin = Body(...), db: AsyncSession = Depends(get_db)):
+    user = await get_user_by_email(str(login_data.email), db)
     if not user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect credentials provided")
-    if user.check_password(login_data.password):
+    if await verify_user_password(user, login_data.password, db):
         token = generate_jwt_token(str(user.uuid))
+        # A user registered moments ago may not be on the replicas yet
+        await primary_pins.pin(user.uuid)
         return {
             "user_email": user.email,
             "user_uuid": user.uuid,
@@ -75,85 +236,789 @@ def login(login_data: UserLogin = Body(...), db: Session = Depends(get_db)):
 
 
 @app.post("/logout/")
-@jwt_required
-def logout(request: Request, db: Session = Depends(get_db)):
-    token = extract_jwt_token_from_request(request.headers)
-    add_token_to_blacklisted(token, db)
+async def logout(
+    token: str = Depends(get_token), user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+):
+    await add_token_to_blacklisted(token, db)
     return Response(
         status_code=status.HTTP_200_OK,
         content="Logged out successfully",
     )
 
 
-@app.post("/upload/")
-def upload_image(request: Request, file: Optional[UploadFile] = File(None), db: Session = Depends(get_db)):
+async def stored_file_kept(stored_file: Optional[StoredFile], content: ImageContent, storage: StorageBackend) -> bool:
+    """
+    Whether the file an upload found already stored is still there, now that acquire_content() holds the content's
+    row lock. The content's last image may have been deleted meanwhile, and its file with it.
+    """
+    if stored_file is None or not stored_file.already_stored or stored_file.key != content.storage_key:
+        return True
+    return await storage.stat(stored_file.key) is not None
+
+
+async def save_image(
+    filename: str,
+    size: int,
+    digest: str,
+    stored_file: Optional[StoredFile],
+    info: ImageInfo,
+    user: Optional[User],
+    db: AsyncSession,
+    storage: StorageBackend,
+) -> Image:
+    """
+    Create the image row for an upload hashed to `digest`, `stored_file` is None when the content was
+    already stored and the transfer was skipped. Commits `db`.
+    """
+    content = await acquire_content(digest, stored_file, size, db)
+    if content is None or not await stored_file_kept(stored_file, content, storage):
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Stored content was removed, retry the upload")
+    if stored_file is not None and stored_file.key == content.storage_key and content.ref_count == 1:
+        # New content, queued in the same transaction as the image
+        enqueue_job("generate-variants", {"content_id": content.id, "storage_key": content.storage_key}, db)
+    image = await create_image(
+        filename,
+        convert_bytes_to_mb(size),
+        content.url,
+        user,
+        db,
+        storage_key=content.storage_key,
+        content_id=content.id,
+        width=info.width,
+        height=info.height,
+        mime_type=info.mime_type,
+    )
+    if stored_file is not None and stored_file.key != content.storage_key:
+        # The same content was stored meanwhile, the image points to that copy
+        await storage.delete(stored_file.key)
+    if user is not None:
+        await primary_pins.pin(user.uuid)
+    return image
+
+
+@app.get("/me/usage", response_model=UsageResponseSchema)
+async def my_usage(user: User = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    # Maintained counters, a single primary key lookup however many images the user has
+    return UsageResponseSchema.from_quota(await get_quota(user, db))
+
+
+@app.post("/upload/", openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_image(
+    request: Request,
+    user: Optional[User] = Depends(get_optional_user),
+    db: AsyncSession = Depends(get_db),
+    storage: StorageBackend = Depends(get_storage),
+):
+    # Clients that already know the file's SHA-256 can announce it, known content is then only hashed
+    # to check the claim and never transferred to storage again
+    content_hint = request.headers.get("x-content-sha256", "").lower()
+    known_content = None
+    if SHA256_RE.match(content_hint):
+        known_content = await get_content_by_hash(content_hint, db)
+    # Checked before any bytes are read, the upload is also cut off once it outgrows the remaining storage quota
+    quota = await get_quota(user, db)
+    quota.check()
+    max_file_size, max_file_size_label = quota.upload_limit(
+        int(config.MAX_UPLOAD_SIZE_MB * 1000**2), f"{config.MAX_UPLOAD_SIZE_MB:g} MB"
+    )
+    # Give the pooled connection back while the body streams, the session is reused for the insert afterwards
+    await db.close()
+
+    try:
+        stream = MultipartStream(request, max_file_size=max_file_size, max_file_size_label=max_file_size_label)
+        file = await stream.next_file("file")
+    except ValidationError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     if not file:
         raise HTTPException(
             status_code=400,
             detail="No file provided",
         )
-    file_size = convert_bytes_to_mb(file.size)
-    if file_size > 2.0:
-        raise HTTPException(
-            status_code=400,
-            detail="File size exceeds 2 MB limit",
-        )
 
-    token = extract_jwt_token_from_request(request.headers)
+    hasher = hashlib.sha256()
+    stored_file = None
+    try:
+        # Only the first few hundred bytes are held back to check the file is an image, before storage sees any
+        info, chunks = await sniff_chunks(hash_chunks(file, hasher))
+        if known_content is not None:
+            async for _ in chunks:
+                pass
+        else:
+            stored_file = await storage.save(chunks, file.filename, info.mime_type)
+    except InvalidImageError as exc:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(exc))
+    except FileTooLargeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except StorageError as exc:
+        raise HTTPException(status_code=502, detail=str(exc))
+    digest = hasher.hexdigest()
+    if known_content is not None and digest != known_content.sha256:
+        raise HTTPException(status_code=400, detail="File doesn't match X-Content-SHA256")
+
+    image = await save_image(file.filename, file.size, digest, stored_file, info, user, db, storage)
+    return ImageResponseSchema.from_image(image)
+
+
+@app.post("/upload/batch/", response_model=BatchUploadResponseSchema, openapi_extra=BATCH_UPLOAD_REQUEST_BODY)
+async def upload_images_batch(
+    request: Request,
+    user: Optional[User] = Depends(get_optional_user),
+    db: AsyncSession = Depends(get_db),
+    storage: StorageBackend = Depends(get_storage),
+):
+    quota = await get_quota(user, db)
+    quota.check()
+    await db.close()
     try:
-        user = get_user_by_token(token, db)
+        stream = MultipartStream(request, max_file_size=int(config.MAX_UPLOAD_SIZE_MB * 1000**2))
     except ValidationError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
-    result = cloudinary.uploader.upload(file.file)
-    image_url = result["secure_url"]
-    image = create_image(file.filename, file_size, image_url, user, db)
-
-    return ImageResponseSchema(
-        image_uuid=image.uuid,
-        image_url=image.url,
-        filename=image.filename,
-        file_size=image.file_size,
-        upload_time=image.upload_time.isoformat(),
+
+    # Each file is read from the request and handed to its own transfer. The semaphore caps the transfers
+    # in flight, which also bounds memory to UPLOAD_BATCH_CONCURRENCY buffered files.
+    # Files are keyed by their SHA-256, content that is already stored (or repeated within the batch) is not
+    # transferred again
+    semaphore = asyncio.Semaphore(config.UPLOAD_BATCH_CONCURRENCY)
+    results: list[BatchUploadResultSchema] = []
+    digests: dict[int, str] = {}
+    infos: dict[int, ImageInfo] = {}
+    sizes: dict[str, int] = {}
+    known: dict[str, ImageContent] = {}
+    transfers: dict[str, asyncio.Task] = {}
+
+    async def transfer(data: bytes, filename: str, content_type: str):
+        try:
+            return await storage.save(iter_chunks(data), filename, content_type)
+        finally:
+            semaphore.release()
+
+    try:
+        while (file := await stream.next_file("files")) is not None:
+            result = BatchUploadResultSchema(filename=file.filename, status="failed")
+            results.append(result)
+            if len(results) > config.UPLOAD_BATCH_MAX_FILES:
+                result.error = f"Batch exceeds {config.UPLOAD_BATCH_MAX_FILES} files"
+                await file.drain()
+                continue
+            try:
+                quota.check()
+            except QuotaExceededError as exc:
+                result.error = str(exc)
+                await file.drain()
+                continue
+            stream.max_file_size, stream.max_file_size_label = quota.upload_limit(
+                int(config.MAX_UPLOAD_SIZE_MB * 1000**2), f"{config.MAX_UPLOAD_SIZE_MB:g} MB"
+            )
+            await semaphore.acquire()
+            try:
+                data = await file.read()
+            except FileTooLargeError as exc:
+                semaphore.release()
+                result.error = str(exc)
+                await file.drain()
+                continue
+            try:
+                info = sniff_bytes(data)
+            except InvalidImageError as exc:
+                semaphore.release()
+                result.error = str(exc)
+                continue
+            quota.consume(file.size)
+            digest = hashlib.sha256(data).hexdigest()
+            digests[len(results) - 1] = digest
+            infos[len(results) - 1] = info
+            sizes[digest] = file.size
+            if digest not in transfers and digest not in known:
+                content = await get_content_by_hash(digest, db)
+                await db.close()
+                if content is not None:
+                    known[digest] = content
+                else:
+                    transfers[digest] = asyncio.create_task(transfer(data, file.filename, info.mime_type))
+                    continue
+            semaphore.release()
+        if not results:
+            raise HTTPException(status_code=400, detail="No file provided")
+
+        await asyncio.gather(*transfers.values(), return_exceptions=True)
+    finally:
+        for task in transfers.values():
+            task.cancel()
+
+    for task in transfers.values():
+        if task.exception() is not None and not isinstance(task.exception(), StorageError):
+            raise task.exception()
+
+    # Reference counts are taken in the same transaction as the image rows
+    contents: dict[str, ImageContent] = {}
+    created: list[str] = []
+    orphaned: list[str] = []
+    try:
+        for digest, count in Counter(digests.values()).items():
+            task = transfers.get(digest)
+            if task is not None and task.exception() is not None:
+                continue
+            stored_file = task.result() if task is not None else None
+            content = await acquire_content(digest, stored_file, sizes[digest], db, count=count)
+            if content is None:
+                continue
+            if not await stored_file_kept(stored_file, content, storage):
+                # Handed back, like content that was removed the files fail and can be uploaded again
+                await release_contents({content.id: count}, db)
+                continue
+            contents[digest] = content
+            if stored_file is not None and stored_file.key != content.storage_key:
+                orphaned.append(stored_file.key)
+            elif stored_file is not None and content.ref_count == count:
+                created.append(stored_file.key)
+                enqueue_job("generate-variants", {"content_id": content.id, "storage_key": content.storage_key}, db)
+
+        stored = [index for index, digest in digests.items() if digest in contents]
+        images_data = [
+            {
+                "filename": results[index].filename,
+                "file_size": convert_bytes_to_mb(sizes[digests[index]]),
+                "url": contents[digests[index]].url,
+                "storage_key": contents[digests[index]].storage_key,
+                "content_id": contents[digests[index]].id,
+                "width": infos[index].width,
+                "height": infos[index].height,
+                "mime_type": infos[index].mime_type,
+            }
+            for index in stored
+        ]
+        images = await create_images(images_data, user, db)
+    except Exception:
+        await asyncio.gather(*(storage.delete(key) for key in created + orphaned), return_exceptions=True)
+        raise
+    await asyncio.gather(*(storage.delete(key) for key in orphaned), return_exceptions=True)
+    if user is not None and images:
+        await primary_pins.pin(user.uuid)
+
+    for index, digest in digests.items():
+        task = transfers.get(digest)
+        if task is not None and task.exception() is not None:
+            results[index].error = str(task.exception())
+        elif digest not in contents:
+            results[index].error = "Stored content was removed, retry the upload"
+    for index, image in zip(stored, images):
+        results[index].status = "uploaded"
+        results[index].image = ImageResponseSchema.from_image(image)
+
+    return BatchUploadResponseSchema(results=results)
+
+
+def tus_headers(upload_session: Optional[UploadSession] = None, **headers: str) -> dict[str, str]:
+    headers = {"Tus-Resumable": TUS_VERSION, "Cache-Control": "no-store", **headers}
+    if upload_session is not None:
+        headers["Upload-Offset"] = str(upload_session.offset)
+        headers["Upload-Length"] = str(upload_session.length)
+        headers["Upload-Expires"] = format_datetime(
+            upload_session.expires_at.replace(tzinfo=datetime.UTC), usegmt=True
+        )
+    return {name.replace("_", "-"): value for name, value in headers.items()}
+
+
+async def get_own_upload_session(session_uuid: str, user: Optional[User], db: AsyncSession) -> UploadSession:
+    try:
+        upload_session = await get_upload_session(session_uuid, db)
+    except ValueError:
+        upload_session = None
+    if (
+        upload_session is None
+        or upload_session.user_id != (user.id if user else None)
+        or upload_session.expires_at < utcnow()
+    ):
+        raise HTTPException(status_code=404, detail="Upload not found", headers=tus_headers())
+    return upload_session
+
+
+@app.options("/uploads/")
+async def resumable_upload_options():
+    return Response(
+        status_code=status.HTTP_204_NO_CONTENT,
+        headers=tus_headers(
+            Tus_Version=TUS_VERSION,
+            Tus_Extension=TUS_EXTENSIONS,
+            Tus_Max_Size=str(int(config.RESUMABLE_UPLOAD_MAX_SIZE_MB * 1000**2)),
+        ),
     )
 
 
+@app.post("/uploads/", status_code=status.HTTP_201_CREATED)
+async def create_resumable_upload(
+    request: Request,
+    user: Optional[User] = Depends(get_optional_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Start a resumable upload (tus 1.0 "creation"): `Upload-Length` gives the file size and `Upload-Metadata`
+    carries `filename` and `filetype`. The file is then sent with PATCH /uploads/<id> in as many requests as
+    needed, HEAD tells where to resume after a dropped connection, and POST /uploads/<id>/complete stores it.
+    """
+    max_size = int(config.RESUMABLE_UPLOAD_MAX_SIZE_MB * 1000**2)
+    try:
+        length = int(request.headers["upload-length"])
+        metadata = parse_upload_metadata(request.headers.get("upload-metadata", ""))
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="A valid Upload-Length header is required", headers=tus_headers())
+    except ValidationError as exc:
+        raise HTTPException(status_code=400, detail=str(exc), headers=tus_headers())
+    if length <= 0:
+        raise HTTPException(status_code=400, detail="A valid Upload-Length header is required", headers=tus_headers())
+    if length > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File size exceeds {config.RESUMABLE_UPLOAD_MAX_SIZE_MB:g} MB limit",
+            headers=tus_headers(),
+        )
+    quota = await get_quota(user, db)
+    try:
+        quota.check(size=length)
+    except QuotaExceededError as exc:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(exc), headers=tus_headers())
+    upload_session = await create_upload_session(
+        metadata.get("filename") or "upload",
+        metadata.get("filetype") or "application/octet-stream",
+        length,
+        user,
+        config.UPLOAD_SESSION_TTL,
+        db,
+    )
+    location = f"/uploads/{upload_session.uuid}"
+    return Response(status_code=status.HTTP_201_CREATED, headers=tus_headers(upload_session, Location=location))
+
+
+@app.head("/uploads/{session_uuid}")
+async def resumable_upload_status(
+    session_uuid: str,
+    user: Optional[User] = Depends(get_optional_user),
+    db: AsyncSession = Depends(get_db),
+):
+    upload_session = await get_own_upload_session(session_uuid, user, db)
+    return Response(status_code=status.HTTP_200_OK, headers=tus_headers(upload_session))
+
+
+@app.patch("/uploads/{session_uuid}")
+async def append_resumable_upload(
+    session_uuid: str,
+    request: Request,
+    user: Optional[User] = Depends(get_optional_user),
+    db: AsyncSession = Depends(get_db),
+):
+    upload_session = await get_own_upload_session(session_uuid, user, db)
+    await db.close()
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Expected application/offset+octet-stream",
+            headers=tus_headers(),
+        )
+    try:
+        offset = int(request.headers["upload-offset"])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="A valid Upload-Offset header is required", headers=tus_headers())
+    if offset != upload_session.offset:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload-Offset doesn't match the upload",
+            headers=tus_headers(upload_session),
+        )
+
+    try:
+        name, size = await staging_area.write_chunk(
+            upload_session.uuid, offset, until_disconnect(request.stream()), upload_session.length - offset
+        )
+    except FileTooLargeError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc), headers=tus_headers(upload_session)
+        )
+    if size:
+        if not await add_upload_chunk(upload_session, offset, size, name, config.UPLOAD_SESSION_TTL, db):
+            await staging_area.remove_chunk(upload_session.uuid, name)
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Upload-Offset doesn't match the upload",
+                headers=tus_headers(),
+            )
+        upload_session = await get_upload_session(session_uuid, db)
+    else:
+        await staging_area.remove_chunk(upload_session.uuid, name)
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=tus_headers(upload_session))
+
+
+@app.post("/uploads/{session_uuid}/complete", response_model=ImageResponseSchema)
+async def complete_resumable_upload(
+    session_uuid: str,
+    user: Optional[User] = Depends(get_optional_user),
+    db: AsyncSession = Depends(get_db),
+    storage: StorageBackend = Depends(get_storage),
+):
+    upload_session = await get_own_upload_session(session_uuid, user, db)
+    if upload_session.offset < upload_session.length:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Upload is incomplete", headers=tus_headers(upload_session)
+        )
+    # Checked again, other uploads may have used up the quota since this one was created
+    quota = await get_quota(user, db)
+    try:
+        quota.check(size=upload_session.length)
+    except QuotaExceededError as exc:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(exc), headers=tus_headers())
+    names = await get_upload_chunk_names(upload_session.id, db)
+    chunks = staging_area.iter_chunks(upload_session.uuid, names)
+    try:
+        info, _ = await sniff_chunks(chunks)
+    except InvalidImageError as exc:
+        # Can never complete, dropped right away instead of waiting for the sweeper
+        await delete_upload_session(upload_session.id, db)
+        await db.commit()
+        await staging_area.remove_session(upload_session.uuid)
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(exc))
+    finally:
+        await chunks.aclose()
+    await db.close()
+
+    # Hashing the staged file first is a local read, and saves the transfer when the content is already stored
+    digest = await staging_area.hash_chunks(upload_session.uuid, names)
+    stored_file = None
+    if await get_content_by_hash(digest, db) is None:
+        await db.close()
+        try:
+            stored_file = await storage.save(
+                staging_area.iter_chunks(upload_session.uuid, names),
+                upload_session.filename,
+                info.mime_type,
+            )
+        except StorageError as exc:
+            raise HTTPException(status_code=502, detail=str(exc))
+
+    if not await delete_upload_session(upload_session.id, db):
+        # Completed by a concurrent request
+        await db.rollback()
+        if stored_file is not None:
+            content = await get_content_by_hash(digest, db)
+            if content is None or content.storage_key != stored_file.key:
+                await storage.delete(stored_file.key)
+        raise HTTPException(status_code=404, detail="Upload not found")
+    image = await save_image(
+        upload_session.filename, upload_session.length, digest, stored_file, info, user, db, storage
+    )
+    await staging_area.remove_session(upload_session.uuid)
+    return ImageResponseSchema.from_image(image)
+
+
+@app.delete("/uploads/{session_uuid}")
+async def cancel_resumable_upload(
+    session_uuid: str,
+    user: Optional[User] = Depends(get_optional_user),
+    db: AsyncSession = Depends(get_db),
+):
+    upload_session = await get_own_upload_session(session_uuid, user, db)
+    await delete_upload_session(upload_session.id, db)
+    await db.commit()
+    await staging_area.remove_session(upload_session.uuid)
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=tus_headers())
+
+
+@app.post("/direct-uploads/", response_model=DirectUploadResponseSchema, status_code=status.HTTP_201_CREATED)
+async def presign_direct_upload(
+    upload: DirectUploadSchema = Body(...),
+    user: Optional[User] = Depends(get_optional_user),
+    db: AsyncSession = Depends(get_db),
+    storage: StorageBackend = Depends(get_storage),
+):
+    """
+    Presign an upload straight to storage, for files the API never has to receive. The client sends the file
+    as `upload` describes before `expires_at`, then POSTs to `confirm_url` to have it checked and added.
+    """
+    max_size = int(config.DIRECT_UPLOAD_MAX_SIZE_MB * 1000**2)
+    if upload.size > max_size:
+        raise HTTPException(status_code=400, detail=f"File size exceeds {config.DIRECT_UPLOAD_MAX_SIZE_MB:g} MB limit")
+    quota = await get_quota(user, db)
+    quota.check(size=upload.size)
+    sha256 = upload.sha256.lower()
+    # Either is only the client's claim, the stored file has to sniff as this type to be confirmed
+    content_type = upload.content_type
+    if not file_extension(content_type):
+        content_type = mimetypes.guess_type(upload.filename)[0] or content_type
+    presigned = storage.presign_upload(sha256, upload.filename, content_type, upload.size, config.DIRECT_UPLOAD_TTL)
+    if presigned is None:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=f"Direct uploads aren't supported by the {storage.name} storage backend",
+        )
+    # Kept for as long again as the upload may take, so one started just before expiry can still be confirmed
+    direct_upload = await create_direct_upload(
+        upload.filename, upload.size, sha256, presigned.key, user, 2 * config.DIRECT_UPLOAD_TTL, db
+    )
+    return DirectUploadResponseSchema(
+        upload_uuid=direct_upload.uuid,
+        upload=PresignedUploadSchema(
+            url=presigned.url, method=presigned.method, fields=presigned.fields, headers=presigned.headers
+        ),
+        expires_at=(utcnow() + datetime.timedelta(seconds=config.DIRECT_UPLOAD_TTL)).isoformat(),
+        confirm_url=f"/direct-uploads/{direct_upload.uuid}/confirm",
+    )
+
+
+async def get_own_direct_upload(upload_uuid: str, user: Optional[User], db: AsyncSession) -> DirectUpload:
+    try:
+        direct_upload = await get_direct_upload(upload_uuid, db)
+    except ValueError:
+        direct_upload = None
+    if (
+        direct_upload is None
+        or direct_upload.user_id != (user.id if user else None)
+        or direct_upload.expires_at < utcnow()
+    ):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return direct_upload
+
+
+@app.post("/direct-uploads/{upload_uuid}/confirm", response_model=ImageResponseSchema)
+async def confirm_direct_upload(
+    upload_uuid: str,
+    user: Optional[User] = Depends(get_optional_user),
+    db: AsyncSession = Depends(get_db),
+    storage: StorageBackend = Depends(get_storage),
+):
+    direct_upload = await get_own_direct_upload(upload_uuid, user, db)
+    quota = await get_quota(user, db)
+    quota.check(size=direct_upload.length)
+    try:
+        stored_file = await storage.stat(direct_upload.storage_key)
+        if stored_file is None:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="File hasn't been uploaded yet")
+        info = await verify_stored_file(stored_file, direct_upload.length, direct_upload.sha256, storage)
+    except (ValidationError, InvalidImageError) as exc:
+        # Can never be confirmed, dropped right away instead of waiting for the sweeper
+        await delete_direct_upload(direct_upload.id, db)
+        await db.commit()
+        await discard_uploaded_file(direct_upload.sha256, direct_upload.storage_key, db, storage)
+        status_code = 400 if isinstance(exc, ValidationError) else status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        raise HTTPException(status_code=status_code, detail=str(exc))
+    except StorageError as exc:
+        raise HTTPException(status_code=502, detail=str(exc))
+
+    if not await delete_direct_upload(direct_upload.id, db):
+        # Confirmed by a concurrent request
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Upload not found")
+    image = await save_image(
+        direct_upload.filename, stored_file.size, direct_upload.sha256, stored_file, info, user, db, storage
+    )
+    return ImageResponseSchema.from_image(image)
+
+
+@app.get(config.MEDIA_URL_PREFIX + "/{key:path}")
+async def serve_media(key: str, storage: StorageBackend = Depends(get_storage)):
+    response = await storage.get_response(key)
+    if response is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return response
+
+
+async def get_image_with_fallback(image_uuid: str, db: AsyncSession, primary_db: AsyncSession) -> Optional[Image]:
+    image = await get_image_by_uuid(image_uuid, db)
+    if image is None and db is not primary_db:
+        # Uploaded moments ago and not on the replica yet, or by someone the read-your-writes pin doesn't cover
+        image = await get_image_by_uuid(image_uuid, primary_db)
+    return image
+
+
+@app.get("/image-variants/{image_uuid}/{name}")
+async def image_variant(
+    image_uuid: str,
+    name: str,
+    db: AsyncSession = Depends(get_read_db),
+    primary_db: AsyncSession = Depends(get_db),
+    cache: MetadataCache = Depends(get_metadata_cache),
+    storage: StorageBackend = Depends(get_storage),
+):
+    spec = VARIANTS_BY_NAME.get(name)
+    if spec is None:
+        raise HTTPException(status_code=404, detail="Unknown variant")
+    cache_key = f"image-variant:{image_uuid}:{name}"
+    cached = await cache.get(cache_key)
+    if cached is None:
+        try:
+            image = await get_image_with_fallback(image_uuid, db, primary_db)
+        except ValueError:
+            image = None
+        if not image:
+            raise HTTPException(status_code=400, detail="Image not found")
+        if image.content_id is None:
+            raise HTTPException(status_code=404, detail="Variant not available")
+        content = await db.get(ImageContent, image.content_id) or await primary_db.get(ImageContent, image.content_id)
+        # Rendering can take a while, don't hold the connections meanwhile
+        await db.close()
+        await primary_db.close()
+        try:
+            variant = await get_or_create_variant(content.id, content.storage_key, spec, storage)
+            cached = {"url": variant.url}
+        except UnsupportedImageError:
+            # Not an image Pillow can read, remembered so it isn't decoded again on every request
+            cached = {"url": None}
+        except StorageError as exc:
+            raise HTTPException(status_code=502, detail=str(exc))
+        await cache.set(cache_key, cached)
+
+    if cached["url"] is None:
+        raise HTTPException(status_code=404, detail="Variant not available")
+    return RedirectResponse(
+        cached["url"],
+        status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+        headers={"Cache-Control": f"public, max-age={config.PREVIEW_MAX_AGE}"},
+    )
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
 @app.get("/image-preview/{image_uuid}")
-def preview_image(request: Request, db: Session = Depends(get_db)):
+async def preview_image(
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    primary_db: AsyncSession = Depends(get_db),
+    cache: MetadataCache = Depends(get_metadata_cache),
+):
     image_uuid = request.path_params["image_uuid"]
-    image = get_image_by_uuid(image_uuid, db)
-    if not image:
-        raise HTTPException(
-            status_code=400,
-            detail="Image not found",
+    cache_key = f"image-preview:{image_uuid}"
+    # Image metadata never changes after upload, so the cached body and its ETag stay valid for the TTL
+    cached = await cache.get(cache_key)
+    if cached is None:
+        try:
+            image = await get_image_with_fallback(image_uuid, db, primary_db)
+        except ValueError:
+            image = None
+        if not image:
+            raise HTTPException(
+                status_code=400,
+                detail="Image not found",
+            )
+        body = json.dumps(
+            {
+                "image_url": image.url,
+                "filename": image.filename,
+                "file_size": image.file_size,
+                "upload_time": image.upload_time.isoformat(),
+                "width": image.width,
+                "height": image.height,
+                "mime_type": image.mime_type,
+                "variants": variant_urls(image),
+            }
         )
-    return {
-        "image_url": image.url,
-        "filename": image.filename,
-        "file_size": image.file_size,
-        "upload_time": image.upload_time.isoformat(),
-    }
+        cached = {"body": body, "etag": f'"{hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]}"'}
+        await cache.set(cache_key, cached)
+
+    headers = {"ETag": cached["etag"], "Cache-Control": f"public, max-age={config.PREVIEW_MAX_AGE}"}
+    if etag_matches(request.headers.get("if-none-match"), cached["etag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=cached["body"], media_type="application/json", headers=headers)
 
 
-@app.get("/images/", response_model=ImageListResponseSchema)
-@jwt_required
-def list_images(request: Request, db: Session = Depends(get_db)):
-    token = extract_jwt_token_from_request(request.headers)
+async def stream_images_ndjson(
+    user_id: int, after: Optional[tuple], filters: ImageFilters, replica: Optional[AsyncEngine]
+):
+    # Runs after the request's session is closed, so the stream owns its own session on the same database
+    # Lines are sent in chunks of about NDJSON_CHUNK_SIZE bytes rather than one message per image
+    buffer = bytearray()
+    async with read_session(replica) as db:
+        async for row in iter_images_by_user_id(user_id, db, after, filters=filters):
+            buffer += orjson.dumps(image_listing_item(row), option=orjson.OPT_APPEND_NEWLINE)
+            if len(buffer) >= NDJSON_CHUNK_SIZE:
+                yield bytes(buffer)
+                buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+@app.get("/images/", response_model=ImageListResponseSchema, response_class=ORJSONResponse)
+async def list_images(
+    cursor: Optional[str] = None,
+    limit: int = Query(config.IMAGES_PAGE_SIZE, ge=1, le=config.IMAGES_MAX_PAGE_SIZE),
+    stream: bool = False,
+    q: Optional[str] = Query(None, max_length=64, description="Case-insensitive filename substring"),
+    prefix: Optional[str] = Query(None, max_length=64, description="Case-insensitive filename prefix"),
+    uploaded_after: Optional[datetime.datetime] = None,
+    uploaded_before: Optional[datetime.datetime] = None,
+    min_size: Optional[float] = Query(None, ge=0, description="In MB"),
+    max_size: Optional[float] = Query(None, ge=0, description="In MB"),
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """The user's images, newest first, optionally narrowed down by filename, upload date and size."""
     try:
-        user = get_user_by_token(token, db)
+        after = decode_cursor(cursor) if cursor else None
     except ValidationError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
+    filters = ImageFilters(
+        search=q,
+        prefix=prefix,
+        uploaded_after=to_naive_utc(uploaded_after) if uploaded_after else None,
+        uploaded_before=to_naive_utc(uploaded_before) if uploaded_before else None,
+        min_size=min_size,
+        max_size=max_size,
+    )
 
-    images = get_images_by_user_id(user.id, db)
+    if stream:
+        return StreamingResponse(
+            stream_images_ndjson(user.id, after, filters, db.info.get("replica")), media_type="application/x-ndjson"
+        )
 
-    return ImageListResponseSchema(
-        images=[
-            ImageResponseSchema(
-                image_uuid=image.uuid,
-                image_url=image.url,
-                filename=image.filename,
-                file_size=image.file_size,
-                upload_time=image.upload_time.isoformat(),
-            )
-            for image in images
-        ]
+    rows = await get_images_page(user.id, db, limit + 1, after, filters)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].upload_time, rows[-1].id)
+
+    # Plain dicts straight to orjson: response_model only documents the shape, returning a Response skips
+    # building and re-validating a schema per row
+    return ORJSONResponse({"images": [image_listing_item(row) for row in rows], "next_cursor": next_cursor})
+
+
+@app.delete("/images/{image_uuid}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_image(
+    image_uuid: str,
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    storage: StorageBackend = Depends(get_storage),
+    cache: MetadataCache = Depends(get_metadata_cache),
+):
+    try:
+        image_uuid = UUID(image_uuid)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Image not found")
+    deleted = await purge_images(db, storage, cache, Image.uuid == image_uuid, Image.user_id == user.id)
+    if not deleted:
+        raise HTTPException(status_code=400, detail="Image not found")
+    await primary_pins.pin(user.uuid)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@app.post("/images/delete/", response_model=DeleteImagesResponseSchema)
+async def delete_images_batch(
+    delete_data: DeleteImagesSchema = Body(...),
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    storage: StorageBackend = Depends(get_storage),
+    cache: MetadataCache = Depends(get_metadata_cache),
+):
+    """Delete up to DELETE_BATCH_MAX_IMAGES of the user's images with a few set-based statements."""
+    image_uuids = list(dict.fromkeys(delete_data.image_uuids))
+    if not image_uuids:
+        raise HTTPException(status_code=400, detail="No images given")
+    if len(image_uuids) > config.DELETE_BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {config.DELETE_BATCH_MAX_IMAGES} images")
+    deleted = await purge_images(db, storage, cache, Image.uuid.in_(image_uuids), Image.user_id == user.id)
+    await primary_pins.pin(user.uuid)
+    found = set(deleted)
+    return DeleteImagesResponseSchema(
+        deleted=deleted, not_found=[image_uuid for image_uuid in image_uuids if image_uuid not in found]
     )
@@ -0,0 +1,111 @@
+"""
+Offline benchmark suite, nothing but the local machine is involved:
+
+    python -m benchmarks [--only auth,images,preview,upload] [--scale 0.1] [--output results.json]
+
+Runs the API in-process against a fresh SQLite database (or --database-url, which must be a throwaway
+database since its tables are dropped) with in-memory storage, and prints the results as JSON.
+Compare two runs with `python -m benchmarks.compare before.json after.json`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def configure_environment(database_url: str):
+    # Must happen before anything imports config.py, worker processes inherit it
+    os.environ["PROD_EXTERNAL_DB_URL"] = database_url
+    os.environ["ASYNC_DATABASE_URL"] = ""
+    os.environ["DEPLOY"] = "False"
+    os.environ["STORAGE_BACKEND"] = "memory"
+    os.environ["METADATA_CACHE_URL"] = ""
+    # The benchmarks hammer single routes from a single client on purpose
+    os.environ["RATE_LIMIT_ENABLED"] = "False"
+    os.environ.setdefault("JWT_ENCRYPTION_ALGORITHM", "HS256")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+async def run(names: list[str], scale: float) -> list[dict]:
+    import httpx
+
+    from app import app
+    from benchmarks.suite import BENCHMARKS
+    from engine import Base, async_engine
+
+    async with async_engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+
+    results = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for name in names:
+                print(f"Running {name}...", file=sys.stderr)
+                for result in await BENCHMARKS[name](client, scale):
+                    result["benchmark"] = name
+                    results.append(result)
+                    latency = result["latency_ms"]
+                    print(
+                        f"  {result['name']} {result['params']}: {result['ops_per_second']} ops/s, "
+                        f"p50 {latency['p50']} ms, p99 {latency['p99']} ms",
+                        file=sys.stderr,
+                    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite")
+    parser.add_argument("--only", default="auth,images,preview,upload", help="Comma separated benchmarks to run")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the number of iterations")
+    parser.add_argument("--database-url", default="", help="Throwaway database, a temporary SQLite file by default")
+    parser.add_argument("--output", default="", help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    database_path = None
+    database_url = args.database_url
+    if not database_url:
+        database_path = os.path.join(tempfile.mkdtemp(prefix="benchmarks-"), "benchmarks.db")
+        database_url = f"sqlite:///{database_path}"
+    configure_environment(database_url)
+
+    names = [name.strip() for name in args.only.split(",") if name.strip()]
+    started_at = time.time()
+    try:
+        results = asyncio.run(run(names, args.scale))
+    finally:
+        if database_path and os.path.exists(database_path):
+            os.remove(database_path)
+
+    report = {
+        "commit": git_commit(),
+        "started_at": started_at,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": database_url.split(":", 1)[0],
+        "scale": args.scale,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Compare two benchmark reports:
+
+    python -m benchmarks.compare before.json after.json [--threshold 10]
+
+Exits with status 1 when any p50 latency got worse by more than `threshold` percent.
+"""
+
+import argparse
+import json
+import sys
+
+
+def result_key(result: dict) -> tuple:
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed p50 regression in percent")
+    args = parser.parse_args()
+
+    with open(args.before) as file:
+        before = {result_key(result): result for result in json.load(file)["results"]}
+    with open(args.after) as file:
+        after = {result_key(result): result for result in json.load(file)["results"]}
+
+    regressions = 0
+    for key, new in after.items():
+        old = before.get(key)
+        if old is None:
+            continue
+        old_p50, new_p50 = old["latency_ms"]["p50"], new["latency_ms"]["p50"]
+        change = (new_p50 - old_p50) / old_p50 * 100 if old_p50 else 0.0
+        flag = ""
+        if change > args.threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{key[0]} {key[1]}: p50 {old_p50} -> {new_p50} ms ({change:+.1f}%){flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
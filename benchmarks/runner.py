@@ -0,0 +1,69 @@
+import asyncio
+import statistics
+import time
+from typing import Awaitable, Callable
+
+import httpx
+
+
+class BenchmarkFailed(Exception):
+    pass
+
+
+def summarize(latencies: list[float]) -> dict:
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    if len(latencies_ms) > 1:
+        percentiles = statistics.quantiles(latencies_ms, n=100, method="inclusive")
+        p50, p90, p99 = percentiles[49], percentiles[89], percentiles[98]
+    else:
+        p50 = p90 = p99 = latencies_ms[0]
+    return {
+        "mean": round(statistics.fmean(latencies_ms), 3),
+        "min": round(latencies_ms[0], 3),
+        "p50": round(p50, 3),
+        "p90": round(p90, 3),
+        "p99": round(p99, 3),
+        "max": round(latencies_ms[-1], 3),
+    }
+
+
+async def measure(
+    name: str,
+    params: dict,
+    request: Callable[[int], Awaitable[httpx.Response]],
+    iterations: int,
+    concurrency: int = 1,
+    expected_status: tuple[int, ...] = (200,),
+    bytes_per_request: int = 0,
+) -> dict:
+    """
+    Run `request(i)` for i in range(iterations) on `concurrency` concurrent workers
+    and time every call. Any unexpected status code fails the benchmark.
+    """
+    latencies: list[float] = []
+    counter = iter(range(iterations))
+
+    async def worker():
+        for index in counter:
+            start = time.perf_counter()
+            response = await request(index)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code not in expected_status:
+                raise BenchmarkFailed(f"{name}: unexpected {response.status_code} {response.text[:200]}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "name": name,
+        "params": params,
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "total_seconds": round(elapsed, 4),
+        "ops_per_second": round(iterations / elapsed, 2),
+        "latency_ms": summarize(latencies),
+    }
+    if bytes_per_request:
+        result["megabytes_per_second"] = round(bytes_per_request * iterations / elapsed / 1000**2, 2)
+    return result
@@ -0,0 +1,170 @@
+"""
+The benchmarks themselves. Imported only after `benchmarks.__main__` has set up the environment,
+because config.py reads it at import time.
+"""
+
+import datetime
+import os
+import struct
+import uuid
+import zlib
+
+import httpx
+from sqlalchemy import insert
+
+from api.models import Image, ImageContent, User
+from benchmarks.runner import measure
+from engine import AsyncSessionLocal
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+def random_png(size: int) -> bytes:
+    """A valid PNG header followed by random bytes, passes upload sniffing and never deduplicates."""
+    ihdr = struct.pack(">IIBBBBB", 64, 64, 8, 2, 0, 0, 0)
+    header = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", len(ihdr)) + b"IHDR" + ihdr
+    header += struct.pack(">I", zlib.crc32(b"IHDR" + ihdr))
+    return header + os.urandom(max(size - len(header), 0))
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str = "benchmark-password") -> dict:
+    await client.post("/register/", json={"email": email, "password": password})
+    response = await client.post("/login/", json={"email": email, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+async def seed_images(email: str, count: int) -> None:
+    """Insert `count` images for the user directly, one per second going back from now."""
+    async with AsyncSessionLocal() as db:
+        user_id = (await db.execute(User.__table__.select().where(User.email == email))).first().id
+        content_id = (
+            await db.execute(
+                insert(ImageContent)
+                .values(
+                    sha256=uuid.uuid4().hex * 2, storage_key="seed.png", url="/media/seed.png", size=1, ref_count=0
+                )
+                .returning(ImageContent.id)
+            )
+        ).scalar_one()
+        now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+        rows = [
+            {
+                "uuid": uuid.uuid4(),
+                "filename": f"image-{index}.png",
+                "file_size": 0.5,
+                "url": "/media/seed.png",
+                "storage_key": "seed.png",
+                "content_id": content_id,
+                "upload_time": now - datetime.timedelta(seconds=index),
+                "user_id": user_id,
+            }
+            for index in range(count)
+        ]
+        for start in range(0, len(rows), 5000):
+            await db.execute(insert(Image), rows[start : start + 5000])
+        await db.commit()
+
+
+@benchmark("auth")
+async def bench_auth(client: httpx.AsyncClient, scale: float) -> list[dict]:
+    # bcrypt-bound: both go through the password hashing process pool
+    iterations = max(4, int(40 * scale))
+    run_id = uuid.uuid4().hex[:8]
+    register = await measure(
+        "register",
+        {},
+        lambda i: client.post("/register/", json={"email": f"user-{run_id}-{i}@benchmark.dev", "password": "secret"}),
+        iterations,
+        concurrency=4,
+    )
+    login_result = await measure(
+        "login",
+        {},
+        lambda i: client.post("/login/", json={"email": f"user-{run_id}-{i}@benchmark.dev", "password": "secret"}),
+        iterations,
+        concurrency=4,
+    )
+    return [register, login_result]
+
+
+@benchmark("images")
+async def bench_images(client: httpx.AsyncClient, scale: float) -> list[dict]:
+    results = []
+    for rows in (100, 1000, 10_000):
+        email = f"images-{rows}-{uuid.uuid4().hex[:8]}@benchmark.dev"
+        headers = await login(client, email)
+        await seed_images(email, rows)
+        iterations = max(10, int(200 * scale))
+        results.append(
+            await measure(
+                "images_first_page",
+                {"rows": rows, "limit": 50},
+                lambda i: client.get("/images/", params={"limit": 50}, headers=headers),
+                iterations,
+                concurrency=8,
+            )
+        )
+        results.append(
+            await measure(
+                "images_stream_all",
+                {"rows": rows},
+                lambda i: client.get("/images/", params={"stream": "true"}, headers=headers),
+                max(3, int(20 * scale)),
+            )
+        )
+    return results
+
+
+@benchmark("preview")
+async def bench_preview(client: httpx.AsyncClient, scale: float) -> list[dict]:
+    headers = await login(client, f"preview-{uuid.uuid4().hex[:8]}@benchmark.dev")
+    response = await client.post(
+        "/upload/", files={"file": ("hot.png", random_png(1024), "image/png")}, headers=headers
+    )
+    response.raise_for_status()
+    url = f"/image-preview/{response.json()['image_uuid']}"
+    etag = (await client.get(url)).headers["etag"]
+    iterations = max(50, int(2000 * scale))
+    return [
+        await measure("preview_hot", {}, lambda i: client.get(url), iterations, concurrency=16),
+        await measure(
+            "preview_not_modified",
+            {},
+            lambda i: client.get(url, headers={"If-None-Match": etag}),
+            iterations,
+            concurrency=16,
+            expected_status=(304,),
+        ),
+    ]
+
+
+@benchmark("upload")
+async def bench_upload(client: httpx.AsyncClient, scale: float) -> list[dict]:
+    headers = await login(client, f"upload-{uuid.uuid4().hex[:8]}@benchmark.dev")
+    results = []
+    for size in (10_000, 100_000, 1_000_000):
+        iterations = max(5, int(100 * scale))
+        # Random content, so deduplication doesn't skip the transfer
+        payloads = [random_png(size) for _ in range(iterations)]
+        results.append(
+            await measure(
+                "upload",
+                {"bytes": size},
+                lambda i: client.post(
+                    "/upload/", files={"file": (f"file-{i}.png", payloads[i], "image/png")}, headers=headers
+                ),
+                iterations,
+                concurrency=4,
+                bytes_per_request=size,
+            )
+        )
+    return results
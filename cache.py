@@ -0,0 +1,172 @@
+import hashlib
+import json
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import config
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter. `might_contain` never returns a false negative,
+    so a negative answer can be trusted without consulting the source of truth.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.size / 8))
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Kirsch-Mitzenmacher double hashing: k positions out of a single digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def might_contain(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def is_saturated(self) -> bool:
+        return self.count > self.capacity
+
+
+class TTLCache:
+    """Thread-safe, bounded LRU cache where every entry expires after its own TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class MetadataCache(ABC):
+    """Key/value cache for small JSON-serializable documents."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: dict, ttl: Optional[float] = None):
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str):
+        pass
+
+    async def close(self):
+        pass
+
+
+class MemoryMetadataCache(MetadataCache):
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[dict]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: dict, ttl: Optional[float] = None):
+        self._cache.set(key, value, ttl)
+
+    async def delete(self, key: str):
+        self._cache.delete(key)
+
+
+class RedisMetadataCache(MetadataCache):
+    """Shared cache on any server speaking the Redis protocol (Redis, Valkey, KeyDB, DragonflyDB...)."""
+
+    def __init__(self, url: str, ttl: float, prefix: str = "image-uploader:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The `redis` package is required to use a redis:// METADATA_CACHE_URL")
+        self._client = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[dict]:
+        value = await self._client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: dict, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        await self._client.set(self.prefix + key, json.dumps(value), px=int(ttl * 1000))
+
+    async def delete(self, key: str):
+        await self._client.delete(self.prefix + key)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+_metadata_cache: Optional[MetadataCache] = None
+
+
+def create_metadata_cache(url: str, maxsize: int, ttl: float) -> MetadataCache:
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisMetadataCache(url, ttl)
+    return MemoryMetadataCache(maxsize, ttl)
+
+
+def get_metadata_cache() -> MetadataCache:
+    global _metadata_cache
+    if _metadata_cache is None:
+        _metadata_cache = create_metadata_cache(
+            config.METADATA_CACHE_URL, config.METADATA_CACHE_SIZE, config.METADATA_CACHE_TTL
+        )
+    return _metadata_cache
+
+
+async def close_metadata_cache():
+    global _metadata_cache
+    if _metadata_cache is not None:
+        await _metadata_cache.close()
+        _metadata_cache = None
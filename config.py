@@ -1,6 +1,8 @@
+import os
+
 from dotenv import load_dotenv
 
-from utils import EnvParser, generate_jwt_secret_key
+from utils import EnvParser, to_async_database_url
 
 env = EnvParser()
 
@@ -9,9 +11,140 @@ load_dotenv()
 CLOUDINARY_CLOUD_NAME = env.str("CLOUDINARY_CLOUD_NAME")
 CLOUDINARY_API_KEY = env.str("CLOUDINARY_API_KEY")
 CLOUDINARY_API_SECRET = env.str("CLOUDINARY_API_SECRET")
-JWT_SECRET_KEY = generate_jwt_secret_key()
 
 DEPLOY = env.bool("DEPLOY", False)
 DATABASE_URL = env.str("PROD_INTERNAL_DB_URL", "") if DEPLOY else env.str("PROD_EXTERNAL_DB_URL", "")
+# Derived from DATABASE_URL (postgresql:// -> postgresql+asyncpg://) unless set explicitly
+ASYNC_DATABASE_URL = env.str("ASYNC_DATABASE_URL", "") or to_async_database_url(DATABASE_URL)
+DB_POOL_SIZE = env.int("DB_POOL_SIZE", 10)
+DB_MAX_OVERFLOW = env.int("DB_MAX_OVERFLOW", 20)
+DB_POOL_PRE_PING = env.bool("DB_POOL_PRE_PING", True)
+# Seconds after which pooled connections are replaced, keeps them under server/proxy idle timeouts
+DB_POOL_RECYCLE = env.int("DB_POOL_RECYCLE", 1800)
+DB_POOL_TIMEOUT = env.int("DB_POOL_TIMEOUT", 30)
+# Read replicas as a JSON list of database URLs, read-only routes are spread over them. Empty reads from the primary
+DATABASE_REPLICA_URLS = env.list("DATABASE_REPLICA_URLS", [])
+ASYNC_DATABASE_REPLICA_URLS = [to_async_database_url(url) for url in DATABASE_REPLICA_URLS]
+# Seconds between replica health checks, a replica that fails one or lags further behind is skipped until it recovers
+DB_REPLICA_CHECK_INTERVAL = env.float("DB_REPLICA_CHECK_INTERVAL", 5.0)
+# Seconds a health check waits for a replica to answer, a replica that hangs is skipped once it runs out
+DB_REPLICA_CHECK_TIMEOUT = env.float("DB_REPLICA_CHECK_TIMEOUT", 2.0)
+DB_REPLICA_MAX_LAG = env.float("DB_REPLICA_MAX_LAG", 10.0)
+# Seconds a user's reads stay on the primary after they wrote something, so they see their own uploads and deletions
+READ_YOUR_WRITES_WINDOW = env.float("READ_YOUR_WRITES_WINDOW", 5.0)
 ALLOWED_ORIGINS = env.list("ALLOWED_ORIGINS", [])
-JWT_ENCRYPTION_ALGORITHM = env.str("JWT_ENCRYPTION_ALGORITHM")
+JWT_ENCRYPTION_ALGORITHM = env.str("JWT_ENCRYPTION_ALGORITHM", "HS256")
+# Shared signing keys as a JSON list of "<kid>:<secret>", newest first: the first one signs, the rest only verify.
+# Leave empty to keep the keys in the database, where they are created and rotated automatically
+JWT_SIGNING_KEYS = env.list("JWT_SIGNING_KEYS", [])
+# Seconds a token stays valid
+JWT_TOKEN_LIFETIME = env.int("JWT_TOKEN_LIFETIME", 3600)
+# Seconds between key rotations of the database keyring, 0 keeps the first key for good
+JWT_KEY_ROTATION_INTERVAL = env.float("JWT_KEY_ROTATION_INTERVAL", 604800.0)
+# Seconds between keyring reloads, a rotated key only starts signing after two of them
+JWT_KEYRING_REFRESH_INTERVAL = env.float("JWT_KEYRING_REFRESH_INTERVAL", 60.0)
+
+# Prometheus metrics on /metrics, request/stage histograms, DB pool gauges and storage error counters
+METRICS_ENABLED = env.bool("METRICS_ENABLED", True)
+
+# Per-route limits are in utils.RATE_LIMITS. Turning them on requires RATE_LIMIT_TRUSTED_PROXIES
+RATE_LIMIT_ENABLED = env.bool("RATE_LIMIT_ENABLED", False)
+# Empty for per-process buckets, or a redis:// URL for buckets shared between nodes
+RATE_LIMIT_STORAGE_URL = env.str("RATE_LIMIT_STORAGE_URL", "")
+RATE_LIMIT_MEMORY_SIZE = env.int("RATE_LIMIT_MEMORY_SIZE", 100_000)
+# How many proxies in front of the API append the address they received from to X-Forwarded-For. The client IP
+# is taken that many entries from the right, entries further left are the client's own to make up. 0 ignores it.
+# Has to be set explicitly with rate limiting on: behind a proxy 0 would put every anonymous client in one bucket
+RATE_LIMIT_TRUSTED_PROXIES = env.int("RATE_LIMIT_TRUSTED_PROXIES", 0)
+if RATE_LIMIT_ENABLED and "RATE_LIMIT_TRUSTED_PROXIES" not in os.environ:
+    raise ValueError("RATE_LIMIT_TRUSTED_PROXIES must be set when RATE_LIMIT_ENABLED is on, 0 if there is no proxy")
+
+# One of "cloudinary", "local" or "memory"
+STORAGE_BACKEND = env.str("STORAGE_BACKEND", "cloudinary")
+LOCAL_STORAGE_ROOT = env.str("LOCAL_STORAGE_ROOT", "media")
+LOCAL_STORAGE_ACCEL_REDIRECT = env.str("LOCAL_STORAGE_ACCEL_REDIRECT", "")
+MEDIA_URL_PREFIX = env.str("MEDIA_URL_PREFIX", "/media")
+
+BLACKLIST_BLOOM_CAPACITY = env.int("BLACKLIST_BLOOM_CAPACITY", 100_000)
+BLACKLIST_BLOOM_ERROR_RATE = env.float("BLACKLIST_BLOOM_ERROR_RATE", 0.001)
+BLACKLIST_CACHE_SIZE = env.int("BLACKLIST_CACHE_SIZE", 10_000)
+# Seconds between incremental reloads of tokens blacklisted by other workers
+BLACKLIST_SYNC_INTERVAL = env.float("BLACKLIST_SYNC_INTERVAL", 5.0)
+# Seconds each sync reaches back before the previous one, so rows whose transaction committed after the previous
+# sync read past them (or stamped by a worker with a slower clock) are still seen. Must exceed both
+BLACKLIST_SYNC_OVERLAP = env.float("BLACKLIST_SYNC_OVERLAP", 60.0)
+# Seconds between deletions of blacklist entries for already expired tokens, 0 disables the sweeper
+BLACKLIST_SWEEP_INTERVAL = env.float("BLACKLIST_SWEEP_INTERVAL", 600.0)
+
+IMAGES_PAGE_SIZE = env.int("IMAGES_PAGE_SIZE", 50)
+IMAGES_MAX_PAGE_SIZE = env.int("IMAGES_MAX_PAGE_SIZE", 500)
+
+# Empty for an in-process cache, or a redis:// URL for a cache shared between workers
+METADATA_CACHE_URL = env.str("METADATA_CACHE_URL", "")
+METADATA_CACHE_SIZE = env.int("METADATA_CACHE_SIZE", 10_000)
+METADATA_CACHE_TTL = env.float("METADATA_CACHE_TTL", 3600.0)
+PREVIEW_MAX_AGE = env.int("PREVIEW_MAX_AGE", 3600)
+
+# bcrypt cost factor, existing hashes with a different cost are upgraded on the next successful login
+BCRYPT_ROUNDS = env.int("BCRYPT_ROUNDS", 12)
+PASSWORD_HASH_WORKERS = env.int("PASSWORD_HASH_WORKERS", 2)
+# Hashes queued or running at once before /register/ and /login/ answer 429
+PASSWORD_HASH_MAX_PENDING = env.int("PASSWORD_HASH_MAX_PENDING", 32)
+# Decoded JWT claims kept per token until the token expires, saves re-verifying the signature on every request
+CLAIMS_CACHE_SIZE = env.int("CLAIMS_CACHE_SIZE", 10_000)
+
+# Largest file accepted by /upload/ and /upload/batch/, in MB (1 MB = 1000^2 bytes)
+MAX_UPLOAD_SIZE_MB = env.float("MAX_UPLOAD_SIZE_MB", 2.0)
+# Largest file accepted through resumable uploads (/uploads/)
+RESUMABLE_UPLOAD_MAX_SIZE_MB = env.float("RESUMABLE_UPLOAD_MAX_SIZE_MB", 100.0)
+UPLOAD_STAGING_ROOT = env.str("UPLOAD_STAGING_ROOT", "staging")
+# Seconds an unfinished resumable upload is kept after its last chunk
+UPLOAD_SESSION_TTL = env.float("UPLOAD_SESSION_TTL", 86400.0)
+UPLOAD_SESSION_SWEEP_INTERVAL = env.float("UPLOAD_SESSION_SWEEP_INTERVAL", 600.0)
+# Largest file clients may send straight to storage through /direct-uploads/
+DIRECT_UPLOAD_MAX_SIZE_MB = env.float("DIRECT_UPLOAD_MAX_SIZE_MB", 100.0)
+# Seconds a presigned upload is valid, it can still be confirmed for as long again afterwards
+DIRECT_UPLOAD_TTL = env.float("DIRECT_UPLOAD_TTL", 900.0)
+# Presigned PUTs for the "local" and "memory" backends, empty secret disables them. A path mounts the
+# stand-in upload server (storage/standin.py) on the API, a URL points at one running on its own
+DIRECT_UPLOAD_URL = env.str("DIRECT_UPLOAD_URL", "/storage-uploads")
+DIRECT_UPLOAD_SECRET = env.str("DIRECT_UPLOAD_SECRET", "")
+# Default per-user quotas, 0 for unlimited. Individual users can be given their own in `user_usage`
+USER_MAX_IMAGES = env.int("USER_MAX_IMAGES", 0)
+USER_MAX_STORAGE_MB = env.float("USER_MAX_STORAGE_MB", 0.0)
+# Seconds between recounts of every user's usage by the worker, 0 disables it
+USAGE_RECONCILE_INTERVAL = env.float("USAGE_RECONCILE_INTERVAL", 3600.0)
+# Storage transfers running at once for a single /upload/batch/ request
+UPLOAD_BATCH_CONCURRENCY = env.int("UPLOAD_BATCH_CONCURRENCY", 8)
+UPLOAD_BATCH_MAX_FILES = env.int("UPLOAD_BATCH_MAX_FILES", 100)
+# Storage deletions running at once when images are deleted
+STORAGE_DELETE_CONCURRENCY = env.int("STORAGE_DELETE_CONCURRENCY", 8)
+DELETE_BATCH_MAX_IMAGES = env.int("DELETE_BATCH_MAX_IMAGES", 1000)
+# Days images are kept before the worker deletes them, 0 keeps them forever. Users can have their own in `user_usage`
+IMAGE_RETENTION_DAYS = env.int("IMAGE_RETENTION_DAYS", 0)
+IMAGE_RETENTION_SWEEP_INTERVAL = env.float("IMAGE_RETENTION_SWEEP_INTERVAL", 3600.0)
+# Images deleted per transaction by the sweeper, keeps row locks on `images` short
+IMAGE_RETENTION_BATCH_SIZE = env.int("IMAGE_RETENTION_BATCH_SIZE", 500)
+
+# Uploads are sniffed from their first bytes and rejected unless they are images, the header must fit in this many
+IMAGE_HEADER_MAX_BYTES = env.int("IMAGE_HEADER_MAX_BYTES", 65536)
+# Largest width * height accepted, 0 for no limit
+IMAGE_MAX_PIXELS = env.int("IMAGE_MAX_PIXELS", 100_000_000)
+# Derived images as "name:max_width:format" (webp, avif, jpeg or png), served from /image-variants/<uuid>/<name>
+IMAGE_VARIANTS = env.str("IMAGE_VARIANTS", "thumbnail:320:webp,thumbnail-avif:320:avif,medium:1280:webp")
+IMAGE_VARIANT_QUALITY = env.int("IMAGE_VARIANT_QUALITY", 80)
+IMAGE_PROCESS_WORKERS = env.int("IMAGE_PROCESS_WORKERS", 2)
+IMAGE_PROCESS_MAX_PENDING = env.int("IMAGE_PROCESS_MAX_PENDING", 64)
+
+# Background jobs, run by `python worker.py`
+JOB_WORKER_CONCURRENCY = env.int("JOB_WORKER_CONCURRENCY", 4)
+# Seconds an idle worker waits before polling the jobs table again
+JOB_POLL_INTERVAL = env.float("JOB_POLL_INTERVAL", 1.0)
+# A job running longer than JOB_TIMEOUT is cancelled and retried, a claimed job not reported back
+# within JOB_VISIBILITY_TIMEOUT (e.g. its worker died) is handed to another worker
+JOB_TIMEOUT = env.float("JOB_TIMEOUT", 240.0)
+JOB_VISIBILITY_TIMEOUT = env.float("JOB_VISIBILITY_TIMEOUT", 300.0)
+JOB_MAX_ATTEMPTS = env.int("JOB_MAX_ATTEMPTS", 5)
+# Seconds before the first retry, doubled on every further attempt up to JOB_RETRY_BACKOFF_MAX
+JOB_RETRY_BACKOFF = env.float("JOB_RETRY_BACKOFF", 10.0)
+JOB_RETRY_BACKOFF_MAX = env.float("JOB_RETRY_BACKOFF_MAX", 3600.0)
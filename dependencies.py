@@ -0,0 +1,113 @@
+import time
+from typing import Optional
+from uuid import UUID
+
+import jwt
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.blacklist import blacklist_cache, token_digest, token_expiry
+from api.crud.user import get_user_with_blacklist_status
+from api.jwt_keys import jwt_keyring
+from api.models import User
+from api.utils import decode_jwt_claims, extract_jwt_token_from_request
+from cache import TTLCache
+from config import CLAIMS_CACHE_SIZE
+from engine import get_db, primary_pins, read_session, replicas
+from metrics import stage_timer
+
+# token -> (user UUID, kid), each entry lives exactly as long as the token stays valid
+claims_cache = TTLCache(maxsize=CLAIMS_CACHE_SIZE, ttl=0)
+
+
+def get_token(request: Request) -> Optional[str]:
+    return extract_jwt_token_from_request(request.headers)
+
+
+def cached_token_user_uuid(token: str) -> Optional[UUID]:
+    """The user UUID of a token verified before, None when it isn't cached or its key has left the keyring since."""
+    cached = claims_cache.get(token)
+    if cached is None:
+        return None
+    user_uuid, kid = cached
+    if not jwt_keyring.has_key(kid):
+        # Retired or revoked, verifying the token again rejects it
+        claims_cache.delete(token)
+        return None
+    return user_uuid
+
+
+def get_token_user_uuid(token: str) -> UUID:
+    user_uuid = cached_token_user_uuid(token)
+    if user_uuid is not None:
+        return user_uuid
+    try:
+        with stage_timer("token_decode"):
+            claims = decode_jwt_claims(token)
+        user_uuid = UUID(claims["user_uuid"])
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError) as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid token")
+    if "exp" in claims:
+        kid = jwt.get_unverified_header(token).get("kid")
+        claims_cache.set(token, (user_uuid, kid), ttl=claims["exp"] - time.time())
+    return user_uuid
+
+
+async def get_read_db(token: Optional[str] = Depends(get_token), db: AsyncSession = Depends(get_db)):
+    """
+    The session for routes that only read: on a replica, or the request's primary session when no replica is
+    healthy or the user wrote something moments ago (see PrimaryPins).
+    """
+    replica = replicas.pick()
+    if replica is not None and token:
+        try:
+            if await primary_pins.is_pinned(get_token_user_uuid(token)):
+                replica = None
+        except HTTPException:
+            # Routes that don't need a user shouldn't fail on a bad token, the ones that do reject it themselves
+            pass
+    if replica is None:
+        yield db
+        return
+    async with read_session(replica) as read_db:
+        yield read_db
+
+
+async def get_optional_user(
+    token: Optional[str] = Depends(get_token), db: AsyncSession = Depends(get_read_db)
+) -> Optional[User]:
+    """
+    Resolve the request's user with one JWT verification (cached per token) and at most one query:
+    the blacklist is answered from memory when possible and otherwise checked alongside the user lookup.
+    """
+    if not token:
+        return None
+    user_uuid = get_token_user_uuid(token)
+    digest = token_digest(token)
+    with stage_timer("blacklist_check"):
+        blacklisted = await blacklist_cache.lookup(digest)
+    if blacklisted:
+        raise HTTPException(status_code=401, detail="Token is blacklisted")
+    with stage_timer("user_lookup"):
+        user, blacklisted = await get_user_with_blacklist_status(
+            user_uuid, db, token_hash=digest if blacklisted is None else None
+        )
+    if blacklisted:
+        blacklist_cache.remember(digest, token_expiry(token))
+        raise HTTPException(status_code=401, detail="Token is blacklisted")
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    if db.info.get("replica") is not None:
+        # The replica connection isn't needed past the lookup, uploads keep the request open for a long time
+        await db.close()
+    return user
+
+
+async def get_current_user(
+    token: Optional[str] = Depends(get_token), user: Optional[User] = Depends(get_optional_user)
+) -> User:
+    if not token:
+        raise HTTPException(status_code=401, detail="Token is required")
+    return user
@@ -1,16 +1,190 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+import asyncio
+import itertools
+import logging
+from typing import Optional
+from uuid import UUID
 
-from config import DATABASE_URL
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.sql import Select
 
-engine = create_engine(DATABASE_URL)
+from cache import get_metadata_cache
+from config import (
+    ASYNC_DATABASE_REPLICA_URLS,
+    ASYNC_DATABASE_URL,
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_REPLICA_CHECK_TIMEOUT,
+    DB_REPLICA_MAX_LAG,
+    METRICS_ENABLED,
+    READ_YOUR_WRITES_WINDOW,
+)
+from metrics import instrument_engine
+
+logger = logging.getLogger(__name__)
+
+
+def pool_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        # SQLite uses a single-connection or null pool, which take no sizing options
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+
+
+# Sync engine for migrations and maintenance scripts, the API itself only uses the async one
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL))
+if METRICS_ENABLED:
+    instrument_engine(async_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+# Seconds of replay the replica is behind, 0 when it has replayed everything it received or isn't a replica
+POSTGRES_REPLICA_LAG = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def replica_name(replica: AsyncEngine) -> str:
+    return replica.url.host or replica.url.database or "?"
+
+
+class ReplicaSet:
+    """
+    Engines for the read replicas, handed out round-robin. A replica that fails a health check, lags more than
+    `max_lag` seconds behind or drops a connection is skipped until it passes a check again.
+    With none left `pick()` returns None and reads go to the primary.
+    """
+
+    def __init__(self, urls: list[str], max_lag: float, check_timeout: float):
+        self.engines = [create_async_engine(url, **pool_options(url)) for url in urls]
+        self.max_lag = max_lag
+        self.check_timeout = check_timeout
+        self._healthy: list[AsyncEngine] = list(self.engines)
+        self._turn = itertools.count()
+        for replica in self.engines:
+            if METRICS_ENABLED:
+                instrument_engine(replica, pool_gauge=False)
+            event.listen(replica.sync_engine, "handle_error", self._on_error(replica))
+
+    def _on_error(self, replica: AsyncEngine):
+        def handle_error(context):
+            # No connection means connecting failed, so the replica is down rather than the query wrong
+            if context.is_disconnect or context.connection is None:
+                self.mark_down(replica)
+
+        return handle_error
+
+    def pick(self) -> Optional[AsyncEngine]:
+        healthy = self._healthy
+        if not healthy:
+            return None
+        return healthy[next(self._turn) % len(healthy)]
+
+    def mark_down(self, replica: AsyncEngine):
+        if replica in self._healthy:
+            logger.warning("Database replica %s is unavailable, reading from the others", replica_name(replica))
+            # Replaced rather than changed in place, pick() may be reading it from another thread
+            self._healthy = [healthy for healthy in self._healthy if healthy is not replica]
+
+    async def _lag(self, replica: AsyncEngine) -> float:
+        async with asyncio.timeout(self.check_timeout):
+            async with replica.connect() as connection:
+                if connection.dialect.name != "postgresql":
+                    await connection.execute(text("SELECT 1"))
+                    return 0.0
+                return float((await connection.execute(POSTGRES_REPLICA_LAG)).scalar() or 0)
+
+    async def check(self):
+        lags = await asyncio.gather(*(self._lag(replica) for replica in self.engines), return_exceptions=True)
+        healthy = []
+        for replica, lag in zip(self.engines, lags):
+            if isinstance(lag, (SQLAlchemyError, OSError, TimeoutError)):
+                logger.warning("Database replica %s failed its health check: %s", replica_name(replica), lag)
+            elif isinstance(lag, BaseException):
+                raise lag
+            elif self.max_lag > 0 and lag > self.max_lag:
+                logger.warning("Database replica %s is %.1f seconds behind", replica_name(replica), lag)
+            else:
+                healthy.append(replica)
+        self._healthy = healthy
+
+    async def dispose(self):
+        for replica in self.engines:
+            await replica.dispose()
+
+
+replicas = ReplicaSet(ASYNC_DATABASE_REPLICA_URLS, DB_REPLICA_MAX_LAG, check_timeout=DB_REPLICA_CHECK_TIMEOUT)
+
+
+class RoutingSession(Session):
+    """
+    Sends SELECTs to the replica in `info["replica"]` and everything else to the primary. Once the session
+    has written anything its reads go to the primary too, so it always sees its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        replica = self.info.get("replica")
+        if replica is not None and not self.info.get("wrote"):
+            if isinstance(clause, Select) and not self._flushing:
+                return replica.sync_engine
+            self.info["wrote"] = True
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+
+ReadSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False
+)
+
+
+def read_session(replica: Optional[AsyncEngine]) -> AsyncSession:
+    """A session reading from `replica`, or a plain primary session when there is none."""
+    if replica is None:
+        return AsyncSessionLocal()
+    return ReadSessionLocal(info={"replica": replica})
+
+
+class PrimaryPins:
+    """
+    Users whose reads stay on the primary for `window` seconds after they wrote something, however far behind the
+    replicas are. Kept in the metadata cache, which is shared by every worker when it's Redis.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+
+    async def pin(self, user_uuid: UUID):
+        if replicas.engines and self.window > 0:
+            await get_metadata_cache().set(f"primary-pin:{user_uuid}", {}, ttl=self.window)
+
+    async def is_pinned(self, user_uuid: UUID) -> bool:
+        return await get_metadata_cache().get(f"primary-pin:{user_uuid}") is not None
+
+
+primary_pins = PrimaryPins(READ_YOUR_WRITES_WINDOW)
+
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -4,3 +4,31 @@ class UserAlreadyExistsError(Exception):
 
 class ValidationError(Exception):
     pass
+
+
+class FileTooLargeError(Exception):
+    pass
+
+
+class StorageError(Exception):
+    pass
+
+
+class PasswordHasherBusyError(Exception):
+    pass
+
+
+class ImageProcessorBusyError(Exception):
+    pass
+
+
+class UnsupportedImageError(Exception):
+    pass
+
+
+class InvalidImageError(Exception):
+    pass
+
+
+class QuotaExceededError(Exception):
+    pass
@@ -0,0 +1,92 @@
+import io
+from dataclasses import dataclass
+
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from config import (
+    IMAGE_PROCESS_MAX_PENDING,
+    IMAGE_PROCESS_WORKERS,
+    IMAGE_VARIANT_QUALITY,
+    IMAGE_VARIANTS,
+)
+from exceptions import ImageProcessorBusyError, UnsupportedImageError
+from metrics import stage_timer
+from pools import BoundedProcessPool
+
+_PIL_FORMATS = {"webp": "WEBP", "avif": "AVIF", "jpeg": "JPEG", "png": "PNG"}
+
+
+@dataclass(frozen=True)
+class VariantSpec:
+    name: str
+    width: int
+    format: str
+
+    @property
+    def extension(self) -> str:
+        return ".jpg" if self.format == "jpeg" else f".{self.format}"
+
+    @property
+    def content_type(self) -> str:
+        return f"image/{self.format}"
+
+
+def parse_variant_specs(value: str) -> list[VariantSpec]:
+    """
+    Parse "name:width:format,..." (e.g. "thumbnail:320:webp,thumbnail-avif:320:avif").
+    Formats the installed Pillow can't encode are left out.
+    """
+    specs = []
+    for item in filter(None, (item.strip() for item in value.split(","))):
+        name, width, fmt = item.split(":")
+        fmt = fmt.lower()
+        if fmt not in _PIL_FORMATS:
+            raise ValueError(f"Unknown variant format: {fmt}")
+        if fmt in ("webp", "avif") and not features.check(fmt):
+            continue
+        specs.append(VariantSpec(name=name, width=int(width), format=fmt))
+    return specs
+
+
+def render_variant(data: bytes, width: int, fmt: str, quality: int) -> tuple[bytes, int, int]:
+    """Downscale to at most `width` pixels wide (never upscale) and re-encode. Runs in a worker process."""
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            # Lets the JPEG decoder skip straight to a smaller scale instead of decoding every pixel
+            source.draft("RGB", (width, width))
+            image = ImageOps.exif_transpose(source)
+            has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha and fmt != "jpeg" else "RGB")
+            image.thumbnail((width, image.height), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, _PIL_FORMATS[fmt], quality=quality)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+        raise UnsupportedImageError(f"Can't process image: {exc}")
+    return output.getvalue(), image.width, image.height
+
+
+class ImageProcessor:
+    """Renders image variants on a dedicated process pool, so resizing never blocks the event loop."""
+
+    def __init__(self, workers: int, max_pending: int, quality: int):
+        self.quality = quality
+        self._pool = BoundedProcessPool(
+            workers, max_pending, ImageProcessorBusyError, "Too many images are being processed, try again later"
+        )
+
+    async def render(self, data: bytes, spec: VariantSpec) -> tuple[bytes, int, int]:
+        with stage_timer("image_render"):
+            return await self._pool.submit(render_variant, data, spec.width, spec.format, self.quality)
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+
+VARIANTS = parse_variant_specs(IMAGE_VARIANTS)
+VARIANTS_BY_NAME = {spec.name: spec for spec in VARIANTS}
+
+image_processor = ImageProcessor(
+    workers=IMAGE_PROCESS_WORKERS,
+    max_pending=IMAGE_PROCESS_MAX_PENDING,
+    quality=IMAGE_VARIANT_QUALITY,
+)
@@ -0,0 +1,55 @@
+import re
+
+import bcrypt
+
+from config import BCRYPT_ROUNDS, PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_WORKERS
+from exceptions import PasswordHasherBusyError
+from pools import BoundedProcessPool
+
+_BCRYPT_COST_RE = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+
+def needs_rehash(hashed_password: str, rounds: int = BCRYPT_ROUNDS) -> bool:
+    match = _BCRYPT_COST_RE.match(hashed_password)
+    return match is None or int(match.group(1)) != rounds
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated process pool so a burst of logins can't starve the event loop
+    or the threadpool. At most `max_pending` hashes are queued or running, anything beyond that
+    is rejected with PasswordHasherBusyError instead of piling up.
+    """
+
+    def __init__(self, workers: int, max_pending: int, rounds: int):
+        self.rounds = rounds
+        self._pool = BoundedProcessPool(
+            workers, max_pending, PasswordHasherBusyError, "Too many authentication requests, try again later"
+        )
+
+    async def hash(self, password: str) -> str:
+        return await self._pool.submit(hash_password, password, self.rounds)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._pool.submit(verify_password, password, hashed_password)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return needs_rehash(hashed_password, self.rounds)
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+
+password_hasher = PasswordHasher(
+    workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING,
+    rounds=BCRYPT_ROUNDS,
+)
@@ -0,0 +1,41 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+
+class BoundedProcessPool:
+    """
+    Process pool for CPU-bound work that would otherwise block the event loop.
+    At most `max_pending` calls are queued or running, anything beyond that is rejected
+    with `busy_error(busy_message)` instead of piling up.
+    """
+
+    def __init__(self, workers: int, max_pending: int, busy_error: type[Exception], busy_message: str):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.busy_error = busy_error
+        self.busy_message = busy_message
+        self._pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that already runs an event loop and threads is not safe
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def submit(self, func, *args):
+        if self._pending >= self.max_pending:
+            raise self.busy_error(self.busy_message)
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,190 @@
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+import jwt
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+import config
+from api.utils import decode_jwt_claims, extract_jwt_token_from_request
+from dependencies import cached_token_user_uuid
+from utils import RATE_LIMITS
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitStore(ABC):
+    @abstractmethod
+    async def consume(self, key: str, capacity: float, refill_rate: float, cost: float = 1) -> float:
+        """Take `cost` tokens from the bucket, returns 0 when allowed, otherwise the seconds until it would be."""
+
+    async def close(self):
+        pass
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """Buckets in process memory, bounded to the `maxsize` most recently used keys. Per node only."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def consume(self, key: str, capacity: float, refill_rate: float, cost: float = 1) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / refill_rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+# Refill and take in one atomic step on the server, timed by the server clock so nodes don't need synced clocks
+_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(wait)
+"""
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """Buckets shared by every node, on any server speaking the Redis protocol."""
+
+    def __init__(self, url: str, prefix: str = "image-uploader:ratelimit:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The `redis` package is required to use a redis:// RATE_LIMIT_STORAGE_URL")
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(_TOKEN_BUCKET_SCRIPT)
+        self.prefix = prefix
+
+    async def consume(self, key: str, capacity: float, refill_rate: float, cost: float = 1) -> float:
+        return float(await self._script(keys=[self.prefix + key], args=[capacity, refill_rate, cost]))
+
+    async def close(self):
+        await self._client.aclose()
+
+
+def create_rate_limit_store(url: str, maxsize: int) -> RateLimitStore:
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisRateLimitStore(url)
+    return MemoryRateLimitStore(maxsize)
+
+
+def match_rate_limit(path: str, method: str, limits: dict = RATE_LIMITS) -> Optional[tuple[str, int, float]]:
+    """The (route prefix, requests, seconds) limit applying to a request, by longest matching prefix."""
+    prefixes = [prefix for prefix in limits if path.startswith(prefix)]
+    if not prefixes:
+        return None
+    prefix = max(prefixes, key=len)
+    limit = limits[prefix].get(method)
+    if limit is None:
+        return None
+    return prefix, *limit
+
+
+def client_ip(scope, headers: Headers, trusted_proxies: int) -> str:
+    if trusted_proxies > 0 and (forwarded_for := headers.get("x-forwarded-for")):
+        # Each proxy appends the address it got the request from, so only the last `trusted_proxies` are genuine
+        entries = [entry.strip() for entry in forwarded_for.split(",")]
+        return entries[max(len(entries) - trusted_proxies, 0)]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def client_key(scope, headers: Headers, trusted_proxies: int) -> str:
+    """The user's UUID when the request carries a valid token, its IP address otherwise."""
+    token = extract_jwt_token_from_request(headers)
+    if token:
+        user_uuid = cached_token_user_uuid(token)
+        if user_uuid is None:
+            try:
+                user_uuid = decode_jwt_claims(token)["user_uuid"]
+            except jwt.InvalidTokenError:
+                user_uuid = None
+        if user_uuid is not None:
+            return f"user:{user_uuid}"
+    return f"ip:{client_ip(scope, headers, trusted_proxies)}"
+
+
+class RateLimitMiddleware:
+    """
+    Token-bucket rate limiting per client and route, configured by RATE_LIMITS in utils.py.
+    Rejected requests get a 429 with Retry-After before any of the app runs. If the shared store
+    is unreachable, requests are let through rather than failing.
+    """
+
+    def __init__(self, app, store: RateLimitStore, trusted_proxies: int = 0):
+        self.app = app
+        self.store = store
+        self.trusted_proxies = trusted_proxies
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limit = match_rate_limit(scope["path"], scope["method"])
+        if limit is not None:
+            prefix, requests, seconds = limit
+            headers = Headers(scope=scope)
+            key = f"{client_key(scope, headers, self.trusted_proxies)}:{scope['method']}:{prefix}"
+            try:
+                wait = await self.store.consume(key, requests, requests / seconds)
+            except Exception:
+                logger.warning("Rate limit store is unavailable", exc_info=True)
+                wait = 0
+            if wait > 0:
+                response = JSONResponse(
+                    {"detail": "Too many requests, try again later"},
+                    status_code=429,
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+_rate_limit_store: Optional[RateLimitStore] = None
+
+
+def get_rate_limit_store() -> RateLimitStore:
+    global _rate_limit_store
+    if _rate_limit_store is None:
+        _rate_limit_store = create_rate_limit_store(config.RATE_LIMIT_STORAGE_URL, config.RATE_LIMIT_MEMORY_SIZE)
+    return _rate_limit_store
+
+
+async def close_rate_limit_store():
+    global _rate_limit_store
+    if _rate_limit_store is not None:
+        await _rate_limit_store.close()
+        _rate_limit_store = None
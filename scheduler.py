@@ -0,0 +1,37 @@
+import asyncio
+import logging
+from typing import Callable
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTasks:
+    """Runs maintenance jobs at fixed intervals for the lifetime of the app. Sync jobs run in the threadpool."""
+
+    def __init__(self):
+        self._tasks: list[asyncio.Task] = []
+
+    def add(self, name: str, interval: float, func: Callable[[], object]):
+        if interval <= 0:
+            return
+        self._tasks.append(asyncio.create_task(self._run(name, interval, func), name=name))
+
+    @staticmethod
+    async def _run(name: str, interval: float, func: Callable[[], object]):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    await func()
+                else:
+                    await run_in_threadpool(func)
+            except Exception:
+                logger.exception("Periodic task %s failed", name)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
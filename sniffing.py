@@ -0,0 +1,210 @@
+import struct
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Optional
+
+import config
+from exceptions import InvalidImageError
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    format: str
+    mime_type: str
+    width: int
+    height: int
+
+
+class _Truncated(Exception):
+    """The header continues past the bytes read so far."""
+
+
+def _unpack(fmt: str, data: bytes, offset: int) -> tuple:
+    if offset + struct.calcsize(fmt) > len(data):
+        raise _Truncated
+    return struct.unpack_from(fmt, data, offset)
+
+
+def _png_size(data: bytes) -> tuple[int, int]:
+    _, chunk_type, width, height = _unpack(">I4sII", data, 8)
+    if chunk_type != b"IHDR":
+        raise InvalidImageError("Corrupt PNG header")
+    return width, height
+
+
+def _gif_size(data: bytes) -> tuple[int, int]:
+    return _unpack("<HH", data, 6)
+
+
+def _bmp_size(data: bytes) -> tuple[int, int]:
+    (header_size,) = _unpack("<I", data, 14)
+    if header_size == 12:
+        return _unpack("<HH", data, 18)
+    width, height = _unpack("<ii", data, 18)
+    # Negative heights are top-down bitmaps
+    return width, abs(height)
+
+
+def _webp_size(data: bytes) -> tuple[int, int]:
+    (chunk_type,) = _unpack("4s", data, 12)
+    if chunk_type == b"VP8 ":
+        (start_code,) = _unpack("3s", data, 23)
+        if start_code != b"\x9d\x01\x2a":
+            raise InvalidImageError("Corrupt WebP header")
+        width, height = _unpack("<HH", data, 26)
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk_type == b"VP8L":
+        signature, bits = _unpack("<BI", data, 20)
+        if signature != 0x2F:
+            raise InvalidImageError("Corrupt WebP header")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk_type == b"VP8X":
+        width, height = _unpack("<3s3s", data, 24)
+        return int.from_bytes(width, "little") + 1, int.from_bytes(height, "little") + 1
+    raise InvalidImageError("Corrupt WebP header")
+
+
+# Start-of-frame markers, everything from C0 to CF except DHT (C4), JPG (C8) and DAC (CC)
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _jpeg_size(data: bytes) -> tuple[int, int]:
+    offset = 2
+    while True:
+        (prefix,) = _unpack("B", data, offset)
+        if prefix != 0xFF:
+            raise InvalidImageError("Corrupt JPEG header")
+        (marker,) = _unpack("B", data, offset + 1)
+        if marker == 0xFF:
+            # Fill byte
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            offset += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            raise InvalidImageError("JPEG has no frame header")
+        (length,) = _unpack(">H", data, offset + 2)
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = _unpack(">HH", data, offset + 5)
+            return width, height
+        offset += 2 + length
+
+
+def _iter_boxes(data: bytes, start: int, end: int):
+    # ISO base media file format boxes: (type, payload start, box end)
+    offset = start
+    while offset < end:
+        size, box_type = _unpack(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            (size,) = _unpack(">Q", data, offset + 8)
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            raise InvalidImageError("Corrupt AVIF header")
+        yield box_type, offset + header, offset + size
+        offset += size
+
+
+def _find_box(data: bytes, start: int, end: int, box_type: bytes) -> tuple[int, int]:
+    for found_type, payload, box_end in _iter_boxes(data, start, end):
+        if found_type == box_type:
+            return payload, box_end
+    raise InvalidImageError("Corrupt AVIF header")
+
+
+def _avif_size(data: bytes) -> tuple[int, int]:
+    # ftyp, then meta > iprp > ipco > ispe. meta and ispe are full boxes, with 4 bytes of version and flags
+    end = 1 << 62
+    meta, meta_end = _find_box(data, 0, end, b"meta")
+    iprp, iprp_end = _find_box(data, meta + 4, meta_end, b"iprp")
+    ipco, ipco_end = _find_box(data, iprp, iprp_end, b"ipco")
+    ispe, _ = _find_box(data, ipco, ipco_end, b"ispe")
+    return _unpack(">II", data, ispe + 4)
+
+
+def _is_avif(data: bytes) -> bool:
+    if data[4:8] != b"ftyp":
+        return False
+    (size,) = _unpack(">I", data, 0)
+    brands = data[8:12] + data[16 : min(size, len(data))]
+    return any(brands[i : i + 4] in (b"avif", b"avis") for i in range(0, len(brands) - 3, 4))
+
+
+def _detect(data: bytes) -> Optional[tuple[str, str, Callable[[bytes], tuple[int, int]]]]:
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png", "image/png", _png_size
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpeg", "image/jpeg", _jpeg_size
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif", "image/gif", _gif_size
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp", "image/webp", _webp_size
+    if data[:2] == b"BM":
+        return "bmp", "image/bmp", _bmp_size
+    if _is_avif(data):
+        return "avif", "image/avif", _avif_size
+    return None
+
+
+def sniff_image(data: bytes, complete: bool = True) -> Optional[ImageInfo]:
+    """
+    Identify an image by its magic bytes and read its dimensions from the container headers, without decoding
+    any pixels. `data` is the start of the file, the whole file when `complete`. Returns None when more of the
+    file is needed, raises InvalidImageError when it isn't a supported, plausible image.
+    """
+    if len(data) < 32 and not complete:
+        return None
+    try:
+        detected = _detect(data)
+        if detected is None:
+            raise InvalidImageError("Unsupported file type, expected a JPEG, PNG, GIF, WebP, BMP or AVIF image")
+        image_format, mime_type, read_size = detected
+        width, height = read_size(data)
+    except _Truncated:
+        if complete:
+            raise InvalidImageError("Truncated image header")
+        return None
+    if width <= 0 or height <= 0:
+        raise InvalidImageError("Image has no pixels")
+    if config.IMAGE_MAX_PIXELS and width * height > config.IMAGE_MAX_PIXELS:
+        raise InvalidImageError(f"Image exceeds {config.IMAGE_MAX_PIXELS} pixels")
+    return ImageInfo(image_format, mime_type, width, height)
+
+
+def sniff_bytes(data: bytes, max_bytes: int = config.IMAGE_HEADER_MAX_BYTES) -> ImageInfo:
+    info = sniff_image(data[:max_bytes], complete=len(data) <= max_bytes)
+    if info is None:
+        raise InvalidImageError(f"No image header found in the first {max_bytes} bytes")
+    return info
+
+
+async def sniff_chunks(
+    chunks: AsyncIterator[bytes], max_bytes: int = config.IMAGE_HEADER_MAX_BYTES
+) -> tuple[ImageInfo, AsyncIterator[bytes]]:
+    """
+    Read just enough of `chunks` to sniff the image (at most `max_bytes`, usually a few hundred bytes).
+    Returns its ImageInfo and the chunks again, from the very first byte, for the caller to pass on.
+    """
+    chunks = aiter(chunks)
+    header = bytearray()
+    info = None
+    while info is None:
+        try:
+            chunk = await anext(chunks)
+        except StopAsyncIteration:
+            info = sniff_bytes(bytes(header), max_bytes)
+            break
+        header.extend(chunk)
+        info = sniff_image(bytes(header[:max_bytes]), complete=False)
+        if info is None and len(header) >= max_bytes:
+            raise InvalidImageError(f"No image header found in the first {max_bytes} bytes")
+
+    async def replay() -> AsyncIterator[bytes]:
+        if header:
+            yield bytes(header)
+        async for chunk in chunks:
+            yield chunk
+
+    return info, replay()
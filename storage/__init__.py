@@ -0,0 +1,73 @@
+from typing import Optional
+
+import config
+from storage.base import (
+    PresignedUpload,
+    StorageBackend,
+    StoredFile,
+    file_extension,
+    media_type_for,
+)
+from storage.presign import UploadSigner
+
+_storage: Optional[StorageBackend] = None
+
+
+def create_upload_signer() -> Optional[UploadSigner]:
+    # Direct uploads to the "local" and "memory" backends go through the stand-in upload server
+    if not config.DIRECT_UPLOAD_SECRET:
+        return None
+    return UploadSigner(config.DIRECT_UPLOAD_URL, config.DIRECT_UPLOAD_SECRET)
+
+
+def create_storage(backend: str) -> StorageBackend:
+    if backend == "cloudinary":
+        from storage.cloudinary import CloudinaryStorage
+
+        return CloudinaryStorage(config.CLOUDINARY_CLOUD_NAME, config.CLOUDINARY_API_KEY, config.CLOUDINARY_API_SECRET)
+    if backend == "local":
+        from storage.local import LocalStorage
+
+        return LocalStorage(
+            config.LOCAL_STORAGE_ROOT,
+            config.MEDIA_URL_PREFIX,
+            config.LOCAL_STORAGE_ACCEL_REDIRECT,
+            upload_signer=create_upload_signer(),
+        )
+    if backend == "memory":
+        from storage.memory import InMemoryStorage
+
+        return InMemoryStorage(config.MEDIA_URL_PREFIX, upload_signer=create_upload_signer())
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def get_storage() -> StorageBackend:
+    global _storage
+    if _storage is None:
+        _storage = create_storage(config.STORAGE_BACKEND)
+        if config.METRICS_ENABLED:
+            from storage.instrumented import InstrumentedStorage
+
+            _storage = InstrumentedStorage(_storage)
+    return _storage
+
+
+async def close_storage():
+    global _storage
+    if _storage is not None:
+        await _storage.close()
+        _storage = None
+
+
+__all__ = [
+    "PresignedUpload",
+    "StorageBackend",
+    "StoredFile",
+    "UploadSigner",
+    "close_storage",
+    "create_storage",
+    "create_upload_signer",
+    "file_extension",
+    "get_storage",
+    "media_type_for",
+]
@@ -0,0 +1,109 @@
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Optional
+
+from starlette.responses import Response
+
+# Stored files only get an extension, and are only served as anything but a download, for these types.
+# Keys never take the client's filename extension, or a file uploaded as "x.html" would be served as HTML
+_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/bmp": ".bmp",
+    "image/avif": ".avif",
+}
+_MEDIA_TYPES = {extension: media_type for media_type, extension in _EXTENSIONS.items()} | {".jpeg": "image/jpeg"}
+
+
+@dataclass
+class StoredFile:
+    key: str
+    url: str
+    size: int
+    content_hash: Optional[str] = None
+    # Set by content-addressed backends when the content was stored before and save() found it instead of writing
+    already_stored: bool = False
+
+
+@dataclass
+class PresignedUpload:
+    """Where and how a client sends a file straight to storage, see StorageBackend.presign_upload."""
+
+    key: str
+    url: str
+    # "PUT" with the file as the body, or "POST" with `fields` and then the file as a multipart form
+    method: str
+    fields: dict[str, str] = field(default_factory=dict)
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+class StorageBackend(ABC):
+    name: str = ""
+
+    @abstractmethod
+    async def save(
+        self, chunks: AsyncIterator[bytes], filename: str, content_type: str, folder: str = ""
+    ) -> StoredFile:
+        """
+        Consume `chunks` and persist them, without requiring the whole file to be in memory. Files saved to a
+        `folder` get keys of their own, never the key of the same content saved elsewhere.
+        """
+
+    @abstractmethod
+    async def read(self, key: str) -> bytes:
+        """Return the whole content of a stored file, raises StorageError when it can't be fetched."""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        pass
+
+    def presign_upload(
+        self, digest: str, filename: str, content_type: str, size: int, expires_in: float
+    ) -> Optional[PresignedUpload]:
+        """
+        Signed parameters for a client to upload the file hashed to `digest` without it passing through the API.
+        None when the backend doesn't take direct uploads.
+        """
+        return None
+
+    async def stat(self, key: str) -> Optional[StoredFile]:
+        """
+        The stored file, None when there's nothing under `key`. `content_hash` is only set when the backend
+        verified it when the file was stored.
+        """
+        return None
+
+    async def read_head(self, key: str, size: int) -> bytes:
+        """The first `size` bytes of a stored file, e.g. to sniff it."""
+        return (await self.read(key))[:size]
+
+    async def get_response(self, key: str) -> Optional[Response]:
+        # Only backends that serve files themselves (rather than through an external URL) implement this
+        return None
+
+    async def close(self) -> None:
+        pass
+
+
+def file_extension(content_type: str) -> str:
+    """The extension for files of `content_type`, which must be the sniffed type rather than the client's claim."""
+    return _EXTENSIONS.get(content_type, "")
+
+
+def media_type_for(key: str) -> str:
+    return _MEDIA_TYPES.get(os.path.splitext(key)[1].lower(), "application/octet-stream")
+
+
+def serving_headers(key: str) -> dict[str, str]:
+    """
+    Headers for serving a stored file as media_type_for(key). Browsers must not sniff it as anything else,
+    and whatever isn't one of the image types is only ever downloaded.
+    """
+    disposition = "inline" if media_type_for(key) in _EXTENSIONS else "attachment"
+    return {
+        "Content-Disposition": f'{disposition}; filename="{key.rsplit("/", 1)[-1]}"',
+        "X-Content-Type-Options": "nosniff",
+    }
@@ -0,0 +1,134 @@
+import uuid
+from typing import AsyncIterator, Optional
+
+import cloudinary
+import cloudinary.utils
+import httpx
+
+from exceptions import StorageError
+from storage.base import PresignedUpload, StorageBackend, StoredFile
+
+
+def _form_field(boundary: str, name: str, value: str) -> bytes:
+    return (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n').encode("utf-8")
+
+
+async def _multipart_body(
+    boundary: str, params: dict, chunks: AsyncIterator[bytes], filename: str, content_type: str
+) -> AsyncIterator[bytes]:
+    for name, value in params.items():
+        yield _form_field(boundary, name, str(value))
+    safe_filename = filename.replace('"', "%22")
+    yield (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{safe_filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode("utf-8")
+    async for chunk in chunks:
+        yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+
+class CloudinaryStorage(StorageBackend):
+    name = "cloudinary"
+
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str):
+        cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret)
+        self._http_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        # One pooled client per process, so uploads reuse keep-alive connections to the Upload API
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0))
+        return self._http_client
+
+    async def _post(self, action: str, **kwargs) -> dict:
+        try:
+            response = await self.http_client.post(
+                cloudinary.utils.cloudinary_api_url(action, resource_type="image"), **kwargs
+            )
+        except httpx.HTTPError as exc:
+            raise StorageError(f"Storage backend is unavailable: {exc}") from exc
+        try:
+            result = response.json()
+        except ValueError:
+            raise StorageError(f"Unexpected response from storage backend ({response.status_code})")
+        if response.status_code >= 400:
+            raise StorageError(result.get("error", {}).get("message", f"{action.capitalize()} failed"))
+        return result
+
+    async def save(
+        self, chunks: AsyncIterator[bytes], filename: str, content_type: str, folder: str = ""
+    ) -> StoredFile:
+        """
+        Upload a file to Cloudinary while it is still being received.
+        The signed multipart body is sent with chunked transfer encoding, so the file is never held in memory.
+        """
+        params = {"timestamp": cloudinary.utils.now()}
+        if folder:
+            params["folder"] = folder
+        params = cloudinary.utils.sign_request(params, {})
+        boundary = uuid.uuid4().hex
+        result = await self._post(
+            "upload",
+            content=_multipart_body(boundary, params, chunks, filename, content_type),
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        )
+        return StoredFile(key=result["public_id"], url=result["secure_url"], size=result.get("bytes", 0))
+
+    def presign_upload(
+        self, digest: str, filename: str, content_type: str, size: int, expires_in: float
+    ) -> Optional[PresignedUpload]:
+        """
+        A signed Upload API form with the content hash as public_id. Cloudinary accepts signatures for an hour
+        whatever `expires_in` is, and checks neither the size nor the content, both are verified on confirmation.
+        """
+        params = cloudinary.utils.sign_request({"public_id": digest, "timestamp": cloudinary.utils.now()}, {})
+        return PresignedUpload(
+            key=digest,
+            url=cloudinary.utils.cloudinary_api_url("upload", resource_type="image"),
+            method="POST",
+            fields={name: str(value) for name, value in params.items()},
+        )
+
+    @staticmethod
+    def _delivery_url(key: str) -> str:
+        url, _ = cloudinary.utils.cloudinary_url(key, resource_type="image", secure=True)
+        return url
+
+    async def _get(self, method: str, key: str, **kwargs) -> httpx.Response:
+        try:
+            return await self.http_client.request(method, self._delivery_url(key), **kwargs)
+        except httpx.HTTPError as exc:
+            raise StorageError(f"Storage backend is unavailable: {exc}") from exc
+
+    async def stat(self, key: str) -> Optional[StoredFile]:
+        response = await self._get("HEAD", key)
+        if response.status_code == 404:
+            return None
+        if response.status_code >= 400:
+            raise StorageError(f"Lookup failed ({response.status_code})")
+        size = int(response.headers.get("content-length", 0))
+        return StoredFile(key=key, url=self._delivery_url(key), size=size)
+
+    async def read(self, key: str) -> bytes:
+        response = await self._get("GET", key)
+        if response.status_code >= 400:
+            raise StorageError(f"Download failed ({response.status_code})")
+        return response.content
+
+    async def read_head(self, key: str, size: int) -> bytes:
+        response = await self._get("GET", key, headers={"Range": f"bytes=0-{size - 1}"})
+        if response.status_code >= 400:
+            raise StorageError(f"Download failed ({response.status_code})")
+        return response.content[:size]
+
+    async def delete(self, key: str) -> None:
+        params = cloudinary.utils.sign_request({"public_id": key, "timestamp": cloudinary.utils.now()}, {})
+        await self._post("destroy", data=params)
+
+    async def close(self) -> None:
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
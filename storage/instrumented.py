@@ -0,0 +1,54 @@
+from typing import AsyncIterator, Optional
+
+from starlette.responses import Response
+
+from exceptions import StorageError
+from metrics import STORAGE_ERRORS, stage_timer
+from storage.base import PresignedUpload, StorageBackend, StoredFile
+
+
+class InstrumentedStorage(StorageBackend):
+    """
+    Times every operation of the wrapped backend ("storage_save", "storage_read", "storage_delete" stages)
+    and counts its failures. For streamed uploads the save time includes receiving the body from the client.
+    """
+
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+        self.name = backend.name
+
+    async def _call(self, operation: str, coroutine):
+        with stage_timer(f"storage_{operation}"):
+            try:
+                return await coroutine
+            except StorageError:
+                STORAGE_ERRORS.inc(backend=self.name, operation=operation)
+                raise
+
+    async def save(
+        self, chunks: AsyncIterator[bytes], filename: str, content_type: str, folder: str = ""
+    ) -> StoredFile:
+        return await self._call("save", self.backend.save(chunks, filename, content_type, folder))
+
+    async def read(self, key: str) -> bytes:
+        return await self._call("read", self.backend.read(key))
+
+    async def delete(self, key: str) -> None:
+        return await self._call("delete", self.backend.delete(key))
+
+    def presign_upload(
+        self, digest: str, filename: str, content_type: str, size: int, expires_in: float
+    ) -> Optional[PresignedUpload]:
+        return self.backend.presign_upload(digest, filename, content_type, size, expires_in)
+
+    async def stat(self, key: str) -> Optional[StoredFile]:
+        return await self._call("stat", self.backend.stat(key))
+
+    async def read_head(self, key: str, size: int) -> bytes:
+        return await self._call("read", self.backend.read_head(key, size))
+
+    async def get_response(self, key: str) -> Optional[Response]:
+        return await self.backend.get_response(key)
+
+    async def close(self) -> None:
+        await self.backend.close()
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import re
+import uuid
+from typing import AsyncIterator, Optional
+
+import anyio
+from starlette.responses import FileResponse, Response
+
+from exceptions import StorageError
+from storage.base import (
+    PresignedUpload,
+    StorageBackend,
+    StoredFile,
+    file_extension,
+    media_type_for,
+    serving_headers,
+)
+from storage.presign import UploadSigner
+
+_KEY_RE = re.compile(r"^([a-z]+/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]{1,10})?$")
+
+
+class LocalStorage(StorageBackend):
+    """
+    Content-addressed storage on the local filesystem.
+    Files are stored as `<root>/ab/cd/abcd...<sha256>.<ext>`, so identical uploads share one file
+    and no directory grows beyond 256 entries per level. Files saved to a folder go under `<root>/<folder>/`.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        root: str,
+        url_prefix: str = "/media",
+        accel_redirect_prefix: str = "",
+        upload_signer: Optional[UploadSigner] = None,
+    ):
+        self.root = os.path.abspath(root)
+        self.url_prefix = url_prefix.rstrip("/")
+        # When set (e.g. "/protected-media"), files are handed off to nginx via X-Accel-Redirect
+        self.accel_redirect_prefix = accel_redirect_prefix.rstrip("/")
+        self.upload_signer = upload_signer
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    @staticmethod
+    def key_for(digest: str, content_type: str, folder: str = "") -> str:
+        key = f"{digest[:2]}/{digest[2:4]}/{digest}{file_extension(content_type)}"
+        return f"{folder}/{key}" if folder else key
+
+    async def save(
+        self, chunks: AsyncIterator[bytes], filename: str, content_type: str, folder: str = ""
+    ) -> StoredFile:
+        hasher = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(self.root, "tmp", uuid.uuid4().hex)
+        try:
+            async with await anyio.open_file(tmp_path, "wb") as tmp_file:
+                async for chunk in chunks:
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    await tmp_file.write(chunk)
+            digest = hasher.hexdigest()
+            key = self.key_for(digest, content_type, folder)
+            already_stored = await anyio.to_thread.run_sync(self._commit, tmp_path, self.path_for(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return StoredFile(
+            key=key, url=f"{self.url_prefix}/{key}", size=size, content_hash=digest, already_stored=already_stored
+        )
+
+    @staticmethod
+    def _commit(tmp_path: str, final_path: str) -> bool:
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        if os.path.exists(final_path):
+            # Same content is already stored
+            return True
+        os.replace(tmp_path, final_path)
+        return False
+
+    async def read(self, key: str) -> bytes:
+        if not _KEY_RE.match(key):
+            raise StorageError(f"File not found: {key}")
+        try:
+            async with await anyio.open_file(self.path_for(key), "rb") as file:
+                return await file.read()
+        except FileNotFoundError:
+            raise StorageError(f"File not found: {key}")
+
+    def presign_upload(
+        self, digest: str, filename: str, content_type: str, size: int, expires_in: float
+    ) -> Optional[PresignedUpload]:
+        if self.upload_signer is None:
+            return None
+        return self.upload_signer.presign(self.key_for(digest, content_type), size, digest, content_type, expires_in)
+
+    async def stat(self, key: str) -> Optional[StoredFile]:
+        if not _KEY_RE.match(key):
+            return None
+        try:
+            size = await anyio.to_thread.run_sync(os.path.getsize, self.path_for(key))
+        except FileNotFoundError:
+            return None
+        # Keys are the content's hash, files only ever get there through save()
+        digest = os.path.splitext(key.rsplit("/", 1)[-1])[0]
+        return StoredFile(key=key, url=f"{self.url_prefix}/{key}", size=size, content_hash=digest)
+
+    async def read_head(self, key: str, size: int) -> bytes:
+        if not _KEY_RE.match(key):
+            raise StorageError(f"File not found: {key}")
+        try:
+            async with await anyio.open_file(self.path_for(key), "rb") as file:
+                return await file.read(size)
+        except FileNotFoundError:
+            raise StorageError(f"File not found: {key}")
+
+    async def delete(self, key: str) -> None:
+        if not _KEY_RE.match(key):
+            return
+        try:
+            await anyio.to_thread.run_sync(os.remove, self.path_for(key))
+        except FileNotFoundError:
+            pass
+
+    async def get_response(self, key: str) -> Optional[Response]:
+        if not _KEY_RE.match(key) or not os.path.isfile(self.path_for(key)):
+            return None
+        headers = {**serving_headers(key), "Cache-Control": "public, max-age=31536000, immutable"}
+        if self.accel_redirect_prefix:
+            # nginx keeps the Content-Type and Content-Disposition given along with X-Accel-Redirect
+            headers["X-Accel-Redirect"] = f"{self.accel_redirect_prefix}/{key}"
+            return Response(media_type=media_type_for(key), headers=headers)
+        # FileResponse uses the ASGI `http.response.pathsend` extension when the server supports it,
+        # which lets the server sendfile() the content without copying it through Python
+        return FileResponse(self.path_for(key), media_type=media_type_for(key), headers=headers)
@@ -0,0 +1,79 @@
+import hashlib
+from typing import AsyncIterator, Optional
+
+from starlette.responses import Response
+
+from exceptions import StorageError
+from storage.base import (
+    PresignedUpload,
+    StorageBackend,
+    StoredFile,
+    file_extension,
+    media_type_for,
+    serving_headers,
+)
+from storage.presign import UploadSigner
+
+
+class InMemoryStorage(StorageBackend):
+    """Content-addressed, process-local storage. Meant for tests, benchmarks and offline development."""
+
+    name = "memory"
+
+    def __init__(self, url_prefix: str = "/media", upload_signer: Optional[UploadSigner] = None):
+        self.url_prefix = url_prefix.rstrip("/")
+        self.upload_signer = upload_signer
+        self.files: dict[str, bytes] = {}
+
+    async def save(
+        self, chunks: AsyncIterator[bytes], filename: str, content_type: str, folder: str = ""
+    ) -> StoredFile:
+        hasher = hashlib.sha256()
+        data = bytearray()
+        async for chunk in chunks:
+            hasher.update(chunk)
+            data.extend(chunk)
+        digest = hasher.hexdigest()
+        key = f"{digest}{file_extension(content_type)}"
+        if folder:
+            key = f"{folder}/{key}"
+        already_stored = key in self.files
+        self.files.setdefault(key, bytes(data))
+        return StoredFile(
+            key=key,
+            url=f"{self.url_prefix}/{key}",
+            size=len(data),
+            content_hash=digest,
+            already_stored=already_stored,
+        )
+
+    async def read(self, key: str) -> bytes:
+        try:
+            return self.files[key]
+        except KeyError:
+            raise StorageError(f"File not found: {key}")
+
+    def presign_upload(
+        self, digest: str, filename: str, content_type: str, size: int, expires_in: float
+    ) -> Optional[PresignedUpload]:
+        if self.upload_signer is None:
+            return None
+        return self.upload_signer.presign(
+            f"{digest}{file_extension(content_type)}", size, digest, content_type, expires_in
+        )
+
+    async def stat(self, key: str) -> Optional[StoredFile]:
+        content = self.files.get(key)
+        if content is None:
+            return None
+        digest = key.rsplit("/", 1)[-1].split(".", 1)[0]
+        return StoredFile(key=key, url=f"{self.url_prefix}/{key}", size=len(content), content_hash=digest)
+
+    async def delete(self, key: str) -> None:
+        self.files.pop(key, None)
+
+    async def get_response(self, key: str) -> Optional[Response]:
+        content = self.files.get(key)
+        if content is None:
+            return None
+        return Response(content, media_type=media_type_for(key), headers=serving_headers(key))
@@ -0,0 +1,67 @@
+"""
+A stand-in for a storage service's upload endpoint, taking the presigned PUTs of UploadSigner for the
+"local" and "memory" backends. The API mounts it at DIRECT_UPLOAD_URL when that is a path, which is enough
+for development and tests. To keep upload traffic off the API workers, run it on its own next to a shared
+LOCAL_STORAGE_ROOT and point DIRECT_UPLOAD_URL at it:
+
+    uvicorn storage.standin:app --port 9000
+"""
+
+import hashlib
+from typing import AsyncIterator, Callable, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from exceptions import FileTooLargeError, StorageError, ValidationError
+from storage import StorageBackend, create_upload_signer, get_storage, media_type_for
+from storage.presign import UploadSigner
+
+
+async def verify_chunks(chunks: AsyncIterator[bytes], size: int, sha256: str) -> AsyncIterator[bytes]:
+    # Fails the stream, and so the save, unless exactly the signed file arrived
+    hasher = hashlib.sha256()
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > size:
+            raise FileTooLargeError("File is larger than the presigned upload")
+        hasher.update(chunk)
+        yield chunk
+    if received != size or hasher.hexdigest() != sha256:
+        raise ValidationError("File doesn't match the presigned upload")
+
+
+def create_standin_app(get_backend: Callable[[], StorageBackend], signer: Optional[UploadSigner]) -> Starlette:
+    async def put_file(request: Request) -> Response:
+        if signer is None:
+            return JSONResponse({"detail": "Direct uploads are disabled"}, status_code=404)
+        key = request.path_params["key"]
+        try:
+            size = int(request.query_params["size"])
+            expires = int(request.query_params["expires"])
+            sha256 = request.query_params["sha256"]
+            signature = request.query_params["signature"]
+        except (KeyError, ValueError):
+            return JSONResponse({"detail": "Missing or invalid upload parameters"}, status_code=400)
+        try:
+            signer.verify(key, size, sha256, expires, signature)
+        except ValidationError as exc:
+            return JSONResponse({"detail": str(exc)}, status_code=403)
+
+        try:
+            # Signed keys are derived from the content hash and type, so the verified file lands exactly under
+            # `key`. The request's own Content-Type is the client's to choose and never decides the key
+            await get_backend().save(verify_chunks(request.stream(), size, sha256), key, media_type_for(key))
+        except (FileTooLargeError, ValidationError) as exc:
+            return JSONResponse({"detail": str(exc)}, status_code=400)
+        except StorageError as exc:
+            return JSONResponse({"detail": str(exc)}, status_code=502)
+        return Response(status_code=201, headers={"ETag": f'"{sha256}"'})
+
+    return Starlette(routes=[Route("/{key:path}", put_file, methods=["PUT"])])
+
+
+app = create_standin_app(get_storage, create_upload_signer())
@@ -0,0 +1,110 @@
+import io
+import os
+import tempfile
+
+# Settings are read when `config` is first imported, so they have to be in place before any app module is
+_root = tempfile.mkdtemp(prefix="image-uploader-tests-")
+os.environ.update(
+    {
+        "DEPLOY": "False",
+        "PROD_EXTERNAL_DB_URL": f"sqlite:///{_root}/test.db",
+        "ASYNC_DATABASE_URL": "",
+        "DATABASE_REPLICA_URLS": "[]",
+        "JWT_ENCRYPTION_ALGORITHM": "HS256",
+        "JWT_SIGNING_KEYS": "",
+        "BCRYPT_ROUNDS": "4",
+        "PASSWORD_HASH_WORKERS": "1",
+        "STORAGE_BACKEND": "memory",
+        "LOCAL_STORAGE_ROOT": f"{_root}/media",
+        "UPLOAD_STAGING_ROOT": f"{_root}/staging",
+        "METADATA_CACHE_URL": "",
+        "RATE_LIMIT_ENABLED": "False",
+        "RATE_LIMIT_STORAGE_URL": "",
+        "DIRECT_UPLOAD_SECRET": "test-direct-upload-secret",
+        "DIRECT_UPLOAD_URL": "/storage-uploads",
+        "USER_MAX_IMAGES": "0",
+        "USER_MAX_STORAGE_MB": "0",
+        "IMAGE_RETENTION_DAYS": "0",
+        "IMAGE_PROCESS_WORKERS": "1",
+    }
+)
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from PIL import Image as PILImage  # noqa: E402
+
+import api.models  # noqa: E402, F401
+from engine import AsyncSessionLocal, Base, async_engine, engine  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def database():
+    Base.metadata.create_all(engine)
+    yield
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+@pytest.fixture
+async def db():
+    """A session on the test database for async tests, its connections don't outlive the test's event loop."""
+    async with AsyncSessionLocal() as session:
+        yield session
+    await async_engine.dispose()
+
+
+@pytest.fixture
+def client():
+    from app import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def register_user(client):
+    """Create a user and log them in, returns the headers authenticating as them."""
+
+    def register(email: str = "user@example.com", password: str = "password") -> dict[str, str]:
+        client.post("/register/", json={"email": email, "password": password})
+        token = client.post("/login/", json={"email": email, "password": password}).json()["token"]
+        return {"Authorization": f"Bearer {token}"}
+
+    return register
+
+
+@pytest.fixture
+def auth_headers(register_user) -> dict[str, str]:
+    return register_user()
+
+
+@pytest.fixture
+def make_image():
+    def make(image_format: str = "PNG", size: tuple[int, int] = (8, 8), color=(200, 30, 30)) -> bytes:
+        output = io.BytesIO()
+        PILImage.new("RGB", size, color).save(output, image_format)
+        return output.getvalue()
+
+    return make
+
+
+@pytest.fixture
+def png(make_image) -> bytes:
+    return make_image()
+
+
+@pytest.fixture
+def upload(client, png):
+    """Upload an image through /upload/, returns the response body."""
+
+    def upload(headers: dict[str, str], filename: str = "photo.png", data: bytes = None) -> dict:
+        response = client.post("/upload/", files={"file": (filename, data or png, "image/png")}, headers=headers)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    return upload
@@ -0,0 +1,97 @@
+import datetime
+import uuid
+
+import jwt
+import pytest
+from sqlalchemy import delete
+
+from api.blacklist import blacklist_cache, token_digest
+from api.crud.user import get_user_with_blacklist_status
+from api.jwt_keys import jwt_keyring
+from api.models import BlackListedToken, User
+from engine import SessionLocal
+from utils import utcnow
+
+pytestmark = pytest.mark.anyio
+
+
+def token_of(headers: dict[str, str]) -> str:
+    return headers["Authorization"].removeprefix("Bearer ")
+
+
+def signed_token(claims: dict) -> str:
+    key = jwt_keyring.signing_key()
+    return jwt.encode(claims, key.secret, algorithm="HS256", headers={"kid": key.kid})
+
+
+async def test_user_and_blacklist_status_in_one_query(db):
+    user = User(email="user@example.com", hashed_password="hash")
+    db.add_all([user, BlackListedToken(token_hash=token_digest("revoked"), expires_at=utcnow())])
+    await db.commit()
+
+    assert await get_user_with_blacklist_status(user.uuid, db) == (user, None)
+    assert await get_user_with_blacklist_status(user.uuid, db, token_digest("valid")) == (user, False)
+    assert await get_user_with_blacklist_status(user.uuid, db, token_digest("revoked")) == (user, True)
+    assert await get_user_with_blacklist_status(uuid.uuid4(), db, token_digest("revoked")) == (None, None)
+
+
+def test_routes_needing_a_user_require_a_token(client):
+    response = client.get("/images/")
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token is required"
+
+
+@pytest.mark.parametrize("token", ["garbage", "a.b.c"])
+def test_invalid_tokens_are_rejected(client, token):
+    response = client.get("/images/", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid token"
+
+
+def test_expired_tokens_are_rejected(client, auth_headers):
+    claims = {"user_uuid": str(uuid.uuid4()), "exp": utcnow() - datetime.timedelta(minutes=1)}
+
+    response = client.get("/images/", headers={"Authorization": f"Bearer {signed_token(claims)}"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Token has expired"
+
+
+def test_tokens_without_a_user_are_rejected(client, auth_headers):
+    claims = {"sub": "someone", "exp": utcnow() + datetime.timedelta(minutes=1)}
+
+    response = client.get("/images/", headers={"Authorization": f"Bearer {signed_token(claims)}"})
+
+    assert response.status_code == 400
+
+
+def test_tokens_of_deleted_users_are_rejected(client, auth_headers):
+    with SessionLocal() as session:
+        session.execute(delete(User))
+        session.commit()
+
+    response = client.get("/images/", headers=auth_headers)
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "User not found"
+
+
+def test_blacklist_is_checked_with_the_user_lookup(client, auth_headers, monkeypatch):
+    digest = token_digest(token_of(auth_headers))
+    with SessionLocal() as session:
+        # Blacklisted by another process, this one's filter can't rule it out
+        session.add(BlackListedToken(token_hash=digest, expires_at=utcnow() + datetime.timedelta(hours=1)))
+        session.commit()
+
+    async def unknown(digest):
+        return None
+
+    monkeypatch.setattr(blacklist_cache, "lookup", unknown)
+
+    response = client.get("/images/", headers=auth_headers)
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token is blacklisted"
+    assert blacklist_cache.hits.get(digest)
@@ -0,0 +1,79 @@
+import config
+from storage import get_storage
+
+
+def stored_files() -> dict[str, bytes]:
+    storage = get_storage()
+    return getattr(storage, "backend", storage).files
+
+
+def upload_batch(client, headers, files: list[tuple[str, bytes]]):
+    return client.post(
+        "/upload/batch/", files=[("files", (name, data, "image/png")) for name, data in files], headers=headers
+    )
+
+
+def test_batch_upload(client, auth_headers, make_image):
+    red, blue = make_image(color=(255, 0, 0)), make_image(color=(0, 0, 255))
+
+    response = upload_batch(client, auth_headers, [("red.png", red), ("blue.png", blue)])
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [(result["filename"], result["status"]) for result in results] == [
+        ("red.png", "uploaded"),
+        ("blue.png", "uploaded"),
+    ]
+    assert client.get(results[0]["image"]["image_url"]).content == red
+    assert client.get(results[1]["image"]["image_url"]).content == blue
+    listed = client.get("/images/", headers=auth_headers).json()["images"]
+    assert {image["filename"] for image in listed} == {"red.png", "blue.png"}
+
+
+def test_repeated_files_are_stored_once(client, auth_headers, png):
+    response = upload_batch(client, auth_headers, [("a.png", png), ("b.png", png), ("c.png", png)])
+
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["uploaded"] * 3
+    assert len({result["image"]["image_uuid"] for result in results}) == 3
+    assert len({result["image"]["image_url"] for result in results}) == 1
+    assert len(stored_files()) == 1
+
+
+def test_invalid_files_fail_alone(client, auth_headers, png):
+    response = upload_batch(client, auth_headers, [("text.png", b"not an image"), ("photo.png", png)])
+
+    results = response.json()["results"]
+    assert results[0]["status"] == "failed"
+    assert results[0]["error"]
+    assert results[1]["status"] == "uploaded"
+
+
+def test_files_over_the_size_limit_fail_alone(client, auth_headers, make_image, monkeypatch):
+    small, large = make_image(), make_image(size=(256, 256), color=(1, 2, 3))
+    large = large + b"\0" * 2000
+    monkeypatch.setattr(config, "MAX_UPLOAD_SIZE_MB", (len(small) + 1000) / 1000**2)
+
+    response = upload_batch(client, auth_headers, [("large.png", large), ("small.png", small)])
+
+    results = response.json()["results"]
+    assert results[0]["status"] == "failed"
+    assert "exceeds" in results[0]["error"]
+    assert results[1]["status"] == "uploaded"
+
+
+def test_files_beyond_the_batch_limit_fail(client, auth_headers, make_image, monkeypatch):
+    monkeypatch.setattr(config, "UPLOAD_BATCH_MAX_FILES", 2)
+    files = [(f"{index}.png", make_image(color=(index, 0, 0))) for index in range(3)]
+
+    results = upload_batch(client, auth_headers, files).json()["results"]
+
+    assert [result["status"] for result in results] == ["uploaded", "uploaded", "failed"]
+    assert results[2]["error"] == "Batch exceeds 2 files"
+
+
+def test_batch_without_files(client, auth_headers, png):
+    response = client.post("/upload/batch/", files={"other": ("photo.png", png, "image/png")}, headers=auth_headers)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "No file provided"
@@ -0,0 +1,89 @@
+import json
+import sys
+
+import httpx
+import pytest
+
+from benchmarks import compare
+from benchmarks.__main__ import run
+from benchmarks.runner import BenchmarkFailed, measure, summarize
+from benchmarks.suite import random_png
+from sniffing import sniff_bytes
+
+pytestmark = pytest.mark.anyio
+
+
+def test_summarize():
+    summary = summarize([0.001 * value for value in range(1, 101)])
+
+    assert summary["min"] == 1.0
+    assert summary["max"] == 100.0
+    assert summary["mean"] == 50.5
+    assert summary["p50"] == pytest.approx(50.5)
+    assert summary["p99"] == pytest.approx(99.01)
+
+
+def test_summarize_a_single_latency():
+    assert summarize([0.002]) == {"mean": 2.0, "min": 2.0, "p50": 2.0, "p90": 2.0, "p99": 2.0, "max": 2.0}
+
+
+async def test_measure():
+    calls = []
+
+    async def request(index):
+        calls.append(index)
+        return httpx.Response(200)
+
+    result = await measure("test", {"rows": 1}, request, iterations=10, concurrency=3, bytes_per_request=1000)
+
+    assert sorted(calls) == list(range(10))
+    assert (result["name"], result["params"], result["iterations"], result["concurrency"]) == (
+        "test",
+        {"rows": 1},
+        10,
+        3,
+    )
+    assert result["ops_per_second"] > 0
+    assert "megabytes_per_second" in result
+
+
+async def test_measure_fails_on_unexpected_statuses():
+    async def request(index):
+        return httpx.Response(500, text="boom")
+
+    with pytest.raises(BenchmarkFailed, match="test: unexpected 500 boom"):
+        await measure("test", {}, request, iterations=1)
+
+
+def test_random_png_passes_sniffing():
+    data = random_png(2000)
+
+    assert len(data) == 2000
+    assert sniff_bytes(data).mime_type == "image/png"
+    assert random_png(2000) != data
+
+
+def report(tmp_path, name: str, p50: float) -> str:
+    path = tmp_path / name
+    result = {"name": "upload", "params": {"bytes": 10}, "latency_ms": {"p50": p50}}
+    path.write_text(json.dumps({"results": [result]}))
+    return str(path)
+
+
+@pytest.mark.parametrize("after, exit_code", [(10.5, 0), (12.0, 1), (5.0, 0)])
+def test_compare_flags_regressions(tmp_path, monkeypatch, capsys, after, exit_code):
+    before_path, after_path = report(tmp_path, "before.json", 10.0), report(tmp_path, "after.json", after)
+    monkeypatch.setattr(sys, "argv", ["compare", before_path, after_path, "--threshold", "10"])
+
+    with pytest.raises(SystemExit) as exit_info:
+        compare.main()
+
+    assert exit_info.value.code == exit_code
+    assert ("REGRESSION" in capsys.readouterr().out) == bool(exit_code)
+
+
+async def test_suite_runs_in_process(db):
+    results = await run(["preview"], scale=0)
+
+    assert [result["name"] for result in results] == ["preview_hot", "preview_not_modified"]
+    assert all(result["benchmark"] == "preview" for result in results)
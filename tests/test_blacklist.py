@@ -0,0 +1,113 @@
+import datetime
+
+import pytest
+
+from api.blacklist import BlacklistCache, token_digest
+from api.models import BlackListedToken
+from cache import BloomFilter
+from utils import utcnow
+
+pytestmark = pytest.mark.anyio
+
+
+def make_cache(**options) -> BlacklistCache:
+    options = {
+        "capacity": 100,
+        "error_rate": 0.001,
+        "cache_size": 100,
+        "sync_interval": 0,
+        "sync_overlap": 60,
+        **options,
+    }
+    return BlacklistCache(**options)
+
+
+async def blacklist(db, token: str, blacklisted_on: datetime.datetime, **columns) -> str:
+    digest = token_digest(token)
+    expires_at = utcnow() + datetime.timedelta(hours=1)
+    db.add(BlackListedToken(token_hash=digest, expires_at=expires_at, blacklisted_on=blacklisted_on, **columns))
+    await db.commit()
+    return digest
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000)
+    for item in range(1000):
+        bloom.add(str(item))
+
+    assert all(bloom.might_contain(str(item)) for item in range(1000))
+    assert not bloom.is_saturated
+    bloom.add("one too many")
+    assert bloom.is_saturated
+
+
+async def test_lookup_answers_unknown_tokens_from_memory(db):
+    cache = make_cache()
+
+    assert await cache.lookup(token_digest("never blacklisted")) is False
+
+
+async def test_load_picks_up_existing_rows(db):
+    digest = await blacklist(db, "token", utcnow())
+    cache = make_cache()
+
+    await cache.load()
+
+    # In the filter, but only the database knows when it expires
+    assert await cache.lookup(digest) is None
+    assert await cache.is_blacklisted("token")
+    assert await cache.lookup(digest) is True
+
+
+async def test_sync_picks_up_rows_committed_out_of_order(db):
+    cache = make_cache(sync_interval=3600)
+    await cache.load()
+    started = utcnow()
+    await blacklist(db, "newer", started, id=2)
+    await cache._sync()
+
+    # Its id and timestamp were assigned before the row above's, but it committed after the sync
+    late = await blacklist(db, "late", started - datetime.timedelta(seconds=5), id=1)
+    assert await cache.lookup(late) is False
+
+    await cache._sync()
+
+    assert await cache.lookup(late) is None
+    assert await cache.is_blacklisted("late")
+    assert await cache.is_blacklisted("newer")
+
+
+async def test_sync_overlap_is_bounded(db):
+    cache = make_cache(sync_interval=3600, sync_overlap=10)
+    await cache.load()
+
+    stale = await blacklist(db, "stale", cache._synced_from - datetime.timedelta(minutes=5))
+    await cache._sync()
+
+    assert await cache.lookup(stale) is False
+
+
+async def test_lookup_syncs_after_the_interval(db):
+    cache = make_cache(sync_interval=0)
+    await cache.load()
+
+    digest = await blacklist(db, "token", utcnow())
+
+    assert await cache.lookup(digest) is None
+
+
+async def test_add_is_visible_before_the_next_sync(db):
+    cache = make_cache(sync_interval=3600)
+    await cache.load()
+
+    cache.add(token_digest("token"), utcnow() + datetime.timedelta(hours=1))
+
+    assert await cache.is_blacklisted("token")
+
+
+def test_logged_out_tokens_are_rejected(client, auth_headers):
+    assert client.get("/images/", headers=auth_headers).status_code == 200
+
+    assert client.post("/logout/", headers=auth_headers).status_code == 200
+
+    assert client.get("/images/", headers=auth_headers).status_code == 401
@@ -0,0 +1,138 @@
+import asyncio
+
+import fakeredis
+import pytest
+from sqlalchemy import delete
+
+import cache
+from api.models import Image
+from cache import (
+    MemoryMetadataCache,
+    RedisMetadataCache,
+    TTLCache,
+    create_metadata_cache,
+)
+from engine import engine
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def redis_cache(monkeypatch, redis_server):
+    monkeypatch.setattr(
+        "redis.asyncio.from_url", lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=redis_server, **kwargs)
+    )
+    return RedisMetadataCache("redis://localhost:6379/0", ttl=60)
+
+
+@pytest.fixture
+def shared_redis_cache(monkeypatch, redis_cache):
+    """The app's metadata cache, on the fake Redis server."""
+    monkeypatch.setattr(cache, "_metadata_cache", redis_cache)
+    return redis_cache
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    ttl_cache = TTLCache(maxsize=10, ttl=5)
+
+    ttl_cache.set("short", 1, ttl=1)
+    ttl_cache.set("default", 2)
+    ttl_cache.set("never", 3, ttl=0)
+    now[0] += 2
+
+    assert ttl_cache.get("short") is None
+    assert ttl_cache.get("default") == 2
+    assert ttl_cache.get("never") is None
+
+
+def test_ttl_cache_evicts_the_least_recently_used():
+    ttl_cache = TTLCache(maxsize=2, ttl=60)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+    ttl_cache.get("a")
+
+    ttl_cache.set("c", 3)
+
+    assert (ttl_cache.get("a"), ttl_cache.get("b"), ttl_cache.get("c")) == (1, None, 3)
+
+
+def test_create_metadata_cache_by_url(redis_cache):
+    assert isinstance(create_metadata_cache("", maxsize=10, ttl=60), MemoryMetadataCache)
+    assert isinstance(create_metadata_cache("redis://localhost", maxsize=10, ttl=60), RedisMetadataCache)
+
+
+async def test_redis_get_set_delete(redis_cache):
+    assert await redis_cache.get("key") is None
+
+    await redis_cache.set("key", {"body": "value", "size": 1})
+    assert await redis_cache.get("key") == {"body": "value", "size": 1}
+
+    await redis_cache.delete("key")
+    assert await redis_cache.get("key") is None
+    await redis_cache.close()
+
+
+async def test_redis_keys_are_prefixed_and_expire(redis_cache, redis_server):
+    raw = fakeredis.FakeAsyncRedis(server=redis_server)
+
+    await redis_cache.set("default", {})
+    await redis_cache.set("short", {}, ttl=1.5)
+
+    assert 59_000 < await raw.pttl("image-uploader:default") <= 60_000
+    assert 1_000 < await raw.pttl("image-uploader:short") <= 1_500
+    await raw.aclose()
+    await redis_cache.close()
+
+
+async def test_redis_entries_are_gone_after_their_ttl(redis_cache):
+    await redis_cache.set("key", {}, ttl=0.05)
+
+    await asyncio.sleep(0.1)
+
+    assert await redis_cache.get("key") is None
+    await redis_cache.close()
+
+
+def test_preview_is_served_from_the_cache(client, upload, auth_headers, shared_redis_cache):
+    image = upload(auth_headers)
+    url = f"/image-preview/{image['image_uuid']}"
+
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.json()["filename"] == "photo.png"
+
+    # Served from the cache, even once the row is gone
+    with engine.begin() as connection:
+        connection.execute(delete(Image))
+    cached = client.get(url)
+    assert cached.content == first.content
+    assert cached.headers["etag"] == first.headers["etag"]
+
+
+def test_preview_etag_revalidation(client, upload, auth_headers, shared_redis_cache):
+    url = f"/image-preview/{upload(auth_headers)['image_uuid']}"
+    etag = client.get(url).headers["etag"]
+
+    not_modified = client.get(url, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+
+    assert client.get(url, headers={"If-None-Match": f'W/{etag}, "other"'}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_deleting_an_image_drops_its_cached_preview(client, upload, auth_headers, shared_redis_cache):
+    image_uuid = upload(auth_headers)["image_uuid"]
+    assert client.get(f"/image-preview/{image_uuid}").status_code == 200
+
+    assert client.delete(f"/images/{image_uuid}", headers=auth_headers).status_code == 204
+
+    assert client.get(f"/image-preview/{image_uuid}").status_code == 400
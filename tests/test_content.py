@@ -0,0 +1,123 @@
+import pytest
+from sqlalchemy import select
+
+import app as app_module
+from api.crud.content import (
+    acquire_content,
+    delete_released_contents,
+    get_content_by_hash,
+    release_contents,
+)
+from api.models import ImageContent, ImageVariant
+from storage import StoredFile, get_storage
+
+pytestmark = pytest.mark.anyio
+
+
+def stored_file(name: str) -> StoredFile:
+    return StoredFile(key=f"{name}.png", url=f"/media/{name}.png", size=10, content_hash=name)
+
+
+async def ref_counts(db) -> dict[str, int]:
+    rows = (await db.execute(select(ImageContent.sha256, ImageContent.ref_count))).all()
+    return dict(rows)
+
+
+async def test_acquire_creates_then_references(db):
+    first = await acquire_content("a", stored_file("a"), 10, db)
+    second = await acquire_content("a", stored_file("a"), 10, db, count=2)
+    await db.commit()
+
+    assert first.id == second.id
+    assert second.ref_count == 3
+    assert await ref_counts(db) == {"a": 3}
+
+
+async def test_acquire_without_a_file_needs_a_referenced_content(db):
+    assert await acquire_content("a", None, 10, db) is None
+
+    await acquire_content("a", stored_file("a"), 10, db)
+    content = await acquire_content("a", None, 10, db, count=2)
+    assert content.ref_count == 3
+
+    await release_contents({content.id: 3}, db)
+    assert await acquire_content("a", None, 10, db) is None
+    assert await get_content_by_hash("a", db) is None
+
+
+async def test_release_returns_the_unreferenced_contents(db):
+    a = await acquire_content("a", stored_file("a"), 10, db, count=2)
+    b = await acquire_content("b", stored_file("b"), 10, db)
+    await db.commit()
+
+    assert await release_contents({a.id: 1, b.id: 1}, db) == [b.id]
+    assert await release_contents({}, db) == []
+    await db.commit()
+    assert await ref_counts(db) == {"a": 1, "b": 0}
+
+
+async def test_delete_released_contents_keeps_referenced_ones(db):
+    a = await acquire_content("a", stored_file("a"), 10, db)
+    b = await acquire_content("b", stored_file("b"), 10, db)
+    db.add(
+        ImageVariant(
+            content_id=b.id, name="thumb", format="webp", width=1, height=1, size=1, storage_key="b-thumb", url="/b"
+        )
+    )
+    await db.commit()
+    released = await release_contents({b.id: 1}, db)
+    # Referenced again before the delete got to it
+    await acquire_content("a", None, 10, db)
+
+    keys = await delete_released_contents(released + [a.id], db)
+    await db.commit()
+
+    assert sorted(keys) == ["b-thumb", "b.png"]
+    assert await ref_counts(db) == {"a": 2}
+    assert (await db.execute(select(ImageVariant))).scalars().all() == []
+
+
+async def test_released_content_can_be_stored_again(db):
+    content = await acquire_content("a", stored_file("a"), 10, db)
+    await release_contents({content.id: 1}, db)
+    await db.commit()
+
+    content = await acquire_content("a", stored_file("a"), 10, db)
+
+    assert content.ref_count == 1
+
+
+def test_shared_content_outlives_its_first_image(client, auth_headers, upload, png):
+    first, second = upload(auth_headers, "a.png"), upload(auth_headers, "b.png")
+    assert first["image_url"] == second["image_url"]
+
+    assert client.delete(f"/images/{first['image_uuid']}", headers=auth_headers).status_code == 204
+    assert client.get(second["image_url"]).content == png
+
+    assert client.delete(f"/images/{second['image_uuid']}", headers=auth_headers).status_code == 204
+    assert client.get(second["image_url"]).status_code == 404
+
+
+def test_upload_racing_a_delete_of_its_content_is_retried(client, auth_headers, upload, png, monkeypatch):
+    upload(auth_headers)
+
+    async def acquire_after_delete(sha256, stored_file, *args, **kwargs):
+        # The content's last image and its file were deleted after save() found the file
+        await get_storage().delete(stored_file.key)
+        return await acquire_content(sha256, stored_file, *args, **kwargs)
+
+    monkeypatch.setattr(app_module, "acquire_content", acquire_after_delete)
+    response = client.post("/upload/", files={"file": ("photo.png", png, "image/png")}, headers=auth_headers)
+
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Stored content was removed, retry the upload"
+    assert len(client.get("/images/", headers=auth_headers).json()["images"]) == 1
+
+    monkeypatch.undo()
+    retried = upload(auth_headers)
+    assert client.get(retried["image_url"]).content == png
+
+
+def test_created_at_defaults_to_naive_utc():
+    # The column is `timestamp without time zone`, asyncpg rejects aware datetimes for it
+    assert ImageContent.__table__.c.created_at.default.arg(None).tzinfo is None
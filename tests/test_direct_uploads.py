@@ -0,0 +1,216 @@
+import datetime
+import hashlib
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from sqlalchemy import update
+
+import config
+from api.direct_uploads import sweep_direct_uploads
+from api.models import DirectUpload
+from engine import SessionLocal
+from exceptions import ValidationError
+from storage import get_storage
+from storage.presign import UploadSigner
+from utils import utcnow
+
+pytestmark = pytest.mark.anyio
+
+SHA256 = "ab" * 32
+
+
+def stored_files() -> dict[str, bytes]:
+    storage = get_storage()
+    return getattr(storage, "backend", storage).files
+
+
+@pytest.fixture
+def presign(client):
+    """Announce a direct upload, returns the response body."""
+
+    def presign(headers: dict[str, str], data: bytes, filename: str = "photo.png", **fields) -> dict:
+        body = {"filename": filename, "size": len(data), "sha256": hashlib.sha256(data).hexdigest(), **fields}
+        response = client.post("/direct-uploads/", json=body, headers=headers)
+        assert response.status_code == 201, response.text
+        return response.json()
+
+    return presign
+
+
+def put(client, direct_upload: dict, data: bytes):
+    upload = direct_upload["upload"]
+    return client.request(upload["method"], upload["url"], content=data, headers=upload["headers"])
+
+
+def test_signed_upload_urls():
+    signer = UploadSigner("/storage-uploads/", "secret")
+
+    presigned = signer.presign("ab/cd.png", 10, SHA256, "image/png", expires_in=60)
+
+    url = urlsplit(presigned.url)
+    assert url.path == "/storage-uploads/ab/cd.png"
+    assert (presigned.method, presigned.headers) == ("PUT", {"Content-Type": "image/png"})
+    query = {name: values[0] for name, values in parse_qs(url.query).items()}
+    signer.verify("ab/cd.png", 10, SHA256, int(query["expires"]), query["signature"])
+
+
+@pytest.mark.parametrize(
+    "key, size, sha256, other_secret",
+    [
+        ("ab/other.png", 10, SHA256, False),
+        ("ab/cd.png", 11, SHA256, False),
+        ("ab/cd.png", 10, "cd" * 32, False),
+        ("ab/cd.png", 10, SHA256, True),
+    ],
+)
+def test_tampered_upload_urls_are_rejected(key, size, sha256, other_secret):
+    signer = UploadSigner("/storage-uploads", "secret")
+    presigned = signer.presign("ab/cd.png", 10, SHA256, "image/png", expires_in=60)
+    query = {name: values[0] for name, values in parse_qs(urlsplit(presigned.url).query).items()}
+    if other_secret:
+        signer = UploadSigner("/storage-uploads", "other secret")
+
+    with pytest.raises(ValidationError, match="Invalid upload signature"):
+        signer.verify(key, size, sha256, int(query["expires"]), query["signature"])
+    # The expiry is signed too
+    with pytest.raises(ValidationError, match="Invalid upload signature"):
+        signer.verify("ab/cd.png", 10, SHA256, int(query["expires"]) + 1, query["signature"])
+
+
+def test_expired_upload_urls_are_rejected():
+    signer = UploadSigner("/storage-uploads", "secret")
+    presigned = signer.presign("ab/cd.png", 10, SHA256, "image/png", expires_in=-1)
+    query = {name: values[0] for name, values in parse_qs(urlsplit(presigned.url).query).items()}
+
+    with pytest.raises(ValidationError, match="expired"):
+        signer.verify("ab/cd.png", 10, SHA256, int(query["expires"]), query["signature"])
+
+
+def test_direct_upload(client, auth_headers, presign, png):
+    direct_upload = presign(auth_headers, png)
+
+    response = put(client, direct_upload, png)
+    assert response.status_code == 201
+    assert response.headers["etag"] == f'"{hashlib.sha256(png).hexdigest()}"'
+
+    confirmed = client.post(direct_upload["confirm_url"], headers=auth_headers)
+    assert confirmed.status_code == 200
+    image = confirmed.json()
+    assert (image["filename"], image["file_size"], image["mime_type"]) == (
+        "photo.png",
+        len(png) / 1000**2,
+        "image/png",
+    )
+    assert client.get(image["image_url"]).content == png
+    listed = client.get("/images/", headers=auth_headers).json()["images"]
+    assert [listed_image["image_uuid"] for listed_image in listed] == [image["image_uuid"]]
+    # Confirmed once only
+    assert client.post(direct_upload["confirm_url"], headers=auth_headers).status_code == 404
+
+
+def test_confirming_before_the_upload(client, auth_headers, presign, png):
+    direct_upload = presign(auth_headers, png)
+
+    assert client.post(direct_upload["confirm_url"], headers=auth_headers).status_code == 409
+
+    put(client, direct_upload, png)
+    assert client.post(direct_upload["confirm_url"], headers=auth_headers).status_code == 200
+
+
+def test_only_the_announced_file_is_stored(client, auth_headers, presign, png, make_image):
+    direct_upload = presign(auth_headers, png)
+
+    response = put(client, direct_upload, make_image(color=(0, 0, 0)))
+
+    assert response.status_code == 400
+    assert stored_files() == {}
+
+
+def test_uploads_need_a_valid_signature(client, auth_headers, presign, png):
+    direct_upload = presign(auth_headers, png)
+    url = direct_upload["upload"]["url"]
+
+    response = client.put(url.replace("signature=", "signature=0"), content=png)
+    assert response.status_code == 403
+    response = client.put(url.split("?")[0], content=png)
+    assert response.status_code == 400
+
+
+def test_the_sniffed_type_has_to_match_the_key(client, auth_headers, presign, png):
+    direct_upload = presign(auth_headers, png, filename="photo.jpg", content_type="image/jpeg")
+    assert urlsplit(direct_upload["upload"]["url"]).path.endswith(".jpg")
+    put(client, direct_upload, png)
+
+    response = client.post(direct_upload["confirm_url"], headers=auth_headers)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Uploaded file is image/png, not the announced image/jpeg"
+    # Dropped along with its file
+    assert stored_files() == {}
+    assert client.post(direct_upload["confirm_url"], headers=auth_headers).status_code == 404
+
+
+def test_content_type_falls_back_to_the_filename(client, auth_headers, presign, png):
+    direct_upload = presign(auth_headers, png, filename="photo.png")
+    assert urlsplit(direct_upload["upload"]["url"]).path.endswith(".png")
+    assert direct_upload["upload"]["headers"] == {"Content-Type": "image/png"}
+
+    direct_upload = presign(auth_headers, png, filename="photo", content_type="application/octet-stream")
+    assert urlsplit(direct_upload["upload"]["url"]).path.endswith(hashlib.sha256(png).hexdigest())
+    put(client, direct_upload, png)
+    # Keys without an extension take whatever the file sniffs as
+    assert client.post(direct_upload["confirm_url"], headers=auth_headers).json()["mime_type"] == "image/png"
+
+
+def test_non_images_are_rejected_on_confirm(client, auth_headers, presign):
+    data = b"<html>" * 100
+    direct_upload = presign(auth_headers, data, filename="page.html", content_type="text/html")
+    put(client, direct_upload, data)
+
+    response = client.post(direct_upload["confirm_url"], headers=auth_headers)
+
+    assert response.status_code == 415
+    assert stored_files() == {}
+
+
+def test_size_limit(client, auth_headers, png, monkeypatch):
+    monkeypatch.setattr(config, "DIRECT_UPLOAD_MAX_SIZE_MB", len(png) / 2 / 1000**2)
+    body = {"filename": "photo.png", "size": len(png), "sha256": hashlib.sha256(png).hexdigest()}
+
+    response = client.post("/direct-uploads/", json=body, headers=auth_headers)
+
+    assert response.status_code == 400
+    assert "exceeds" in response.json()["detail"]
+
+
+def test_uploads_can_only_be_confirmed_by_their_owner(client, register_user, presign, png):
+    alice = register_user("alice@example.com")
+    bob = register_user("bob@example.com")
+    direct_upload = presign(alice, png)
+    put(client, direct_upload, png)
+
+    assert client.post(direct_upload["confirm_url"], headers=bob).status_code == 404
+    assert client.post(direct_upload["confirm_url"]).status_code == 404
+    assert client.post("/direct-uploads/not-a-uuid/confirm", headers=alice).status_code == 404
+    assert client.post(direct_upload["confirm_url"], headers=alice).status_code == 200
+
+
+async def test_sweeper_drops_expired_uploads(client, auth_headers, presign, png):
+    expired = presign(auth_headers, png)
+    put(client, expired, png)
+    pending = presign(auth_headers, png, filename="other.png")
+    with SessionLocal() as db:
+        db.execute(
+            update(DirectUpload)
+            .where(DirectUpload.uuid == uuid.UUID(expired["upload_uuid"]))
+            .values(expires_at=utcnow() - datetime.timedelta(seconds=1))
+        )
+        db.commit()
+
+    assert await sweep_direct_uploads() == 1
+
+    assert stored_files() == {}
+    assert client.post(expired["confirm_url"], headers=auth_headers).status_code == 404
+    put(client, pending, png)
+    assert client.post(pending["confirm_url"], headers=auth_headers).status_code == 200
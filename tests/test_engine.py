@@ -0,0 +1,65 @@
+import pytest
+from sqlalchemy import DateTime, select
+
+import config
+from api.models import User
+from engine import Base, SessionLocal, async_engine, engine, pool_options
+from utils import to_async_database_url
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize(
+    "url, async_url",
+    [
+        ("postgresql://user:pw@db:5432/images", "postgresql+asyncpg://user:pw@db:5432/images"),
+        ("postgres://user:pw@db/images", "postgresql+asyncpg://user:pw@db/images"),
+        ("postgresql://db/images?sslmode=require", "postgresql+asyncpg://db/images?ssl=require"),
+        ("postgresql+asyncpg://db/images", "postgresql+asyncpg://db/images"),
+        ("sqlite:///images.db", "sqlite+aiosqlite:///images.db"),
+        ("not a url", "not a url"),
+    ],
+)
+def test_to_async_database_url(url, async_url):
+    assert to_async_database_url(url) == async_url
+
+
+def test_pool_options():
+    assert pool_options("sqlite+aiosqlite:///images.db") == {}
+    assert pool_options("postgresql+asyncpg://db/images") == {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+    }
+
+
+def test_engines_share_the_database():
+    assert async_engine.url.drivername == "sqlite+aiosqlite"
+    assert async_engine.url.database == engine.url.database
+
+
+async def test_async_sessions_see_what_the_sync_engine_wrote(db):
+    with SessionLocal() as session:
+        session.add(User(email="user@example.com", hashed_password="hash"))
+        session.commit()
+
+    assert (await db.execute(select(User.email))).scalars().all() == ["user@example.com"]
+
+
+@pytest.mark.parametrize(
+    "column",
+    [
+        column
+        for table in Base.metadata.sorted_tables
+        for column in table.columns
+        if isinstance(column.type, DateTime) and not column.type.timezone
+    ],
+    ids=str,
+)
+def test_naive_columns_default_to_naive_datetimes(column):
+    # asyncpg rejects aware datetimes for `timestamp without time zone`, SQLite would store them either way
+    for default in (column.default, column.onupdate):
+        if default is not None and default.is_callable:
+            assert default.arg(None).tzinfo is None
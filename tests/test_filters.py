@@ -0,0 +1,186 @@
+import datetime
+import json
+import random
+import re
+import uuid
+
+import pytest
+from sqlalchemy import insert, text, update
+
+from api.crud.image import ImageFilters, _images_by_user_query, prefix_upper_bound
+from api.models import Image, User
+from engine import AsyncSessionLocal, SessionLocal, async_engine
+from utils import utcnow
+
+pytestmark = pytest.mark.anyio
+
+FILENAME_PREFIXES = ("IMG_", "DSC", "screenshot-", "holiday-", "scan-", "avatar-")
+postgres_only = pytest.mark.skipif(async_engine.dialect.name != "postgresql", reason="Needs pg_trgm")
+
+
+def listed(client, headers, **params) -> list[str]:
+    return [image["filename"] for image in client.get("/images/", params=params, headers=headers).json()["images"]]
+
+
+def set_columns(image_uuid: str, **values):
+    with SessionLocal() as db:
+        db.execute(update(Image).where(Image.uuid == uuid.UUID(image_uuid)).values(**values))
+        db.commit()
+
+
+@pytest.fixture
+def filenames(client, auth_headers, upload):
+    for filename in ("IMG_1.png", "img_20.png", "IMGX1.png", "holiday.png", "100%.png", "my_IMG_1.png"):
+        upload(auth_headers, filename)
+
+
+def test_prefix_upper_bound():
+    assert prefix_upper_bound("img_1") == "img_2"
+    assert prefix_upper_bound("a\ud7ff") == "a\ue000"
+    assert prefix_upper_bound("a\U0010ffff") == "b"
+    assert prefix_upper_bound("\U0010ffff") is None
+
+
+def test_search_matches_anywhere_in_the_name(client, auth_headers, filenames):
+    assert sorted(listed(client, auth_headers, q="img_1")) == ["IMG_1.png", "my_IMG_1.png"]
+    # % and _ are literal characters, not wildcards
+    assert listed(client, auth_headers, q="0%") == ["100%.png"]
+
+
+def test_prefix_matches_the_start_of_the_name(client, auth_headers, filenames):
+    assert sorted(listed(client, auth_headers, prefix="img_")) == ["IMG_1.png", "img_20.png"]
+    assert sorted(listed(client, auth_headers, prefix="Img_2")) == ["img_20.png"]
+    assert listed(client, auth_headers, prefix="100%") == ["100%.png"]
+    assert listed(client, auth_headers, prefix="%") == []
+    assert listed(client, auth_headers, prefix="\U0010ffff") == []
+
+
+def test_date_range_includes_both_ends(client, auth_headers, upload):
+    days = [datetime.datetime(2024, 5, day) for day in (1, 2, 3)]
+    for day in days:
+        set_columns(upload(auth_headers, f"{day:%d}.png")["image_uuid"], upload_time=day)
+
+    filenames = listed(client, auth_headers, uploaded_after=days[1].isoformat(), uploaded_before=days[2].isoformat())
+    assert filenames == ["03.png", "02.png"]
+    # Aware datetimes are converted to UTC
+    assert listed(client, auth_headers, uploaded_before="2024-05-01T02:00:00+02:00") == ["01.png"]
+
+
+def test_size_range_includes_both_ends(client, auth_headers, upload):
+    for file_size in (0.5, 1.0, 1.5):
+        set_columns(upload(auth_headers, f"{file_size}.png")["image_uuid"], file_size=file_size)
+
+    assert listed(client, auth_headers, min_size=1.0, max_size=1.5) == ["1.5.png", "1.0.png"]
+    assert client.get("/images/", params={"min_size": -1}, headers=auth_headers).status_code == 422
+
+
+async def seed_library(images: int, users: int) -> int:
+    """One user with `images` images next to as many belonging to others, returns the user's id."""
+    rng = random.Random(0)
+    now = utcnow()
+    async with AsyncSessionLocal() as db:
+        user_rows = [
+            {"uuid": uuid.uuid4(), "email": f"explain-{index}@example.com", "hashed_password": "-"}
+            for index in range(users)
+        ]
+        user_ids = (await db.scalars(insert(User).returning(User.id, sort_by_parameter_order=True), user_rows)).all()
+        rows = [
+            {
+                "uuid": uuid.uuid4(),
+                "filename": f"{rng.choice(FILENAME_PREFIXES)}{index}.{rng.choice(('jpg', 'png', 'webp'))}",
+                "file_size": round(rng.uniform(0.01, 2.0), 6),
+                "url": "/media/seed.png",
+                "storage_key": "seed.png",
+                "upload_time": now - datetime.timedelta(seconds=rng.randrange(3 * 365 * 86400)),
+                "user_id": user_ids[0] if index % 2 == 0 else rng.choice(user_ids[1:]),
+            }
+            for index in range(images * 2)
+        ]
+        await db.execute(insert(Image), rows)
+        await db.commit()
+        # Fresh statistics, as autovacuum would have gathered on a real table
+        await db.execute(text("ANALYZE"))
+        await db.commit()
+    return user_ids[0]
+
+
+async def explain(query) -> tuple[list[str], list[str]]:
+    """(indexes used, table scans on `images`) in the query's plan."""
+    async with async_engine.connect() as connection:
+        dialect = connection.dialect
+        sql = str(query.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+        if dialect.name == "postgresql":
+            plan = (await connection.execute(text("EXPLAIN (FORMAT JSON) " + sql))).scalar()
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            indexes, scans = [], []
+            nodes = [plan[0]["Plan"]]
+            while nodes:
+                node = nodes.pop()
+                nodes.extend(node.get("Plans", []))
+                if "Index Name" in node:
+                    indexes.append(node["Index Name"])
+                if node["Node Type"] == "Seq Scan" and node.get("Relation Name") == "images":
+                    scans.append(node["Node Type"])
+            return indexes, scans
+        details = [row[-1] for row in (await connection.execute(text("EXPLAIN QUERY PLAN " + sql))).all()]
+        indexes = [
+            match.group(1) for detail in details if (match := re.search(r"USING (?:COVERING )?INDEX (\w+)", detail))
+        ]
+        return indexes, [detail for detail in details if re.match(r"SCAN images\b", detail)]
+
+
+@pytest.fixture
+async def library_user_id(db):
+    return await seed_library(images=5000, users=20)
+
+
+NOW = utcnow()
+LAST_MONTH = NOW - datetime.timedelta(days=30)
+
+
+@pytest.mark.parametrize(
+    "filters, after, index",
+    [
+        pytest.param(ImageFilters(), None, "ix_images_user_id_upload_time_id", id="newest"),
+        pytest.param(
+            ImageFilters(),
+            (NOW - datetime.timedelta(days=200), 10**9),
+            "ix_images_user_id_upload_time_id",
+            id="next_page",
+        ),
+        pytest.param(ImageFilters(prefix="screenshot-1"), None, "ix_images_user_id_filename_lower", id="prefix"),
+        pytest.param(
+            ImageFilters(uploaded_after=LAST_MONTH - datetime.timedelta(days=7), uploaded_before=LAST_MONTH),
+            None,
+            "ix_images_user_id_upload_time_id",
+            id="date_range",
+        ),
+        pytest.param(
+            ImageFilters(min_size=1.5, max_size=1.55), None, "ix_images_user_id_file_size_id", id="size_range"
+        ),
+        pytest.param(
+            ImageFilters(search="liday-12"), None, "ix_images_filename_trgm", id="search", marks=postgres_only
+        ),
+        pytest.param(
+            ImageFilters(search="img_", min_size=0.5, uploaded_after=LAST_MONTH),
+            None,
+            "ix_images_filename_trgm",
+            id="combined",
+            marks=postgres_only,
+        ),
+        pytest.param(
+            ImageFilters(prefix="img_1", min_size=0.5, uploaded_after=LAST_MONTH),
+            None,
+            "ix_images_user_id_filename_lower",
+            id="prefix_combined",
+        ),
+    ],
+)
+async def test_listing_plans_use_the_filter_indexes(library_user_id, filters, after, index):
+    # The query /images/ runs, one row more than the default page to find the next cursor
+    query = _images_by_user_query(library_user_id, after, filters).limit(51)
+
+    indexes, scans = await explain(query)
+
+    assert index in indexes
+    assert scans == []
@@ -0,0 +1,150 @@
+import pytest
+from sqlalchemy import select
+
+import api.crud.job
+from api.crud.job import claim_jobs, complete_job, enqueue_job, fail_job, retry_delay
+from api.jobs import JOB_HANDLERS
+from api.models import Job
+from engine import SessionLocal
+from utils import utcnow
+from worker import Worker
+
+pytestmark = pytest.mark.anyio
+
+
+async def queue(db, *jobs: tuple[str, dict], delay: float = 0) -> list[Job]:
+    queued = [enqueue_job(kind, payload, db, delay=delay) for kind, payload in jobs]
+    await db.commit()
+    return queued
+
+
+async def job_states(db) -> list[tuple]:
+    db.expire_all()
+    return (await db.execute(select(Job.kind, Job.status, Job.attempts).order_by(Job.id))).all()
+
+
+async def test_claim_hands_out_due_jobs_once(db):
+    await queue(db, ("first", {}), ("second", {"n": 2}))
+    await queue(db, ("later", {}), delay=60)
+
+    claimed = await claim_jobs(db, 10, visibility_timeout=30)
+
+    assert [(job.kind, job.payload, job.status, job.attempts) for job in claimed] == [
+        ("first", {}, "running", 1),
+        ("second", {"n": 2}, "running", 1),
+    ]
+    assert all(job.locked_until > utcnow() for job in claimed)
+    assert await claim_jobs(db, 10, visibility_timeout=30) == []
+
+
+async def test_claim_respects_the_limit(db):
+    await queue(db, ("first", {}), ("second", {}))
+
+    assert [job.kind for job in await claim_jobs(db, 1, visibility_timeout=30)] == ["first"]
+    assert [job.kind for job in await claim_jobs(db, 1, visibility_timeout=30)] == ["second"]
+
+
+async def test_abandoned_jobs_are_claimed_again(db):
+    await queue(db, ("job", {}))
+    await claim_jobs(db, 1, visibility_timeout=-1)
+
+    claimed = await claim_jobs(db, 1, visibility_timeout=30)
+
+    assert [(job.kind, job.attempts) for job in claimed] == [("job", 2)]
+
+
+async def test_abandoned_jobs_out_of_attempts_fail(db, monkeypatch):
+    monkeypatch.setattr(api.crud.job, "JOB_MAX_ATTEMPTS", 1)
+    await queue(db, ("job", {}))
+    await claim_jobs(db, 1, visibility_timeout=-1)
+
+    assert await claim_jobs(db, 1, visibility_timeout=30) == []
+    assert await job_states(db) == [("job", "failed", 1)]
+
+
+async def test_complete_removes_the_job(db):
+    (job,) = await queue(db, ("job", {}))
+
+    await complete_job(job.id, db)
+
+    assert await job_states(db) == []
+
+
+async def test_failed_jobs_are_retried_later(db):
+    (job,) = await queue(db, ("job", {}))
+    await claim_jobs(db, 1, visibility_timeout=30)
+
+    failed = await fail_job(job.id, "boom", db)
+
+    assert (failed.status, failed.last_error, failed.locked_until) == ("queued", "boom", None)
+    assert failed.run_at > utcnow()
+    assert await claim_jobs(db, 1, visibility_timeout=30) == []
+
+
+async def test_jobs_give_up_after_their_last_attempt(db, monkeypatch):
+    monkeypatch.setattr(api.crud.job, "JOB_MAX_ATTEMPTS", 1)
+    (job,) = await queue(db, ("job", {}))
+    await claim_jobs(db, 1, visibility_timeout=30)
+
+    assert (await fail_job(job.id, "boom", db)).status == "failed"
+    assert await fail_job(-1, "boom", db) is None
+
+
+def test_retry_delay_backs_off_exponentially(monkeypatch):
+    monkeypatch.setattr(api.crud.job, "JOB_RETRY_BACKOFF", 10.0)
+    monkeypatch.setattr(api.crud.job, "JOB_RETRY_BACKOFF_MAX", 60.0)
+
+    assert 5 <= retry_delay(1) <= 10
+    assert 20 <= retry_delay(3) <= 40
+    assert 30 <= retry_delay(10) <= 60
+
+
+async def test_worker_runs_handlers_with_the_payload(db, monkeypatch):
+    calls = []
+
+    async def handler(**payload):
+        calls.append(payload)
+
+    monkeypatch.setitem(JOB_HANDLERS, "test", handler)
+    await queue(db, ("test", {"content_id": 1}))
+    (job,) = await claim_jobs(db, 1, visibility_timeout=30)
+
+    await Worker(concurrency=1, poll_interval=0, timeout=5, visibility_timeout=30)._run(job)
+
+    assert calls == [{"content_id": 1}]
+    assert await job_states(db) == []
+
+
+async def test_worker_records_failures(db, monkeypatch):
+    async def handler():
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(JOB_HANDLERS, "test", handler)
+    await queue(db, ("test", {}), ("unknown", {}))
+    jobs = await claim_jobs(db, 2, visibility_timeout=30)
+    worker = Worker(concurrency=1, poll_interval=0, timeout=5, visibility_timeout=30)
+
+    for job in jobs:
+        await worker._run(job)
+
+    assert await job_states(db) == [("test", "queued", 1), ("unknown", "failed", 1)]
+    errors = (await db.execute(select(Job.last_error).order_by(Job.id))).scalars().all()
+    assert errors == ["RuntimeError: boom", "Unknown job kind: unknown"]
+
+
+def test_new_uploads_queue_their_variants(client, auth_headers, upload):
+    upload(auth_headers)
+
+    with SessionLocal() as session:
+        jobs = session.execute(select(Job.kind, Job.payload)).all()
+    assert [kind for kind, _ in jobs] == ["generate-variants"]
+    assert set(jobs[0].payload) == {"content_id", "storage_key"}
+
+    # Content that is already stored has its variants
+    upload(auth_headers, "again.png")
+    with SessionLocal() as session:
+        assert len(session.execute(select(Job.id)).all()) == 1
+
+
+def test_retry_delay_has_jitter():
+    assert len({retry_delay(1) for _ in range(10)}) > 1
@@ -0,0 +1,172 @@
+import datetime
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+from starlette.datastructures import Headers
+
+import api.jwt_keys
+import dependencies
+from api.jwt_keys import JWTKeyring, parse_signing_keys
+from api.models import SigningKey
+from api.utils import decode_jwt_claims, generate_jwt_token
+from ratelimit import client_key
+
+pytestmark = pytest.mark.anyio
+
+WEEK = 7 * 24 * 3600.0
+
+
+class Clock:
+    """Drives both clocks the keyring reads, time.time() for rotation periods and utcnow() for activation."""
+
+    def __init__(self, monkeypatch, start: float = 1000 * WEEK):
+        self.now = start
+        monkeypatch.setattr(api.jwt_keys.time, "time", lambda: self.now)
+        monkeypatch.setattr(api.jwt_keys, "utcnow", lambda: self.utcnow)
+
+    @property
+    def utcnow(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.now, datetime.UTC).replace(tzinfo=None)
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+def make_keyring(static_keys: list[str] = ()) -> JWTKeyring:
+    return JWTKeyring(list(static_keys), token_lifetime=3600, rotation_interval=WEEK, refresh_interval=60)
+
+
+async def stored_kids(db) -> list[str]:
+    return (await db.execute(select(SigningKey.kid).order_by(SigningKey.active_from))).scalars().all()
+
+
+def test_parse_signing_keys():
+    keys = parse_signing_keys(["new:secret-2", "old:secret:with:colons"])
+
+    assert [(key.kid, key.secret) for key in keys] == [("new", "secret-2"), ("old", "secret:with:colons")]
+    with pytest.raises(ValueError):
+        parse_signing_keys(["no-secret"])
+
+
+async def test_static_keys_sign_with_the_first_and_verify_with_all():
+    keyring = make_keyring(["new:secret-2", "old:secret-1"])
+    await keyring.load()
+
+    assert keyring.signing_key().kid == "new"
+    assert keyring.verification_key("old") == "secret-1"
+    with pytest.raises(jwt.InvalidTokenError, match="Unknown signing key"):
+        keyring.verification_key("other")
+    with pytest.raises(jwt.InvalidTokenError):
+        keyring.verification_key(None)
+
+
+def test_unloaded_keyring_cant_sign():
+    with pytest.raises(RuntimeError):
+        make_keyring().signing_key()
+
+
+async def test_first_key_signs_right_away(db, monkeypatch):
+    clock = Clock(monkeypatch)
+    keyring = make_keyring()
+
+    await keyring.load()
+
+    assert keyring.signing_key().kid == "k1000"
+    assert keyring.signing_key().active_from == clock.utcnow
+    assert await stored_kids(db) == ["k1000"]
+
+
+async def test_processes_share_the_same_keys(db, monkeypatch):
+    Clock(monkeypatch)
+    first, second = make_keyring(), make_keyring()
+
+    await first.load()
+    await second.load()
+
+    assert await stored_kids(db) == ["k1000"]
+    assert first.signing_key() == second.signing_key()
+
+
+async def test_rotation_publishes_before_signing(db, monkeypatch):
+    clock = Clock(monkeypatch)
+    keyring = make_keyring()
+    await keyring.load()
+    old = keyring.signing_key()
+
+    clock.advance(WEEK)
+    await keyring.load()
+    # Every process has to know the new key before tokens are signed with it
+    assert keyring.signing_key() == old
+    assert keyring.verification_key("k1001")
+
+    clock.advance(keyring.publish_delay)
+    assert keyring.signing_key().kid == "k1001"
+    assert keyring.verification_key(old.kid) == old.secret
+
+
+async def test_retired_keys_are_dropped_once_their_tokens_expired(db, monkeypatch):
+    clock = Clock(monkeypatch)
+    keyring = make_keyring()
+    await keyring.load()
+    clock.advance(WEEK)
+    await keyring.load()
+
+    clock.advance(keyring.publish_delay + 3600 - 1)
+    await keyring.load()
+    assert await stored_kids(db) == ["k1000", "k1001"]
+
+    clock.advance(2)
+    await keyring.load()
+    assert await stored_kids(db) == ["k1001"]
+    with pytest.raises(jwt.InvalidTokenError):
+        keyring.verification_key("k1000")
+
+
+async def test_tokens_carry_the_kid(monkeypatch):
+    keyring = make_keyring(["new:secret-new-long-enough-for-hs256", "old:secret-old-long-enough-for-hs256"])
+    monkeypatch.setattr("api.utils.jwt_keyring", keyring)
+
+    token = generate_jwt_token("d7c1bb38-7b0a-4f6b-9d2e-3c1f0b4f5a1e")
+
+    assert jwt.get_unverified_header(token)["kid"] == "new"
+    assert decode_jwt_claims(token)["user_uuid"] == "d7c1bb38-7b0a-4f6b-9d2e-3c1f0b4f5a1e"
+    old_token = jwt.encode(
+        {"user_uuid": "x"}, "secret-old-long-enough-for-hs256", algorithm="HS256", headers={"kid": "old"}
+    )
+    assert decode_jwt_claims(old_token)["user_uuid"] == "x"
+    forged = jwt.encode({"user_uuid": "x"}, "secret-old-long-enough-for-hs256", headers={"kid": "new"})
+    with pytest.raises(jwt.InvalidTokenError, match="Invalid token"):
+        decode_jwt_claims(forged)
+    unknown = jwt.encode({"user_uuid": "x"}, "secret-gone-long-enough-for-hs256", headers={"kid": "gone"})
+    with pytest.raises(jwt.InvalidTokenError, match="Invalid token"):
+        decode_jwt_claims(unknown)
+
+
+def use_keyring(monkeypatch, static_keys: list[str]) -> JWTKeyring:
+    keyring = make_keyring(static_keys)
+    monkeypatch.setattr("api.utils.jwt_keyring", keyring)
+    monkeypatch.setattr("dependencies.jwt_keyring", keyring)
+    return keyring
+
+
+async def test_cached_tokens_stop_working_once_their_key_is_revoked(monkeypatch):
+    await use_keyring(monkeypatch, ["old:secret-old-long-enough-for-hs256"]).load()
+    user_uuid = "d7c1bb38-7b0a-4f6b-9d2e-3c1f0b4f5a1e"
+    token = generate_jwt_token(user_uuid)
+    assert str(dependencies.get_token_user_uuid(token)) == user_uuid
+    # Cached, so not verified again while its key is still in the ring
+    monkeypatch.setattr(dependencies, "decode_jwt_claims", lambda token: pytest.fail("verified again"))
+    assert str(dependencies.get_token_user_uuid(token)) == user_uuid
+    monkeypatch.undo()
+
+    # Redeployed with the old key taken out of the ring
+    await use_keyring(monkeypatch, ["new:secret-new-long-enough-for-hs256"]).load()
+
+    scope = {"client": ("203.0.113.7", 1234)}
+    assert client_key(scope, Headers({"Authorization": f"Bearer {token}"}), 0) == "ip:203.0.113.7"
+    with pytest.raises(HTTPException) as exc_info:
+        dependencies.get_token_user_uuid(token)
+    assert exc_info.value.detail == "Invalid token"
+    assert dependencies.claims_cache.get(token) is None
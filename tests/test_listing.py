@@ -0,0 +1,143 @@
+import datetime
+import uuid
+
+import orjson
+import pytest
+from sqlalchemy import select, update
+
+import app
+from api.crud.image import LISTING_COLUMNS, get_images_page
+from api.models import Image
+from api.schemas.image import ImageResponseSchema, image_listing_item
+from api.utils import decode_cursor, encode_cursor
+from engine import SessionLocal
+from exceptions import ValidationError
+
+pytestmark = pytest.mark.anyio
+
+
+def test_cursor_round_trip():
+    upload_time = datetime.datetime(2024, 5, 1, 12, 30, 15, 123456)
+
+    assert decode_cursor(encode_cursor(upload_time, 42)) == (upload_time, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "é", "__58MQ", "MjAyNC0wNS0wMXw0Mnwx", "bm90IGEgZGF0ZXw0Mg"])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(ValidationError):
+        decode_cursor(cursor)
+
+
+def test_pages_cover_every_image_once(client, auth_headers, upload):
+    uploaded = [upload(auth_headers, f"photo-{index}.png")["image_uuid"] for index in range(7)]
+
+    listed, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/images/", params=params, headers=auth_headers).json()
+        assert len(page["images"]) <= 3
+        listed += [image["image_uuid"] for image in page["images"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert listed == uploaded[::-1]
+
+
+def test_listing_only_shows_the_users_images(client, register_user, upload):
+    alice, bob = register_user("alice@example.com"), register_user("bob@example.com")
+    upload(alice, "alice.png")
+
+    assert client.get("/images/", headers=bob).json() == {"images": [], "next_cursor": None}
+
+
+def test_invalid_cursor_is_a_bad_request(client, auth_headers):
+    response = client.get("/images/", params={"cursor": "garbage"}, headers=auth_headers)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_ndjson_stream(client, auth_headers, upload):
+    uploaded = [upload(auth_headers, f"photo-{index}.png") for index in range(3)]
+
+    response = client.get("/images/", params={"stream": True}, headers=auth_headers)
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [orjson.loads(line) for line in response.content.splitlines()]
+    assert [line["image_uuid"] for line in lines] == [image["image_uuid"] for image in reversed(uploaded)]
+    assert lines[0]["filename"] == "photo-2.png"
+
+
+def test_ndjson_stream_continues_from_a_cursor(client, auth_headers, upload):
+    for index in range(3):
+        upload(auth_headers, f"photo-{index}.png")
+    cursor = client.get("/images/", params={"limit": 1}, headers=auth_headers).json()["next_cursor"]
+
+    response = client.get("/images/", params={"stream": True, "cursor": cursor}, headers=auth_headers)
+
+    assert [orjson.loads(line)["filename"] for line in response.content.splitlines()] == ["photo-1.png", "photo-0.png"]
+
+
+def test_listing_items_match_the_image_schema(client, auth_headers, upload):
+    uploaded = upload(auth_headers)
+    with SessionLocal() as db:
+        db.execute(update(Image).values(upload_time=datetime.datetime(2024, 5, 1, 12, 30, 15, 120000)))
+        db.commit()
+        images = db.scalars(select(Image)).all()
+        expected = ImageResponseSchema.from_image(images[0]).model_dump(mode="json")
+
+    listed = client.get("/images/", headers=auth_headers).json()["images"]
+
+    assert listed == [expected]
+    assert expected["image_uuid"] == uploaded["image_uuid"]
+    assert expected["upload_time"] == "2024-05-01T12:30:15.120000"
+    assert expected["variants"]
+
+
+def test_listing_items_without_content_have_no_variants(client, auth_headers, upload):
+    upload(auth_headers)
+    # Images from before content deduplication
+    with SessionLocal() as db:
+        db.execute(update(Image).values(content_id=None))
+        db.commit()
+
+    assert client.get("/images/", headers=auth_headers).json()["images"][0]["variants"] == {}
+
+
+async def test_pages_are_column_rows(db, client, auth_headers, upload):
+    uploaded = upload(auth_headers)
+    user_id = (await db.execute(select(Image.user_id))).scalar_one()
+
+    rows = await get_images_page(user_id, db, limit=10)
+
+    assert [tuple(row._fields) for row in rows] == [tuple(column.key for column in LISTING_COLUMNS)]
+    item = image_listing_item(rows[0])
+    assert item["image_uuid"] == uuid.UUID(uploaded["image_uuid"])
+    assert orjson.loads(orjson.dumps(item))["image_uuid"] == uploaded["image_uuid"]
+
+
+async def test_ndjson_stream_is_sent_in_chunks(db, client, auth_headers, upload, monkeypatch):
+    for index in range(5):
+        upload(auth_headers, f"photo-{index}.png")
+    user_id = (await db.execute(select(Image.user_id).limit(1))).scalar_one()
+    monkeypatch.setattr(app, "NDJSON_CHUNK_SIZE", 1)
+
+    chunks = [chunk async for chunk in app.stream_images_ndjson(user_id, None, app.ImageFilters(), None)]
+
+    # Each line overflows the chunk on its own, so each one is a chunk ending with its newline
+    assert len(chunks) == 5
+    assert all(chunk.endswith(b"\n") and chunk.count(b"\n") == 1 for chunk in chunks)
+
+
+async def test_ndjson_stream_buffers_small_lines(db, client, auth_headers, upload):
+    for index in range(5):
+        upload(auth_headers, f"photo-{index}.png")
+    user_id = (await db.execute(select(Image.user_id).limit(1))).scalar_one()
+
+    chunks = [chunk async for chunk in app.stream_images_ndjson(user_id, None, app.ImageFilters(), None)]
+
+    assert len(chunks) == 1
+    assert [orjson.loads(line)["filename"] for line in chunks[0].splitlines()] == [
+        f"photo-{index}.png" for index in reversed(range(5))
+    ]
@@ -0,0 +1,87 @@
+import pytest
+
+import config
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter():
+    counter = Counter("errors", "Errors", ("operation",))
+    counter.inc(operation="save")
+    counter.inc(2, operation="save")
+    counter.inc(operation='say "hi"\n')
+
+    assert counter.render().splitlines() == [
+        "# HELP errors Errors",
+        "# TYPE errors counter",
+        'errors_total{operation="save"} 3',
+        'errors_total{operation="say \\"hi\\"\\n"} 1',
+    ]
+
+
+def test_gauge_set_and_callback():
+    gauge = Gauge("temperature", "Temperature")
+    gauge.set(21.5)
+    computed = Gauge("pool", "Pool", ("state",), callback=lambda: {("idle",): 2})
+
+    assert gauge.render().splitlines()[-1] == "temperature 21.5"
+    assert computed.render().splitlines()[-1] == 'pool{state="idle"} 2'
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency", "Latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, route="/")
+
+    assert histogram.render().splitlines()[2:] == [
+        'latency_bucket{route="/",le="0.1"} 2',
+        'latency_bucket{route="/",le="1"} 3',
+        'latency_bucket{route="/",le="+Inf"} 4',
+        'latency_sum{route="/"} 3.65',
+        'latency_count{route="/"} 4',
+    ]
+
+
+def test_histogram_time():
+    histogram = Histogram("stage", "Stage", ("stage",))
+
+    with pytest.raises(ValueError):
+        with histogram.time(stage="failing"):
+            raise ValueError
+
+    assert 'stage_count{stage="failing"} 1' in histogram.render()
+
+
+def test_registry_renders_every_metric():
+    registry = Registry()
+    registry.register(Counter("a", "A")).inc()
+    registry.register(Gauge("b", "B")).set(1)
+
+    assert registry.render() == "# HELP a A\n# TYPE a counter\na_total 1\n# HELP b B\n# TYPE b gauge\nb 1\n"
+
+
+def test_metrics_endpoint(client, auth_headers, upload):
+    image = upload(auth_headers)
+    client.get(f"/image-preview/{image['image_uuid']}")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    # Routes are recorded by their template, not the path
+    assert 'route="/image-preview/{image_uuid}",status="200"' in body
+    assert 'route="/upload/",status="200"' in body
+    assert 'image_uploader_stage_duration_seconds_count{stage="db_query"}' in body
+    assert "# TYPE db_pool_connections gauge" in body
+
+
+def test_unmatched_routes(client):
+    client.get("/no-such-route")
+
+    assert 'route="<unmatched>",status="404"' in client.get("/metrics").text
+
+
+def test_metrics_can_be_disabled(client, monkeypatch):
+    monkeypatch.setattr(config, "METRICS_ENABLED", False)
+
+    assert client.get("/metrics").status_code == 404
@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy import select
+
+from api.models import User
+from engine import SessionLocal
+from exceptions import PasswordHasherBusyError
+from passwords import (
+    PasswordHasher,
+    hash_password,
+    needs_rehash,
+    password_hasher,
+    verify_password,
+)
+from pools import BoundedProcessPool
+
+pytestmark = pytest.mark.anyio
+
+
+def test_hash_and_verify():
+    hashed = hash_password("password", rounds=4)
+
+    assert hashed.startswith("$2b$04$")
+    assert verify_password("password", hashed)
+    assert not verify_password("wrong", hashed)
+
+
+def test_needs_rehash():
+    hashed = hash_password("password", rounds=4)
+
+    assert not needs_rehash(hashed, rounds=4)
+    assert needs_rehash(hashed, rounds=5)
+    assert needs_rehash("not a bcrypt hash", rounds=4)
+
+
+async def test_hasher_runs_on_the_pool():
+    hasher = PasswordHasher(workers=1, max_pending=2, rounds=4)
+    try:
+        hashed = await hasher.hash("password")
+        assert await hasher.verify("password", hashed)
+        assert not await hasher.verify("wrong", hashed)
+        assert not hasher.needs_rehash(hashed)
+    finally:
+        hasher.shutdown()
+
+
+async def test_pool_rejects_work_beyond_max_pending():
+    pool = BoundedProcessPool(1, 0, PasswordHasherBusyError, "busy")
+
+    with pytest.raises(PasswordHasherBusyError, match="busy"):
+        await pool.submit(hash_password, "password", 4)
+    assert pool._executor is None
+
+
+def test_busy_hasher_answers_429(client, monkeypatch):
+    monkeypatch.setattr(password_hasher._pool, "max_pending", 0)
+
+    response = client.post("/register/", json={"email": "user@example.com", "password": "password"})
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+
+
+def test_login_upgrades_the_hash_cost(client):
+    with SessionLocal() as session:
+        session.add(User(email="user@example.com", hashed_password=hash_password("password", rounds=5)))
+        session.commit()
+
+    response = client.post("/login/", json={"email": "user@example.com", "password": "password"})
+
+    assert response.status_code == 200
+    with SessionLocal() as session:
+        hashed = session.execute(select(User.hashed_password)).scalar()
+    assert hashed.startswith("$2b$04$")
+    assert verify_password("password", hashed)
@@ -0,0 +1,160 @@
+import pytest
+from sqlalchemy import event, select, update
+from sqlalchemy.dialects import postgresql
+
+import api.quotas
+from api.crud.usage import add_usage, reconcile_usage
+from api.models import User, UserUsage
+from api.quotas import Quota, get_quota
+from engine import SessionLocal
+from exceptions import QuotaExceededError
+
+pytestmark = pytest.mark.anyio
+
+
+def test_unlimited_quota():
+    quota = Quota(image_count=10**6, total_bytes=10**12)
+
+    quota.check(images=100, size=10**9)
+    assert quota.upload_limit(1000, "1 kB") == (1000, "1 kB")
+
+
+def test_image_quota():
+    quota = Quota(image_count=2, max_images=3)
+
+    quota.check()
+    with pytest.raises(QuotaExceededError, match="Image quota of 3 images exceeded"):
+        quota.check(images=2)
+    quota.consume(10)
+    with pytest.raises(QuotaExceededError):
+        quota.check()
+
+
+def test_storage_quota():
+    quota = Quota(total_bytes=1_500_000, max_bytes=2_000_000)
+
+    quota.check(size=500_000)
+    with pytest.raises(QuotaExceededError, match="Storage quota of 2 MB exceeded"):
+        quota.check(size=500_001)
+    assert quota.upload_limit(1_000_000, "1 MB") == (500_000, "0.5 MB remaining storage quota")
+    assert quota.upload_limit(100_000, "0.1 MB") == (100_000, "0.1 MB")
+
+
+def test_full_storage_quota_rejects_unknown_sizes():
+    with pytest.raises(QuotaExceededError):
+        Quota(total_bytes=2_000_000, max_bytes=2_000_000).check()
+
+
+async def test_get_quota(db, monkeypatch):
+    monkeypatch.setattr(api.quotas, "USER_MAX_IMAGES", 10)
+    monkeypatch.setattr(api.quotas, "USER_MAX_STORAGE_MB", 5.0)
+    user = User(email="user@example.com", hashed_password="hash")
+    db.add(user)
+    await db.commit()
+
+    assert await get_quota(None, db) == Quota()
+    assert await get_quota(user, db) == Quota(max_images=10, max_bytes=5_000_000)
+
+    db.add(UserUsage(user_id=user.id, image_count=3, total_bytes=100, max_bytes=1000))
+    await db.commit()
+    # Overrides on the usage row win over the defaults
+    assert await get_quota(user, db) == Quota(image_count=3, total_bytes=100, max_images=10, max_bytes=1000)
+
+
+async def test_add_usage_upserts(db):
+    user = User(email="user@example.com", hashed_password="hash")
+    db.add(user)
+    await db.commit()
+
+    await add_usage(user.id, 2, 3000, db)
+    await add_usage(user.id, -1, -1000, db)
+    await db.commit()
+
+    usage = (await db.execute(select(UserUsage))).scalar_one()
+    assert (usage.image_count, usage.total_bytes) == (1, 2000)
+
+
+def test_uploads_and_deletes_keep_the_counters(client, auth_headers, upload, png):
+    first = upload(auth_headers)
+    upload(auth_headers, "again.png")
+
+    usage = client.get("/me/usage", headers=auth_headers).json()
+    assert usage == {"image_count": 2, "total_mb": 2 * len(png) / 1000**2, "max_images": None, "max_mb": None}
+
+    client.delete(f"/images/{first['image_uuid']}", headers=auth_headers)
+    assert client.get("/me/usage", headers=auth_headers).json()["image_count"] == 1
+
+
+def test_uploads_over_the_image_quota_are_rejected(client, auth_headers, upload, png, monkeypatch):
+    monkeypatch.setattr(api.quotas, "USER_MAX_IMAGES", 1)
+    upload(auth_headers)
+
+    response = client.post("/upload/", files={"file": ("photo.png", png, "image/png")}, headers=auth_headers)
+
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Image quota of 1 images exceeded"
+
+
+def test_uploads_are_cut_off_at_the_storage_quota(client, auth_headers, png, monkeypatch):
+    monkeypatch.setattr(api.quotas, "USER_MAX_STORAGE_MB", (len(png) - 1) / 1000**2)
+
+    response = client.post("/upload/", files={"file": ("photo.png", png, "image/png")}, headers=auth_headers)
+
+    assert response.status_code == 400
+    assert "remaining storage quota" in response.json()["detail"]
+
+
+def test_batch_uploads_stop_at_the_quota(client, auth_headers, make_image, monkeypatch):
+    monkeypatch.setattr(api.quotas, "USER_MAX_IMAGES", 2)
+    files = [("files", (f"{index}.png", make_image(color=(index, 0, 0)), "image/png")) for index in range(3)]
+
+    results = client.post("/upload/batch/", files=files, headers=auth_headers).json()["results"]
+
+    assert [result["status"] for result in results] == ["uploaded", "uploaded", "failed"]
+    assert results[2]["error"] == "Image quota of 2 images exceeded"
+
+
+async def test_reconcile_repairs_drifted_counters(client, auth_headers, upload, png, db):
+    upload(auth_headers)
+    with SessionLocal() as session:
+        session.execute(update(UserUsage).values(image_count=40, total_bytes=1))
+        session.add(User(email="other@example.com", hashed_password="hash"))
+        session.commit()
+
+    assert await reconcile_usage(db, batch_size=1) == 2
+
+    rows = (await db.execute(select(UserUsage.image_count, UserUsage.total_bytes).order_by(UserUsage.user_id))).all()
+    assert rows == [(1, len(png)), (0, 0)]
+
+
+async def test_reconcile_keeps_overrides(client, auth_headers, upload, db):
+    upload(auth_headers)
+    with SessionLocal() as session:
+        session.execute(update(UserUsage).values(image_count=40, max_images=5, retention_days=7))
+        session.commit()
+
+    await reconcile_usage(db)
+
+    row = (await db.execute(select(UserUsage.image_count, UserUsage.max_images, UserUsage.retention_days))).one()
+    assert row == (1, 5, 7)
+
+
+async def test_reconcile_locks_the_counters_before_counting(client, auth_headers, upload, db):
+    upload(auth_headers)
+    statements = []
+    event.listen(db.sync_session, "do_orm_execute", lambda state: statements.append(state.statement))
+
+    await reconcile_usage(db)
+
+    # SQLite has no row locks, what Postgres would run
+    sql = [str(statement.compile(dialect=postgresql.dialect())) for statement in statements]
+    locked = next(index for index, text in enumerate(sql) if "FROM user_usage" in text and "FOR UPDATE" in text)
+    counted = next(index for index, text in enumerate(sql) if "count(images.id)" in text)
+    assert locked < counted
+
+
+def test_updated_at_defaults_to_naive_utc():
+    # The column is `timestamp without time zone`, asyncpg rejects aware datetimes for it
+    column = UserUsage.__table__.c.updated_at
+    assert column.default.arg(None).tzinfo is None
+    assert column.onupdate.arg(None).tzinfo is None
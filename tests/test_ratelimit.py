@@ -0,0 +1,164 @@
+import os
+import subprocess
+import sys
+
+import fakeredis
+import pytest
+from starlette.applications import Starlette
+from starlette.datastructures import Headers
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import ratelimit
+from ratelimit import (
+    MemoryRateLimitStore,
+    RateLimitMiddleware,
+    RateLimitStore,
+    RedisRateLimitStore,
+    client_ip,
+    client_key,
+    match_rate_limit,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class FailingStore(RateLimitStore):
+    async def consume(self, key, capacity, refill_rate, cost=1):
+        raise ConnectionError("store is down")
+
+
+def limit_uploads(monkeypatch, requests: int):
+    limits = {"/upload/": {"POST": (requests, 60)}}
+    monkeypatch.setattr(ratelimit, "match_rate_limit", lambda path, method: match_rate_limit(path, method, limits))
+
+
+def rate_limited_client(store: RateLimitStore, trusted_proxies: int = 0) -> TestClient:
+    async def ok(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/upload/", ok, methods=["POST"]), Route("/health", ok)])
+    app.add_middleware(RateLimitMiddleware, store=store, trusted_proxies=trusted_proxies)
+    return TestClient(app)
+
+
+async def test_memory_bucket_refills_over_time(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    store = MemoryRateLimitStore(maxsize=10)
+
+    assert [await store.consume("key", 2, refill_rate=1) for _ in range(3)] == [0, 0, 1.0]
+    now[0] += 0.5
+    assert await store.consume("key", 2, refill_rate=1) == pytest.approx(0.5)
+    now[0] += 1
+    assert await store.consume("key", 2, refill_rate=1) == 0
+
+
+async def test_memory_store_forgets_the_least_recently_used_keys():
+    store = MemoryRateLimitStore(maxsize=1)
+    await store.consume("a", 1, refill_rate=0.001)
+    await store.consume("b", 1, refill_rate=0.001)
+
+    assert await store.consume("a", 1, refill_rate=0.001) == 0
+
+
+async def test_redis_bucket(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr("redis.asyncio.from_url", lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=server))
+    store = RedisRateLimitStore("redis://localhost")
+
+    assert [await store.consume("key", 2, refill_rate=0.01) for _ in range(2)] == [0, 0]
+    assert await store.consume("key", 2, refill_rate=0.01) > 0
+    await store.close()
+
+
+def test_match_rate_limit_by_longest_prefix():
+    limits = {"/upload/": {"POST": (30, 60)}, "/upload/batch/": {"POST": (5, 60)}}
+
+    assert match_rate_limit("/upload/", "POST", limits) == ("/upload/", 30, 60)
+    assert match_rate_limit("/upload/batch/", "POST", limits) == ("/upload/batch/", 5, 60)
+    assert match_rate_limit("/upload/", "GET", limits) is None
+    assert match_rate_limit("/health", "GET", limits) is None
+
+
+def test_presigned_puts_are_limited():
+    assert match_rate_limit("/storage-uploads/ab/cd/key.png", "PUT") == ("/storage-uploads/", 30, 60)
+
+
+@pytest.mark.parametrize(
+    "forwarded_for, trusted_proxies, ip",
+    [
+        (None, 1, "10.0.0.1"),
+        ("203.0.113.7", 0, "10.0.0.1"),
+        ("203.0.113.7", 1, "203.0.113.7"),
+        # A client can prepend anything, only the entries the trusted proxies added count
+        ("1.2.3.4, 203.0.113.7", 1, "203.0.113.7"),
+        ("1.2.3.4, 203.0.113.7, 10.0.0.2", 2, "203.0.113.7"),
+        ("203.0.113.7", 3, "203.0.113.7"),
+    ],
+)
+def test_client_ip(forwarded_for, trusted_proxies, ip):
+    headers = Headers({"x-forwarded-for": forwarded_for} if forwarded_for else {})
+
+    assert client_ip({"client": ("10.0.0.1", 1234)}, headers, trusted_proxies) == ip
+
+
+def test_client_key_prefers_the_user(client, auth_headers):
+    scope = {"client": ("10.0.0.1", 1234)}
+
+    assert client_key(scope, Headers(auth_headers), 0).startswith("user:")
+    assert client_key(scope, Headers({"authorization": "Bearer garbage"}), 0) == "ip:10.0.0.1"
+    assert client_key(scope, Headers({}), 0) == "ip:10.0.0.1"
+
+
+def test_middleware_answers_429_with_retry_after(monkeypatch):
+    limit_uploads(monkeypatch, 2)
+    client = rate_limited_client(MemoryRateLimitStore(maxsize=10))
+
+    assert [client.post("/upload/").status_code for _ in range(3)] == [200, 200, 429]
+    response = client.post("/upload/")
+    assert response.json() == {"detail": "Too many requests, try again later"}
+    assert response.headers["retry-after"] == "30"
+    assert client.get("/health").status_code == 200
+
+
+def test_middleware_buckets_per_forwarded_client(monkeypatch):
+    limit_uploads(monkeypatch, 1)
+    client = rate_limited_client(MemoryRateLimitStore(maxsize=10), trusted_proxies=1)
+
+    assert client.post("/upload/", headers={"X-Forwarded-For": "203.0.113.1"}).status_code == 200
+    assert client.post("/upload/", headers={"X-Forwarded-For": "203.0.113.2"}).status_code == 200
+    # Spoofing an extra entry doesn't get a fresh bucket
+    assert client.post("/upload/", headers={"X-Forwarded-For": "9.9.9.9, 203.0.113.1"}).status_code == 429
+
+
+def test_middleware_lets_requests_through_when_the_store_fails():
+    client = rate_limited_client(FailingStore())
+
+    assert client.post("/upload/").status_code == 200
+
+
+def import_config(**variables) -> subprocess.CompletedProcess:
+    # Settings are read on import, so each combination needs a fresh interpreter
+    environ = {name: value for name, value in os.environ.items() if not name.startswith("RATE_LIMIT_")}
+    return subprocess.run(
+        [sys.executable, "-c", "import config; print(config.RATE_LIMIT_ENABLED, config.RATE_LIMIT_TRUSTED_PROXIES)"],
+        env={**environ, **variables},
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_rate_limiting_is_off_by_default():
+    assert import_config().stdout.split() == ["False", "0"]
+
+
+def test_rate_limiting_needs_the_proxy_count():
+    result = import_config(RATE_LIMIT_ENABLED="True")
+
+    assert result.returncode != 0
+    assert "RATE_LIMIT_TRUSTED_PROXIES must be set" in result.stderr
+    assert import_config(RATE_LIMIT_ENABLED="True", RATE_LIMIT_TRUSTED_PROXIES="1").stdout.split() == ["True", "1"]
+    assert import_config(RATE_LIMIT_ENABLED="True", RATE_LIMIT_TRUSTED_PROXIES="0").returncode == 0
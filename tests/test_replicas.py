@@ -0,0 +1,207 @@
+import asyncio
+import contextlib
+import shutil
+import time
+import uuid
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import config
+from api.models import Image, User
+from cache import get_metadata_cache
+from engine import (
+    PrimaryPins,
+    ReplicaSet,
+    RoutingSession,
+    SessionLocal,
+    async_engine,
+    engine,
+    primary_pins,
+    read_session,
+    replicas,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def snapshot(tmp_path, name: str = "replica.db") -> str:
+    """A copy of the test database as it is now, standing in for a replica that stopped replaying."""
+    path = tmp_path / name
+    shutil.copy(engine.url.database, path)
+    return f"sqlite+aiosqlite:///{path}"
+
+
+def add_user(email: str):
+    with SessionLocal() as db:
+        db.add(User(uuid=uuid.uuid4(), email=email, hashed_password="-"))
+        db.commit()
+
+
+@pytest.fixture
+async def replica_set(tmp_path):
+    replica_set = ReplicaSet(
+        [snapshot(tmp_path, "first.db"), snapshot(tmp_path, "second.db"), "sqlite+aiosqlite:////nonexistent/x.db"],
+        max_lag=0,
+        check_timeout=5,
+    )
+    yield replica_set
+    await replica_set.dispose()
+
+
+async def test_replicas_are_picked_round_robin(replica_set):
+    first, second, down = replica_set.engines
+
+    assert [replica_set.pick() for _ in range(4)] == [first, second, down, first]
+
+    replica_set.mark_down(down)
+    replica_set.mark_down(down)
+    assert {replica_set.pick() for _ in range(4)} == {first, second}
+
+    replica_set.mark_down(first)
+    replica_set.mark_down(second)
+    assert replica_set.pick() is None
+
+
+async def test_health_checks_skip_failing_replicas(replica_set):
+    first, second, down = replica_set.engines
+    replica_set.mark_down(first)
+
+    await replica_set.check()
+
+    # Back once it passes a check again
+    assert {replica_set.pick() for _ in range(4)} == {first, second}
+
+
+async def test_replicas_that_refuse_connections_are_marked_down(replica_set):
+    first, second, down = replica_set.engines
+
+    with pytest.raises(OperationalError):
+        async with down.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    assert {replica_set.pick() for _ in range(4)} == {first, second}
+
+
+async def test_health_checks_skip_lagging_replicas(replica_set, monkeypatch):
+    first, second, down = replica_set.engines
+    replica_set.max_lag = 10
+
+    async def lag(replica):
+        return 30.0 if replica is first else 0.0
+
+    monkeypatch.setattr(replica_set, "_lag", lag)
+    await replica_set.check()
+
+    assert {replica_set.pick() for _ in range(4)} == {second, down}
+
+
+async def test_health_checks_give_up_on_hanging_replicas(replica_set, monkeypatch):
+    first, second, down = replica_set.engines
+    replica_set.check_timeout = 0.1
+
+    @contextlib.asynccontextmanager
+    async def hang():
+        await asyncio.sleep(3600)
+        yield
+
+    connect = AsyncEngine.connect
+    monkeypatch.setattr(AsyncEngine, "connect", lambda engine: hang() if engine is first else connect(engine))
+    started = time.monotonic()
+    await replica_set.check()
+
+    assert time.monotonic() - started < 5
+    assert {replica_set.pick() for _ in range(4)} == {second}
+
+
+def test_health_checks_time_out_before_the_next_one():
+    assert replicas.check_timeout == config.DB_REPLICA_CHECK_TIMEOUT < config.DB_REPLICA_CHECK_INTERVAL
+
+
+async def test_reads_go_to_the_replica_until_the_session_writes(replica_set):
+    add_user("primary@example.com")
+    replica = replica_set.engines[0]
+
+    async with read_session(replica) as db:
+        assert isinstance(db.sync_session, RoutingSession)
+        # The replica is a snapshot from before the user was added
+        assert (await db.scalars(select(User.email))).all() == []
+
+        db.add(User(uuid=uuid.uuid4(), email="new@example.com", hashed_password="-"))
+        await db.flush()
+
+        emails = (await db.scalars(select(User.email).order_by(User.email))).all()
+        assert emails == ["new@example.com", "primary@example.com"]
+        await db.commit()
+
+    await async_engine.dispose()
+
+
+async def test_without_a_replica_sessions_use_the_primary():
+    add_user("primary@example.com")
+
+    async with read_session(None) as db:
+        assert not isinstance(db.sync_session, RoutingSession)
+        assert (await db.scalars(select(User.email))).all() == ["primary@example.com"]
+
+    await async_engine.dispose()
+
+
+async def test_pins_need_replicas_and_a_window(monkeypatch):
+    user_uuid = uuid.uuid4()
+
+    await PrimaryPins(window=60).pin(user_uuid)
+    assert not await primary_pins.is_pinned(user_uuid)
+
+    monkeypatch.setattr(replicas, "engines", [object()])
+    await PrimaryPins(window=0).pin(user_uuid)
+    assert not await primary_pins.is_pinned(user_uuid)
+
+    await PrimaryPins(window=60).pin(user_uuid)
+    assert await primary_pins.is_pinned(user_uuid)
+
+
+@pytest.fixture
+def stale_replica(monkeypatch, client, tmp_path):
+    """Route reads to a snapshot of the database taken when the fixture is set up."""
+    replica = ReplicaSet([snapshot(tmp_path)], max_lag=0, check_timeout=5).engines[0]
+    monkeypatch.setattr(replicas, "engines", [replica])
+    monkeypatch.setattr(replicas, "_healthy", [replica])
+    yield replica
+    # Its connections belong to the app's event loop
+    client.portal.call(replica.dispose)
+
+
+def unpin(client, email: str):
+    with SessionLocal() as db:
+        user_uuid = db.scalars(select(User.uuid).filter(User.email == email)).one()
+    client.portal.call(get_metadata_cache().delete, f"primary-pin:{user_uuid}")
+
+
+def test_reads_stay_on_the_primary_after_a_write(stale_replica, client, auth_headers, upload):
+    upload(auth_headers)
+
+    # Pinned by the upload, the stale replica doesn't have the user or the image yet
+    assert len(client.get("/images/", headers=auth_headers).json()["images"]) == 1
+
+
+def test_unpinned_reads_go_to_the_replica(client, auth_headers, upload, request):
+    uploaded = upload(auth_headers)
+    request.getfixturevalue("stale_replica")
+    upload(auth_headers, "newer.png")
+    unpin(client, "user@example.com")
+
+    listed = client.get("/images/", headers=auth_headers).json()["images"]
+
+    assert [image["image_uuid"] for image in listed] == [uploaded["image_uuid"]]
+    with SessionLocal() as db:
+        assert len(db.scalars(select(Image)).all()) == 2
+
+
+def test_previews_fall_back_to_the_primary(stale_replica, client, auth_headers, upload):
+    uploaded = upload(auth_headers)
+
+    # Anonymous requests are never pinned. Not on the replica, found on the primary
+    assert client.get(f"/image-preview/{uploaded['image_uuid']}").status_code == 200
@@ -0,0 +1,182 @@
+import base64
+
+import pytest
+
+import api.quotas
+import config
+from api.models import UploadSession
+from api.models.image import FILENAME_MAX_LENGTH
+from api.resumable import parse_upload_metadata
+from exceptions import ValidationError
+from utils import truncate_filename
+
+TUS = {"Tus-Resumable": "1.0.0"}
+
+
+def encode(value: str) -> str:
+    return base64.b64encode(value.encode("utf-8")).decode("ascii")
+
+
+def create(client, headers, length: int, filename: str = "photo.png") -> str:
+    response = client.post(
+        "/uploads/",
+        headers={**headers, **TUS, "Upload-Length": str(length), "Upload-Metadata": f"filename {encode(filename)}"},
+    )
+    assert response.status_code == 201, response.text
+    return response.headers["location"]
+
+
+def patch(client, headers, location: str, offset: int, data: bytes):
+    return client.patch(
+        location,
+        content=data,
+        headers={
+            **headers,
+            **TUS,
+            "Upload-Offset": str(offset),
+            "Content-Type": "application/offset+octet-stream",
+        },
+    )
+
+
+def test_parse_upload_metadata():
+    value = f"filename {encode('photo.png')}, filetype {encode('image/png')},is_private"
+
+    assert parse_upload_metadata(value) == {"filename": "photo.png", "filetype": "image/png", "is_private": ""}
+    with pytest.raises(ValidationError):
+        parse_upload_metadata("filename not-base64!")
+
+
+def test_truncate_filename_keeps_the_extension():
+    assert truncate_filename("photo.png", 64) == "photo.png"
+    assert truncate_filename("a" * 100 + ".jpeg", 20) == "a" * 15 + ".jpeg"
+    assert truncate_filename("a" * 100, 20) == "a" * 20
+    assert len(truncate_filename("a." + "b" * 100, 20)) == 20
+
+
+def test_upload_in_chunks(client, auth_headers, png):
+    location = create(client, auth_headers, len(png))
+    half = len(png) // 2
+
+    first = patch(client, auth_headers, location, 0, png[:half])
+    assert first.status_code == 204
+    assert first.headers["upload-offset"] == str(half)
+
+    status = client.head(location, headers={**auth_headers, **TUS})
+    assert (status.headers["upload-offset"], status.headers["upload-length"]) == (str(half), str(len(png)))
+
+    assert patch(client, auth_headers, location, half, png[half:]).headers["upload-offset"] == str(len(png))
+    response = client.post(f"{location}/complete", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.json()["filename"] == "photo.png"
+    assert client.get(response.json()["image_url"]).content == png
+    # The session is gone once completed
+    assert client.head(location, headers={**auth_headers, **TUS}).status_code == 404
+
+
+def test_patch_at_the_wrong_offset_conflicts(client, auth_headers, png):
+    location = create(client, auth_headers, len(png))
+    patch(client, auth_headers, location, 0, png[:10])
+
+    for offset in (0, 5, 20):
+        response = patch(client, auth_headers, location, offset, png[10:])
+        assert response.status_code == 409
+        assert response.headers["upload-offset"] == "10"
+
+    assert client.head(location, headers={**auth_headers, **TUS}).headers["upload-offset"] == "10"
+
+
+def test_patch_past_the_length_is_rejected(client, auth_headers, png):
+    location = create(client, auth_headers, 10)
+
+    response = patch(client, auth_headers, location, 0, png[:20])
+
+    assert response.status_code == 413
+    assert client.head(location, headers={**auth_headers, **TUS}).headers["upload-offset"] == "0"
+
+
+def test_patch_needs_the_tus_content_type(client, auth_headers, png):
+    location = create(client, auth_headers, len(png))
+
+    response = client.patch(
+        location, content=png, headers={**auth_headers, **TUS, "Upload-Offset": "0", "Content-Type": "image/png"}
+    )
+
+    assert response.status_code == 415
+
+
+def test_incomplete_uploads_cant_complete(client, auth_headers, png):
+    location = create(client, auth_headers, len(png))
+    patch(client, auth_headers, location, 0, png[:10])
+
+    assert client.post(f"{location}/complete", headers=auth_headers).status_code == 409
+
+
+def test_uploads_belong_to_their_creator(client, register_user, png):
+    alice, bob = register_user("alice@example.com"), register_user("bob@example.com")
+    location = create(client, alice, len(png))
+
+    assert client.head(location, headers={**bob, **TUS}).status_code == 404
+    assert patch(client, bob, location, 0, png).status_code == 404
+    assert client.head(location, headers=TUS).status_code == 404
+
+
+@pytest.mark.parametrize("length", ["", "0", "-1", "ten"])
+def test_create_needs_a_valid_length(client, auth_headers, length):
+    response = client.post("/uploads/", headers={**auth_headers, **TUS, "Upload-Length": length})
+
+    assert response.status_code == 400
+
+
+def test_create_rejects_uploads_over_the_limit(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(config, "RESUMABLE_UPLOAD_MAX_SIZE_MB", 1)
+
+    response = client.post("/uploads/", headers={**auth_headers, **TUS, "Upload-Length": str(1000**2 + 1)})
+
+    assert response.status_code == 413
+
+
+def test_long_filenames_fit_the_image_column(client, auth_headers, png):
+    location = create(client, auth_headers, len(png), filename="z" * 300 + ".png")
+    patch(client, auth_headers, location, 0, png)
+
+    filename = client.post(f"{location}/complete", headers=auth_headers).json()["filename"]
+
+    assert len(filename) == FILENAME_MAX_LENGTH
+    assert filename.endswith("z.png")
+
+
+def test_quota_is_checked_again_on_completion(client, auth_headers, upload, png, make_image, monkeypatch):
+    monkeypatch.setattr(api.quotas, "USER_MAX_IMAGES", 1)
+    location = create(client, auth_headers, len(png))
+    patch(client, auth_headers, location, 0, png)
+    # Used up by another upload meanwhile
+    upload(auth_headers, data=make_image(color=(1, 2, 3)))
+
+    response = client.post(f"{location}/complete", headers=auth_headers)
+
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Image quota of 1 images exceeded"
+
+
+def test_non_images_are_dropped_on_completion(client, auth_headers):
+    data = b"not an image at all"
+    location = create(client, auth_headers, len(data))
+    patch(client, auth_headers, location, 0, data)
+
+    assert client.post(f"{location}/complete", headers=auth_headers).status_code == 415
+    assert client.head(location, headers={**auth_headers, **TUS}).status_code == 404
+
+
+def test_cancel(client, auth_headers, png):
+    location = create(client, auth_headers, len(png))
+    patch(client, auth_headers, location, 0, png[:10])
+
+    assert client.delete(location, headers=auth_headers).status_code == 204
+    assert client.head(location, headers={**auth_headers, **TUS}).status_code == 404
+
+
+def test_created_at_defaults_to_naive_utc():
+    # The column is `timestamp without time zone`, asyncpg rejects aware datetimes for it
+    assert UploadSession.__table__.c.created_at.default.arg(None).tzinfo is None
@@ -0,0 +1,116 @@
+import datetime
+
+import pytest
+from sqlalchemy import select, update
+
+import api.retention
+import config
+from api.models import Image, User, UserUsage
+from api.retention import delete_stored_files, sweep_expired_images
+from engine import SessionLocal
+from storage.memory import InMemoryStorage
+from utils import utcnow
+
+pytestmark = pytest.mark.anyio
+
+
+def age_images(days: int, *criteria):
+    with SessionLocal() as session:
+        session.execute(update(Image).filter(*criteria).values(upload_time=utcnow() - datetime.timedelta(days=days)))
+        session.commit()
+
+
+def remaining_filenames() -> list[str]:
+    with SessionLocal() as session:
+        return sorted(session.execute(select(Image.filename)).scalars())
+
+
+def test_bulk_delete(client, auth_headers, register_user, upload, make_image):
+    mine = [upload(auth_headers, f"{index}.png", make_image(color=(index, 0, 0)))["image_uuid"] for index in range(3)]
+    theirs = upload(register_user("other@example.com"), "theirs.png")["image_uuid"]
+    missing = "00000000-0000-0000-0000-000000000000"
+
+    response = client.post(
+        "/images/delete/", json={"image_uuids": mine[:2] + [theirs, missing, mine[0]]}, headers=auth_headers
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert sorted(body["deleted"]) == sorted(mine[:2])
+    assert sorted(body["not_found"]) == sorted([theirs, missing])
+    assert remaining_filenames() == ["2.png", "theirs.png"]
+    assert client.get(f"/image-preview/{mine[0]}").status_code == 400
+
+
+def test_bulk_delete_limits(client, auth_headers, monkeypatch):
+    assert client.post("/images/delete/", json={"image_uuids": []}, headers=auth_headers).status_code == 400
+
+    monkeypatch.setattr(config, "DELETE_BATCH_MAX_IMAGES", 1)
+    uuids = ["00000000-0000-0000-0000-000000000001", "00000000-0000-0000-0000-000000000002"]
+    response = client.post("/images/delete/", json={"image_uuids": uuids}, headers=auth_headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Batch exceeds 1 images"
+
+
+def test_delete_single_image(client, auth_headers, register_user, upload):
+    image_uuid = upload(auth_headers)["image_uuid"]
+
+    assert client.delete(f"/images/{image_uuid}", headers=register_user("other@example.com")).status_code == 400
+    assert client.delete("/images/not-a-uuid", headers=auth_headers).status_code == 400
+    assert client.delete(f"/images/{image_uuid}", headers=auth_headers).status_code == 204
+    assert client.delete(f"/images/{image_uuid}", headers=auth_headers).status_code == 400
+
+
+async def test_delete_stored_files_reports_failures():
+    class FailingStorage(InMemoryStorage):
+        async def delete(self, key: str):
+            if key == "broken":
+                raise OSError("broken")
+            await super().delete(key)
+
+    assert await delete_stored_files(["a", "broken", "b"], FailingStorage(), concurrency=2) == 1
+
+
+async def test_sweep_deletes_expired_images(client, auth_headers, upload, make_image, monkeypatch):
+    monkeypatch.setattr(api.retention, "IMAGE_RETENTION_DAYS", 30)
+    old = upload(auth_headers, "old.png", make_image(color=(1, 0, 0)))
+    upload(auth_headers, "new.png", make_image(color=(2, 0, 0)))
+    client.post("/upload/", files={"file": ("anonymous.png", make_image(color=(3, 0, 0)), "image/png")})
+    age_images(31, Image.filename.in_(["old.png", "anonymous.png"]))
+
+    assert await sweep_expired_images(batch_size=1) == 2
+
+    assert remaining_filenames() == ["new.png"]
+    assert client.get(old["image_url"]).status_code == 404
+    assert client.get("/me/usage", headers=auth_headers).json()["image_count"] == 1
+
+
+async def test_per_user_retention_overrides_the_default(client, register_user, upload, monkeypatch):
+    monkeypatch.setattr(api.retention, "IMAGE_RETENTION_DAYS", 30)
+    short, kept = register_user("short@example.com"), register_user("kept@example.com")
+    upload(short, "short.png")
+    upload(kept, "kept.png")
+    with SessionLocal() as session:
+        users = dict(session.execute(select(User.email, User.id)).all())
+        session.execute(
+            update(UserUsage).filter(UserUsage.user_id == users["short@example.com"]).values(retention_days=1)
+        )
+        # 0 keeps the user's images forever
+        session.execute(
+            update(UserUsage).filter(UserUsage.user_id == users["kept@example.com"]).values(retention_days=0)
+        )
+        session.commit()
+    age_images(2)
+
+    assert await sweep_expired_images() == 1
+    assert remaining_filenames() == ["kept.png"]
+
+    age_images(365)
+    assert await sweep_expired_images() == 0
+
+
+async def test_sweep_without_a_retention_period(client, auth_headers, upload):
+    upload(auth_headers)
+    age_images(10_000)
+
+    assert await sweep_expired_images() == 0
@@ -0,0 +1,125 @@
+import io
+
+import pytest
+from PIL import Image as PILImage
+
+import config
+from exceptions import InvalidImageError
+from sniffing import ImageInfo, sniff_bytes, sniff_chunks, sniff_image
+
+pytestmark = pytest.mark.anyio
+
+
+def encode(image_format: str, size: tuple[int, int] = (37, 21), **options) -> bytes:
+    output = io.BytesIO()
+    mode = "P" if image_format == "GIF" else "RGB"
+    PILImage.new(mode, size).save(output, image_format, **options)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize(
+    "image_format, options, mime_type",
+    [
+        ("PNG", {}, "image/png"),
+        ("JPEG", {}, "image/jpeg"),
+        ("JPEG", {"progressive": True}, "image/jpeg"),
+        ("GIF", {}, "image/gif"),
+        ("BMP", {}, "image/bmp"),
+        ("WEBP", {"lossless": False}, "image/webp"),
+        ("WEBP", {"lossless": True}, "image/webp"),
+        ("AVIF", {}, "image/avif"),
+    ],
+)
+def test_formats_and_dimensions(image_format, options, mime_type):
+    info = sniff_bytes(encode(image_format, **options))
+
+    assert (info.mime_type, info.width, info.height) == (mime_type, 37, 21)
+
+
+def test_extended_webp():
+    data = encode("WEBP", exif=PILImage.Exif().tobytes())
+
+    assert sniff_bytes(data) == ImageInfo("webp", "image/webp", 37, 21)
+
+
+@pytest.mark.parametrize("data", [b"<html><script>alert(1)</script></html>", b"%PDF-1.7" + b"\0" * 100, b""])
+def test_other_files_are_rejected(data):
+    with pytest.raises(InvalidImageError):
+        sniff_bytes(data)
+
+
+def test_truncated_headers():
+    data = encode("PNG")
+
+    # Not enough yet to tell, more of the file is needed
+    assert sniff_image(data[:20], complete=False) is None
+    assert sniff_image(data[:40], complete=False) is not None
+    with pytest.raises(InvalidImageError, match="Truncated image header"):
+        sniff_image(data[:20])
+
+
+def test_images_without_pixels_are_rejected():
+    data = bytearray(encode("PNG"))
+    data[16:20] = b"\0\0\0\0"
+
+    with pytest.raises(InvalidImageError, match="no pixels"):
+        sniff_bytes(bytes(data))
+
+
+def test_images_over_the_pixel_limit_are_rejected(monkeypatch):
+    monkeypatch.setattr(config, "IMAGE_MAX_PIXELS", 100)
+
+    with pytest.raises(InvalidImageError, match="exceeds 100 pixels"):
+        sniff_bytes(encode("PNG", size=(11, 10)))
+
+
+def test_headers_are_only_looked_for_in_the_first_bytes():
+    with pytest.raises(InvalidImageError, match="first 16 bytes"):
+        sniff_bytes(b"\0" * 100 + encode("PNG"), max_bytes=16)
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100_000])
+async def test_sniff_chunks_replays_every_byte(chunk_size):
+    data = encode("JPEG", size=(300, 200))
+
+    info, chunks = await sniff_chunks(chunked(data, chunk_size))
+
+    assert (info.mime_type, info.width, info.height) == ("image/jpeg", 300, 200)
+    assert b"".join([chunk async for chunk in chunks]) == data
+
+
+async def test_sniff_chunks_stops_reading_at_max_bytes():
+    read = []
+
+    async def endless():
+        while True:
+            read.append(1)
+            yield b"\0" * 10
+
+    with pytest.raises(InvalidImageError):
+        await sniff_chunks(endless(), max_bytes=50)
+    assert len(read) <= 5
+
+
+async def test_sniff_chunks_of_a_short_file():
+    with pytest.raises(InvalidImageError, match="Truncated image header"):
+        await sniff_chunks(chunked(encode("PNG")[:20], 5))
+
+
+def test_upload_rejects_files_that_arent_images(client, auth_headers):
+    response = client.post(
+        "/upload/", files={"file": ("photo.png", b"<html>not an image</html>", "image/png")}, headers=auth_headers
+    )
+
+    assert response.status_code == 415
+
+
+def test_upload_records_the_dimensions(client, auth_headers, upload):
+    image = upload(auth_headers, data=encode("GIF", size=(12, 34)))
+
+    assert (image["width"], image["height"], image["mime_type"]) == (12, 34, "image/gif")
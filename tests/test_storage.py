@@ -0,0 +1,150 @@
+import hashlib
+
+import pytest
+
+from exceptions import StorageError
+from storage import file_extension, media_type_for
+from storage.local import LocalStorage
+from storage.memory import InMemoryStorage
+
+pytestmark = pytest.mark.anyio
+
+
+async def chunks_of(data: bytes, size: int = 3):
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+@pytest.fixture(params=["local", "memory"])
+def storage(request, tmp_path):
+    if request.param == "local":
+        return LocalStorage(str(tmp_path), url_prefix="/media")
+    return InMemoryStorage(url_prefix="/media")
+
+
+async def test_save_is_content_addressed(storage, png):
+    digest = hashlib.sha256(png).hexdigest()
+
+    first = await storage.save(chunks_of(png), "a.png", "image/png")
+    second = await storage.save(chunks_of(png), "b.png", "image/png")
+
+    assert first.key == second.key
+    assert first.key.endswith(f"{digest}.png")
+    assert first.url == f"/media/{first.key}"
+    assert (first.size, first.content_hash) == (len(png), digest)
+    assert not first.already_stored
+    assert second.already_stored
+    assert await storage.read(first.key) == png
+
+
+async def test_key_extension_comes_from_the_content_type(storage, png):
+    stored_file = await storage.save(chunks_of(png), "evil.html", "image/png")
+
+    assert stored_file.key.endswith(".png")
+
+
+async def test_unknown_content_types_get_no_extension(storage):
+    stored_file = await storage.save(chunks_of(b"<html>"), "page.html", "text/html")
+
+    assert stored_file.key.endswith(hashlib.sha256(b"<html>").hexdigest())
+
+
+async def test_folders_have_keys_of_their_own(storage, png):
+    stored_file = await storage.save(chunks_of(png), "a.png", "image/png")
+
+    in_folder = await storage.save(chunks_of(png), "a.png", "image/png", folder="variants")
+
+    assert in_folder.key == f"variants/{stored_file.key}"
+    assert not in_folder.already_stored
+    assert (await storage.stat(in_folder.key)).content_hash == stored_file.content_hash
+    assert (await storage.get_response(in_folder.key)).media_type == "image/png"
+    await storage.delete(in_folder.key)
+    assert await storage.read(stored_file.key) == png
+
+
+async def test_delete(storage, png):
+    stored_file = await storage.save(chunks_of(png), "a.png", "image/png")
+
+    await storage.delete(stored_file.key)
+    await storage.delete(stored_file.key)
+
+    assert await storage.stat(stored_file.key) is None
+    with pytest.raises(StorageError):
+        await storage.read(stored_file.key)
+
+
+async def test_stat_and_read_head(storage, png):
+    stored_file = await storage.save(chunks_of(png), "a.png", "image/png")
+
+    stat = await storage.stat(stored_file.key)
+
+    assert (stat.key, stat.size, stat.content_hash) == (stored_file.key, len(png), stored_file.content_hash)
+    assert await storage.read_head(stored_file.key, 8) == png[:8]
+
+
+async def test_images_are_served_inline_without_sniffing(storage, png):
+    stored_file = await storage.save(chunks_of(png), "a.png", "image/png")
+
+    response = await storage.get_response(stored_file.key)
+
+    assert response.media_type == "image/png"
+    assert response.headers["x-content-type-options"] == "nosniff"
+    assert response.headers["content-disposition"] == f'inline; filename="{stored_file.key.rsplit("/", 1)[-1]}"'
+
+
+async def test_anything_else_is_served_as_a_download(storage):
+    stored_file = await storage.save(chunks_of(b"<script>"), "page.html", "text/html")
+
+    response = await storage.get_response(stored_file.key)
+
+    assert response.media_type == "application/octet-stream"
+    assert response.headers["x-content-type-options"] == "nosniff"
+    assert response.headers["content-disposition"].startswith("attachment;")
+
+
+async def test_missing_files_have_no_response(storage):
+    assert await storage.get_response("0" * 64) is None
+
+
+async def test_local_storage_only_accepts_its_own_keys(tmp_path):
+    storage = LocalStorage(str(tmp_path / "media"))
+    (tmp_path / "secret.txt").write_text("secret")
+
+    assert await storage.get_response("../secret.txt") is None
+    assert await storage.stat("../secret.txt") is None
+    with pytest.raises(StorageError):
+        await storage.read("../secret.txt")
+
+
+async def test_local_storage_hands_files_to_nginx(tmp_path, png):
+    storage = LocalStorage(str(tmp_path), accel_redirect_prefix="/protected-media")
+    stored_file = await storage.save(chunks_of(png), "a.png", "image/png")
+
+    response = await storage.get_response(stored_file.key)
+
+    assert response.headers["x-accel-redirect"] == f"/protected-media/{stored_file.key}"
+    assert response.media_type == "image/png"
+    assert response.body == b""
+
+
+def test_file_extension():
+    assert file_extension("image/jpeg") == ".jpg"
+    assert file_extension("image/avif") == ".avif"
+    assert file_extension("text/html") == ""
+    assert file_extension("image/svg+xml") == ""
+
+
+def test_media_type_for():
+    assert media_type_for("ab/cd/abcd.jpg") == "image/jpeg"
+    # Keys stored before extensions came from the content type
+    assert media_type_for("abcd.JPEG") == "image/jpeg"
+    assert media_type_for("abcd.html") == "application/octet-stream"
+    assert media_type_for("abcd") == "application/octet-stream"
+
+
+def test_uploads_are_served_as_their_sniffed_type(client, auth_headers, png):
+    response = client.post("/upload/", files={"file": ("evil.html", png, "text/html")}, headers=auth_headers)
+
+    served = client.get(response.json()["image_url"])
+    assert served.headers["content-type"] == "image/png"
+    assert served.headers["x-content-type-options"] == "nosniff"
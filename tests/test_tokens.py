@@ -0,0 +1,74 @@
+import datetime
+
+import jwt
+import pytest
+from sqlalchemy import select
+
+from api.blacklist import token_digest, token_expiry
+from api.crud.token import add_token_to_blacklisted, delete_expired_tokens
+from api.models import BlackListedToken
+from utils import utcnow
+
+pytestmark = pytest.mark.anyio
+
+SECRET = "a-secret-long-enough-for-hs256-keys"
+
+
+def test_token_digest_is_sha256_hex():
+    assert token_digest("token") == "3c469e9d6c5875d37a43f353d4f88e61fcf812c66eee3457465a40b0da4153e0"
+
+
+def test_token_expiry_reads_the_exp_claim():
+    exp = datetime.datetime(2030, 1, 1, 12)
+    token = jwt.encode({"exp": exp.replace(tzinfo=datetime.UTC)}, SECRET, algorithm="HS256")
+
+    assert token_expiry(token) == exp
+
+
+def test_token_expiry_without_an_exp_claim():
+    token = jwt.encode({"sub": "user"}, SECRET, algorithm="HS256")
+
+    expiry = token_expiry(token, default=60)
+
+    assert utcnow() < expiry <= utcnow() + datetime.timedelta(seconds=60)
+
+
+def test_unreadable_tokens_expire_right_away():
+    assert token_expiry("not a token") <= utcnow()
+
+
+async def test_blacklist_stores_the_digest_only(db):
+    token = jwt.encode({"sub": "user", "exp": utcnow() + datetime.timedelta(hours=1)}, SECRET, algorithm="HS256")
+
+    await add_token_to_blacklisted(token, db)
+    # Blacklisting twice is harmless
+    await add_token_to_blacklisted(token, db)
+
+    rows = (await db.execute(select(BlackListedToken))).scalars().all()
+    assert [row.token_hash for row in rows] == [token_digest(token)]
+
+
+async def test_delete_expired_tokens(db):
+    now = utcnow()
+    for index in range(5):
+        db.add(BlackListedToken(token_hash=f"expired-{index}", expires_at=now - datetime.timedelta(minutes=1)))
+    db.add(BlackListedToken(token_hash="valid", expires_at=now + datetime.timedelta(hours=1)))
+    await db.commit()
+
+    assert await delete_expired_tokens(db, batch_size=2) == 5
+
+    remaining = (await db.execute(select(BlackListedToken.token_hash))).scalars().all()
+    assert remaining == ["valid"]
+
+
+async def test_blacklisted_on_defaults_to_naive_utc(db):
+    # The column is `timestamp without time zone`, asyncpg rejects aware datetimes for it
+    default = BlackListedToken.__table__.c.blacklisted_on.default.arg(None)
+    assert default.tzinfo is None
+
+    token = jwt.encode({"sub": "user", "exp": utcnow() + datetime.timedelta(hours=1)}, SECRET, algorithm="HS256")
+    before = utcnow()
+    await add_token_to_blacklisted(token, db)
+
+    blacklisted_on = (await db.execute(select(BlackListedToken.blacklisted_on))).scalar_one()
+    assert before <= blacklisted_on <= utcnow()
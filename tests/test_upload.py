@@ -0,0 +1,62 @@
+import hashlib
+
+import config
+from storage import get_storage
+
+
+def stored_files() -> dict[str, bytes]:
+    storage = get_storage()
+    return getattr(storage, "backend", storage).files
+
+
+def test_upload_stores_the_file(client, auth_headers, png):
+    response = client.post("/upload/", files={"file": ("photo.png", png, "image/png")}, headers=auth_headers)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["filename"] == "photo.png"
+    assert body["file_size"] == len(png) / 1000**2
+    digest = hashlib.sha256(png).hexdigest()
+    assert stored_files() == {f"{digest}.png": png}
+    assert client.get(body["image_url"]).content == png
+
+
+def test_upload_without_an_account(client, png):
+    response = client.post("/upload/", files={"file": ("photo.png", png, "image/png")})
+
+    assert response.status_code == 200
+    assert client.get(f"/image-preview/{response.json()['image_uuid']}").status_code == 200
+
+
+def test_upload_ignores_other_form_fields(client, auth_headers, png):
+    response = client.post(
+        "/upload/",
+        data={"description": "ignored"},
+        files={"file": ("photo.png", png, "image/png")},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 200
+
+
+def test_upload_over_the_size_limit_is_rejected(client, auth_headers, png, monkeypatch):
+    monkeypatch.setattr(config, "MAX_UPLOAD_SIZE_MB", len(png) / 2 / 1000**2)
+
+    response = client.post("/upload/", files={"file": ("photo.png", png, "image/png")}, headers=auth_headers)
+
+    assert response.status_code == 400
+    assert "exceeds" in response.json()["detail"]
+    assert stored_files() == {}
+
+
+def test_upload_without_a_file(client, auth_headers, png):
+    response = client.post("/upload/", files={"other": ("photo.png", png, "image/png")}, headers=auth_headers)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "No file provided"
+
+
+def test_upload_needs_a_multipart_body(client, auth_headers, png):
+    response = client.post("/upload/", content=png, headers={**auth_headers, "Content-Type": "image/png"})
+
+    assert response.status_code == 400
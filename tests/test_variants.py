@@ -0,0 +1,136 @@
+import io
+
+import pytest
+from PIL import Image as PILImage
+from sqlalchemy import select
+
+from api.models import ImageContent, ImageVariant
+from api.uploads import iter_chunks
+from api.variants import generate_variants
+from exceptions import UnsupportedImageError
+from imaging import VARIANTS, VariantSpec, parse_variant_specs, render_variant
+from storage import get_storage
+
+pytestmark = pytest.mark.anyio
+
+
+def test_parse_variant_specs():
+    specs = parse_variant_specs(" thumbnail:320:webp, ,large:1280:JPEG,")
+
+    assert specs == [VariantSpec("thumbnail", 320, "webp"), VariantSpec("large", 1280, "jpeg")]
+    assert (specs[1].extension, specs[1].content_type) == (".jpg", "image/jpeg")
+
+
+@pytest.mark.parametrize("value", ["thumbnail:320:gif", "thumbnail:320", "thumbnail:wide:webp"])
+def test_parse_invalid_variant_specs(value):
+    with pytest.raises(ValueError):
+        parse_variant_specs(value)
+
+
+def test_render_variant_downscales(make_image):
+    rendered, width, height = render_variant(make_image(size=(640, 100)), 320, "webp", 80)
+
+    with PILImage.open(io.BytesIO(rendered)) as image:
+        assert (image.format, image.size) == ("WEBP", (320, 50))
+    assert (width, height) == (320, 50)
+
+
+def test_render_variant_never_upscales(make_image):
+    rendered, width, height = render_variant(make_image(size=(100, 50)), 320, "jpeg", 80)
+
+    assert (width, height) == (100, 50)
+    assert rendered.startswith(b"\xff\xd8")
+
+
+def test_render_variant_keeps_transparency():
+    output = io.BytesIO()
+    PILImage.new("RGBA", (20, 20), (0, 0, 0, 0)).save(output, "PNG")
+
+    rendered, _, _ = render_variant(output.getvalue(), 10, "png", 80)
+
+    with PILImage.open(io.BytesIO(rendered)) as image:
+        assert image.mode == "RGBA"
+
+
+def test_render_variant_rejects_what_it_cant_read():
+    with pytest.raises(UnsupportedImageError):
+        render_variant(b"not an image", 320, "webp", 80)
+
+
+def test_variant_is_rendered_on_first_request(client, auth_headers, upload, make_image):
+    image = upload(auth_headers, data=make_image(size=(640, 100)))
+    spec = VARIANTS[0]
+    assert image["variants"][spec.name] == f"/image-variants/{image['image_uuid']}/{spec.name}"
+
+    response = client.get(image["variants"][spec.name], follow_redirects=False)
+
+    assert response.status_code in (302, 307)
+    with PILImage.open(io.BytesIO(client.get(response.headers["location"]).content)) as variant:
+        assert variant.width == min(spec.width, 640)
+        assert variant.format.lower() == spec.format
+    # Served from the stored variant the second time
+    assert client.get(image["variants"][spec.name], follow_redirects=False).headers["location"] == (
+        response.headers["location"]
+    )
+
+
+def test_unknown_variants(client, auth_headers, upload):
+    image = upload(auth_headers)
+
+    assert client.get(f"/image-variants/{image['image_uuid']}/huge").status_code == 404
+
+
+async def test_generate_variants_renders_every_variant(db, make_image):
+    storage = get_storage()
+    data = make_image(size=(64, 64))
+    stored_file = await storage.save(iter_chunks(data), "photo.png", "image/png")
+    content = ImageContent(sha256=stored_file.content_hash, storage_key=stored_file.key, url=stored_file.url, size=1)
+    db.add(content)
+    await db.commit()
+
+    await generate_variants(content.id, stored_file.key, storage)
+
+    names = (await db.execute(select(ImageVariant.name))).scalars().all()
+    assert sorted(names) == sorted(spec.name for spec in VARIANTS)
+
+
+def variant_file(client, image: dict, name: str) -> str:
+    """Render the variant and return its media URL."""
+    return client.get(image["variants"][name], follow_redirects=False).headers["location"]
+
+
+@pytest.mark.parametrize("deleted", ["original", "upload"])
+def test_variants_never_share_files_with_uploads(client, auth_headers, upload, make_image, deleted):
+    original = upload(auth_headers, data=make_image(size=(640, 100)))
+    thumbnail_url = variant_file(client, original, VARIANTS[0].name)
+    assert thumbnail_url.startswith("/media/variants/")
+    # The rendition's exact bytes uploaded as an image of their own
+    uploaded = upload(auth_headers, "thumbnail.webp", data=client.get(thumbnail_url).content)
+
+    kept = uploaded if deleted == "original" else original
+    deleted = original if deleted == "original" else uploaded
+    assert client.delete(f"/images/{deleted['image_uuid']}", headers=auth_headers).status_code == 204
+
+    assert client.get(kept["image_url"]).status_code == 200
+    if kept is original:
+        assert client.get(thumbnail_url).status_code == 200
+
+
+def test_identical_variants_outlive_either_original(client, auth_headers, upload, make_image):
+    # Different files, the same pixels and so the same renditions
+    first = upload(auth_headers, "first.png", data=make_image("PNG", size=(640, 100)))
+    second = upload(auth_headers, "second.bmp", data=make_image("BMP", size=(640, 100)))
+    assert first["image_url"] != second["image_url"]
+    thumbnail_url = variant_file(client, first, VARIANTS[0].name)
+    assert variant_file(client, second, VARIANTS[0].name) == thumbnail_url
+
+    assert client.delete(f"/images/{first['image_uuid']}", headers=auth_headers).status_code == 204
+    assert client.get(thumbnail_url).status_code == 200
+
+    assert client.delete(f"/images/{second['image_uuid']}", headers=auth_headers).status_code == 204
+    assert client.get(thumbnail_url).status_code == 404
+
+
+def test_created_at_defaults_to_naive_utc():
+    # The column is `timestamp without time zone`, asyncpg rejects aware datetimes for it
+    assert ImageVariant.__table__.c.created_at.default.arg(None).tzinfo is None
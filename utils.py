@@ -1,4 +1,5 @@
 import base64
+import datetime
 import hashlib
 import json
 import os
@@ -23,6 +24,47 @@ def convert_bytes_to_mb(file_size):
     return float(file_size / (1000**2))
 
 
+def truncate_filename(filename: str, max_length: int) -> str:
+    """Shorten `filename` to at most `max_length` characters, keeping its extension when there's room for it."""
+    if len(filename) <= max_length:
+        return filename
+    stem, extension = os.path.splitext(filename)
+    if not stem or len(extension) >= max_length // 2:
+        return filename[:max_length]
+    return stem[: max_length - len(extension)] + extension
+
+
+def utcnow() -> datetime.datetime:
+    # Naive UTC, matching the DateTime columns
+    return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+
+
+def to_naive_utc(moment: datetime.datetime) -> datetime.datetime:
+    # Timestamps without an offset are taken as UTC already
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(datetime.UTC).replace(tzinfo=None)
+
+
+ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_database_url(database_url: str) -> str:
+    scheme, separator, rest = database_url.partition("://")
+    if not separator:
+        return database_url
+    async_scheme = ASYNC_DRIVERS.get(scheme, scheme)
+    if async_scheme == "postgresql+asyncpg":
+        # asyncpg takes `ssl` where libpq takes `sslmode`
+        rest = rest.replace("sslmode=", "ssl=")
+    return f"{async_scheme}://{rest}"
+
+
 class EnvParser:
     @staticmethod
     def str(env_var: str, default: str = "") -> str:
@@ -35,6 +77,13 @@ class EnvParser:
         except ValueError:
             raise ValueError(f"Invalid value for {env_var}")
 
+    @staticmethod
+    def float(env_var: str, default: float = 0.0) -> float:
+        try:
+            return float(os.getenv(env_var, default))
+        except ValueError:
+            raise ValueError(f"Invalid value for {env_var}")
+
     @staticmethod
     def bool(env_var: str, default: bool = False) -> bool:
         value = os.getenv(env_var, str(default)).lower()
@@ -61,11 +110,39 @@ class EnvParser:
 ALLOWED_METHODS = {
     "/": ["GET"],
     "/upload/": ["POST"],
+    "/upload/batch/": ["POST"],
+    "/uploads/": ["POST", "HEAD", "PATCH", "DELETE", "OPTIONS"],
+    "/direct-uploads/": ["POST"],
+    "/storage-uploads/": ["PUT"],
+    "/me/usage": ["GET"],
     "/image-preview/": ["GET"],
-    "/images/": ["GET"],
+    "/image-variants/": ["GET"],
+    "/images/": ["GET", "POST", "DELETE"],
+    "/media/": ["GET"],
+    "/metrics": ["GET"],
     "/register/": ["POST"],
     "/login/": ["POST"],
     "/logout/": ["POST"],
     "/docs": ["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
     "/openapi.json": ["GET"],
 }
+
+
+# Token buckets per client (the user's UUID from the JWT, or the IP address for anonymous requests).
+# Each entry is (requests, seconds): up to `requests` at once, refilled at `requests / seconds` per second.
+# Paths are matched by longest prefix, so "/upload/batch/" has its own bucket apart from "/upload/"
+RATE_LIMITS = {
+    "/upload/": {"POST": (30, 60)},
+    "/upload/batch/": {"POST": (5, 60)},
+    "/uploads/": {"POST": (30, 60), "PATCH": (600, 60), "HEAD": (600, 60)},
+    # Presigning and confirming, two requests per file
+    "/direct-uploads/": {"POST": (60, 60)},
+    # The stand-in upload server, when it's mounted at the default DIRECT_UPLOAD_URL
+    "/storage-uploads/": {"PUT": (30, 60)},
+    "/image-preview/": {"GET": (600, 60)},
+    "/image-variants/": {"GET": (1200, 60)},
+    "/images/": {"GET": (120, 60), "POST": (30, 60), "DELETE": (120, 60)},
+    "/register/": {"POST": (5, 60)},
+    "/login/": {"POST": (10, 60)},
+    "/logout/": {"POST": (10, 60)},
+}
@@ -0,0 +1,109 @@
+"""
+Background job worker, run next to the API as a separate process:
+
+    python worker.py [--concurrency N]
+
+Any number of workers can run at once, on one machine or many.
+"""
+
+import argparse
+import asyncio
+import logging
+import signal
+
+import config
+from api.crud.job import claim_jobs, complete_job, fail_job
+from api.crud.usage import reconcile_all_usage
+from api.jobs import JOB_HANDLERS
+from api.models import Job
+from api.retention import sweep_expired_images
+from cache import close_metadata_cache
+from engine import AsyncSessionLocal, async_engine
+from imaging import image_processor
+from scheduler import PeriodicTasks
+from storage import close_storage
+
+logger = logging.getLogger("worker")
+
+
+class Worker:
+    def __init__(self, concurrency: int, poll_interval: float, timeout: float, visibility_timeout: float):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.visibility_timeout = visibility_timeout
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        logger.info("Worker started with %s slots", self.concurrency)
+        await asyncio.gather(*(self._slot() for _ in range(self.concurrency)))
+        logger.info("Worker stopped")
+
+    async def _slot(self):
+        # Every slot claims and runs one job at a time, a stop request lets the current job finish
+        while not self._stopping.is_set():
+            try:
+                async with AsyncSessionLocal() as db:
+                    jobs = await claim_jobs(db, 1, self.visibility_timeout)
+            except Exception:
+                logger.exception("Claiming jobs failed")
+                jobs = []
+            if not jobs:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(jobs[0])
+
+    async def _run(self, job: Job):
+        handler = JOB_HANDLERS.get(job.kind)
+        async with AsyncSessionLocal() as db:
+            if handler is None:
+                await fail_job(job.id, f"Unknown job kind: {job.kind}", db, retry=False)
+                return
+            try:
+                await asyncio.wait_for(handler(**job.payload), self.timeout)
+            except Exception as exc:
+                error = "Timed out" if isinstance(exc, asyncio.TimeoutError) else f"{type(exc).__name__}: {exc}"
+                failed = await fail_job(job.id, error, db)
+                logger.warning("Job %s (%s) attempt %s failed: %s", job.id, job.kind, job.attempts, error)
+                if failed is not None and failed.status == "failed":
+                    logger.error("Job %s (%s) gave up after %s attempts", job.id, job.kind, job.attempts)
+                return
+            await complete_job(job.id, db)
+
+
+async def main(concurrency: int):
+    worker = Worker(
+        concurrency=concurrency,
+        poll_interval=config.JOB_POLL_INTERVAL,
+        timeout=config.JOB_TIMEOUT,
+        visibility_timeout=config.JOB_VISIBILITY_TIMEOUT,
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    # Counters are kept exact by the upload and delete paths, this only repairs drift (crashes, manual edits)
+    periodic_tasks = PeriodicTasks()
+    periodic_tasks.add("usage-reconciler", config.USAGE_RECONCILE_INTERVAL, reconcile_all_usage)
+    periodic_tasks.add("image-retention-sweeper", config.IMAGE_RETENTION_SWEEP_INTERVAL, sweep_expired_images)
+    try:
+        await worker.run()
+    finally:
+        await periodic_tasks.stop()
+        await close_storage()
+        await close_metadata_cache()
+        await async_engine.dispose()
+        image_processor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background jobs")
+    parser.add_argument("--concurrency", type=int, default=config.JOB_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(main(args.concurrency))